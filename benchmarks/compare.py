@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# Compare two benchmarks/pipeline.py result files.
+#
+#   python benchmarks/compare.py before.json after.json [max regression %]
+#
+# Prints the change of every metric per scenario. Exits with 1 when the
+# events per second of a scenario dropped, or its p99 latency grew, by more
+# than the given percentage (default 10), so it can gate CI runs.
+#
+from __future__ import print_function
+
+import json
+import sys
+
+METRICS = (
+    ('events/s', lambda r: r['events_per_s'], 1),
+    ('p50 us', lambda r: r['latency_us']['p50'], -1),
+    ('p99 us', lambda r: r['latency_us']['p99'], -1),
+    ('cpu s', lambda r: r['cpu_s'], -1),
+    ('objects', lambda r: r['gc_objects'], -1),
+    ('blocks', lambda r: r['alloc_blocks'], -1),
+)
+GATED = ('events/s', 'p99 us')
+
+
+def change(before, after):
+    if before is None or after is None or not before:
+        return None
+    return (after - before) * 100.0 / abs(before)
+
+
+def main():
+    if len(sys.argv) < 3:
+        sys.stderr.write('Usage: {} before.json after.json [max regression %]\n'.format(sys.argv[0]))
+        sys.exit(2)
+    with open(sys.argv[1]) as f:
+        before = json.load(f)
+    with open(sys.argv[2]) as f:
+        after = json.load(f)
+    limit = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+
+    print('{} ({}) -> {} ({})'.format(before.get('commit'), before.get('python'),
+                                      after.get('commit'), after.get('python')))
+    regressed = []
+    for name in sorted(set(before['scenarios']) & set(after['scenarios'])):
+        print(name)
+        for label, value, better in METRICS:
+            old = value(before['scenarios'][name])
+            new = value(after['scenarios'][name])
+            delta = change(old, new)
+            if old is None or new is None:
+                continue
+            print('  {:<10} {:>14.3f} {:>14.3f} {:>+8.1f}%'.format(label, old, new, delta or 0.0))
+            if label in GATED and delta is not None and delta * better < -limit:
+                regressed.append('{} {}'.format(name, label))
+    if regressed:
+        print('Regressed by more than {}%: {}'.format(limit, ', '.join(regressed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
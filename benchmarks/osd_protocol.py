@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#
+# Encode/decode throughput of the monitor -> OSD protocols: the old text
+# command line against the binary frame of oneforall/osdproto.py.
+#
+#   python benchmarks/osd_protocol.py [iterations]
+#
+# The text side mirrors what updateOSD used to build and what the OSD's
+# getInput() did with it (split on spaces, dispatch on the first letter).
+#
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from oneforall.osdproto import FrameEncoder, decode
+
+STATE = dict(show=True, voltage=372, battery=80, temp=20, wifi=5, audio=60, joystick=False,
+             bluetooth=True, low_battery=0, info=False, charge=False)
+
+
+def encode_text(show=False, voltage=0, battery=0, temp=0, wifi=0, audio=0, joystick=False,
+                bluetooth=False, low_battery=0, info=False, charge=False):
+    return ("s" + str(int(show)) + " v" + str(voltage) + " b" + str(battery) + " t" + str(temp) + " w" + str(
+        wifi) + " a" + str(audio) + " j" + ("1 " if joystick else "0 ") + " u" + ("1 " if bluetooth else "0 ") +
+        " l" + str(int(low_battery)) + " " + ("on " if info else "off ") +
+        ("charge" if charge else "ncharge") + "\n").encode('ascii')
+
+
+NUMERIC = {'s': 'show', 'v': 'voltage', 'b': 'battery', 't': 'temp', 'w': 'wifi', 'a': 'audio',
+           'j': 'joystick', 'u': 'bluetooth', 'l': 'low_battery'}
+WORDS = {'on': ('info', True), 'off': ('info', False), 'charge': ('charge', True),
+         'ncharge': ('charge', False)}
+
+
+def decode_text(data):
+    values = {}
+    for word in data.decode('ascii').split():
+        if word in WORDS:
+            name, value = WORDS[word]
+            values[name] = value
+        elif word[0] in NUMERIC:
+            values[NUMERIC[word[0]]] = float(word[1:]) if word[0] == 't' else int(word[1:])
+    return values
+
+
+def rate(func, iterations):
+    seconds = min(timeit.repeat(func, number=iterations, repeat=3))
+    return iterations / seconds
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    encoder = FrameEncoder()
+    text = encode_text(**STATE)
+    frame = bytes(encoder.encode(**STATE))
+    assert decode(frame)[1]['voltage'] == decode_text(text)['voltage']
+
+    print("{0:<8} {1:>6} {2:>14} {3:>14}".format('format', 'bytes', 'encode/s', 'decode/s'))
+    print("{0:<8} {1:>6} {2:>14.0f} {3:>14.0f}".format(
+        'text', len(text), rate(lambda: encode_text(**STATE), iterations),
+        rate(lambda: decode_text(text), iterations)))
+    print("{0:<8} {1:>6} {2:>14.0f} {3:>14.0f}".format(
+        'binary', len(frame), rate(lambda: encoder.encode(**STATE), iterations),
+        rate(lambda: decode(frame), iterations)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+#
+# Virtual input backend micro-benchmark.
+#
+#   python benchmarks/output_backends.py [-o results.json] [-n frames] [backend ...]
+#
+# Creates the gamepad on every oneforall.vinput backend (UINPUT, EVDEV, RAW)
+# this machine can open, which takes root or access to /dev/uinput, and
+# pushes the same input frames through the monitor's FrameEmitter: a button
+# toggle and both stick axes per frame. SIM, the simulated device, is the
+# cost of the Python side alone. Stop the front end first, it would see
+# the button presses.
+#
+# Per backend it reports frames and events per second and the latency of
+# one frame write. When the device's /dev/input node can be read it also
+# reports delivery latency, from the write until a reader has the frame's
+# SYN_REPORT. Backends that cannot be opened are listed with the reason.
+# Results use the layout of pipeline.py, so compare.py diffs them as well.
+#
+from __future__ import print_function
+
+import gc
+import json
+import os
+import platform
+import select
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+from oneforall import evcodes as ev
+from oneforall import hal, vinput
+from oneforall.emitter import EV_SYN, INPUT_EVENT, SYN_REPORT, FrameEmitter
+from oneforall.sim import SimInputDevice
+from pipeline import _commit, _cpu, _percentile
+
+BACKENDS = vinput.BACKENDS + ('SIM',)
+VREF = 1600
+EVENTS = [ev.BTN_A, ev.BTN_B, ev.BTN_START, ev.ABS_X + (0, VREF, 0, 0), ev.ABS_Y + (0, VREF, 0, 0)]
+DELIVERY_FRAMES = 2000
+
+
+def _options(argv):
+    options = {'output': None, 'frames': 20000, 'backends': []}
+    args = iter(argv)
+    for arg in args:
+        if arg in ('-o', '--output'):
+            options['output'] = next(args)
+        elif arg in ('-n', '--frames'):
+            options['frames'] = int(next(args))
+        else:
+            if arg.upper() not in BACKENDS:
+                raise SystemExit('Unknown backend {}, pick from {}'.format(arg, ', '.join(BACKENDS)))
+            options['backends'].append(arg.upper())
+    options['backends'] = options['backends'] or list(BACKENDS)
+    return options
+
+
+def _open(backend):
+    if backend == 'SIM':
+        device = SimInputDevice(EVENTS, name='OneForAll-bench')
+        device.keep = False
+        return device, None
+    return hal.open_input_device(EVENTS, 'OneForAll-bench', backend)
+
+
+def _frame(emitter, i):
+    emitter.emit(ev.BTN_A, i & 1)
+    emitter.emit(ev.ABS_X, i % VREF)
+    emitter.emit(ev.ABS_Y, (i * 7) % VREF)
+
+
+def _latencies(samples):
+    samples.sort()
+    return dict((label, _percentile(samples, fraction) * 1e6)
+                for label, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0)))
+
+
+# Read from the device node until a SYN_REPORT comes in
+def _await_syn(fd):
+    while True:
+        if not select.select([fd], [], [], 1.0)[0]:
+            raise IOError('No frame arrived on the device node within 1 s')
+        data = os.read(fd, INPUT_EVENT.size * 64)
+        for offset in range(0, len(data) - INPUT_EVENT.size + 1, INPUT_EVENT.size):
+            sec, usec, event_type, code, value = INPUT_EVENT.unpack_from(data, offset)
+            if event_type == EV_SYN and code == SYN_REPORT:
+                return
+
+
+def _measure(backend, frames):
+    device, fd = _open(backend)
+    clock = time.time if not hasattr(time, 'perf_counter') else time.perf_counter
+    try:
+        node = hal.wait_input_node(fd) if fd is not None else None
+        emitter = FrameEmitter(device, fd)
+        writes = []
+        gc.collect()
+        objects = len(gc.get_objects())
+        cpu = _cpu()
+        start = clock()
+        for i in range(frames):
+            _frame(emitter, i)
+            t = clock()
+            emitter.flush()
+            writes.append(clock() - t)
+        seconds = clock() - start
+        cpu = _cpu() - cpu
+        gc.collect()
+        objects = len(gc.get_objects()) - objects
+
+        # Delivery is timed on its own, a reader slows the writes down
+        delivery = None
+        if node is not None:
+            try:
+                reader = os.open(node, os.O_RDONLY | os.O_NONBLOCK)
+            except OSError:
+                reader = None
+            if reader is not None:
+                delivery = []
+                try:
+                    for i in range(min(frames, DELIVERY_FRAMES)):
+                        _frame(emitter, i + 1)
+                        t = clock()
+                        emitter.flush()
+                        _await_syn(reader)
+                        delivery.append(clock() - t)
+                finally:
+                    os.close(reader)
+    finally:
+        device.close()
+    return {
+        'events': emitter.events,
+        'frames': frames,
+        'seconds': seconds,
+        'events_per_s': frames * 3 / seconds if seconds else 0.0,
+        'frames_per_s': frames / seconds if seconds else 0.0,
+        'latency_us': _latencies(writes),
+        'delivery_us': _latencies(delivery) if delivery else None,
+        'cpu_s': cpu,
+        'gc_objects': objects,
+        'alloc_blocks': None,
+        'alloc_peak_bytes': None,
+        'node': node,
+    }
+
+
+def main():
+    options = _options(sys.argv[1:])
+    results = {}
+    unavailable = {}
+    for backend in options['backends']:
+        try:
+            results[backend] = _measure(backend, options['frames'])
+        except Exception as e:
+            unavailable[backend] = '{}: {}'.format(type(e).__name__, e)
+            sys.stderr.write('{:<6} unavailable ({})\n'.format(backend, unavailable[backend]))
+            continue
+        result = results[backend]
+        delivery = result['delivery_us']
+        sys.stderr.write('{:<6} {:>10.0f} frames/s  write p50 {:>7.1f} us  p99 {:>7.1f} us  '
+                         'delivery {}\n'.format(
+                             backend, result['frames_per_s'], result['latency_us']['p50'],
+                             result['latency_us']['p99'],
+                             'p50 {:.1f} us  p99 {:.1f} us'.format(delivery['p50'], delivery['p99'])
+                             if delivery else 'n/a'))
+    report = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'kernel': platform.release(),
+        'frames': options['frames'],
+        'scenarios': results,
+        'unavailable': unavailable,
+    }
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if options['output']:
+        with open(options['output'], 'w') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+#
+# Input and status pipeline benchmarks on the simulated monitor.
+#
+#   python benchmarks/pipeline.py [-o results.json] [-n events] [-s seed] [scenario ...]
+#
+# Re-runs itself as the script of 'monitor_evdev.py --simulate' (see
+# oneforall/sim.py), so every scenario calls the monitor's own functions:
+#
+#   buttons   press/release storm over all BUTTONS through inputEdges()
+#   hotkeys   HOTKEY chords (volume, Wi-Fi, Bluetooth) through inputEdges()
+#   joystick  continuous stick motion through checkJoystickInput()
+#   battery   voltage sweeps through readVoltage() and checkShdn()
+#   osd       high rate updateOSD() traffic, a quarter of it unchanged
+#
+# The load comes from a seeded generator and synthetic edge timestamps, so it
+# is the same on every run. Per scenario it reports events per second,
+# per event latency percentiles, CPU time and allocations (net new gc
+# tracked objects, and traced blocks/peak bytes where tracemalloc exists).
+# A table goes to stderr, JSON to -o (or stdout); benchmarks/compare.py
+# diffs two JSON files.
+#
+from __future__ import print_function
+
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ('buttons', 'hotkeys', 'joystick', 'battery', 'osd')
+
+
+def _options(argv):
+    options = {'output': None, 'events': 20000, 'seed': 1, 'scenarios': []}
+    args = iter(argv)
+    for arg in args:
+        if arg in ('-o', '--output'):
+            options['output'] = next(args)
+        elif arg in ('-n', '--events'):
+            options['events'] = int(next(args))
+        elif arg in ('-s', '--seed'):
+            options['seed'] = int(next(args))
+        else:
+            if arg not in SCENARIOS:
+                raise SystemExit('Unknown scenario {}, pick from {}'.format(arg, ', '.join(SCENARIOS)))
+            options['scenarios'].append(arg)
+    options['scenarios'] = options['scenarios'] or list(SCENARIOS)
+    return options
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _cpu():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def _measure(build):
+    # build() returns the load, a list of callables one per event. It is
+    # timed first, then built and run again under tracemalloc when the
+    # interpreter has it.
+    steps = build()
+    latencies = []
+    clock = time.time if not hasattr(time, 'perf_counter') else time.perf_counter
+    gc.collect()
+    objects = len(gc.get_objects())
+    cpu = _cpu()
+    start = clock()
+    for step in steps:
+        t = clock()
+        step()
+        latencies.append(clock() - t)
+    seconds = clock() - start
+    cpu = _cpu() - cpu
+    gc.collect()
+    objects = len(gc.get_objects()) - objects
+    latencies.sort()
+    result = {
+        'events': len(steps),
+        'seconds': seconds,
+        'events_per_s': len(steps) / seconds if seconds else 0.0,
+        'latency_us': dict((label, _percentile(latencies, fraction) * 1e6)
+                           for label, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))),
+        'cpu_s': cpu,
+        'gc_objects': objects,
+        'alloc_blocks': None,
+        'alloc_peak_bytes': None,
+    }
+    try:
+        import tracemalloc
+    except ImportError:
+        return result
+    steps = build()
+    tracemalloc.start()
+    for step in steps:
+        step()
+    snapshot = tracemalloc.take_snapshot()
+    result['alloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+    result['alloc_blocks'] = sum(stat.count for stat in snapshot.statistics('filename'))
+    tracemalloc.stop()
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                       stderr=open(os.devnull, 'w')).decode('ascii').strip()
+    except Exception:
+        return None
+
+
+# Everything below runs inside the simulated monitor, in its namespace
+def _benchmark(options):
+    global joystick
+
+    count = options['events']
+    Edge = hal.Edge
+    # Synthetic edge timestamps 5 ms apart. The debouncer runs on them, so
+    # its windows pass at the same point of every run however fast it goes.
+    step_ns = 5000000
+    clock = [monotonic_ns()]
+
+    def edge(pin, level):
+        clock[0] += step_ns
+        return Edge(pin, level, clock[0])
+
+    def buttons(rng):
+        steps = []
+        held = set()
+        for i in range(count):
+            batch = []
+            for j in range(rng.randint(1, 3)):
+                pin = rng.choice(BUTTONS)
+                batch.append(edge(pin, 1 if pin in held else 0))
+                held.symmetric_difference_update([pin])
+            steps.append(lambda batch=batch: inputEdges(batch))
+        for pin in held:
+            steps.append(lambda pin=pin: inputEdges([edge(pin, 1)]))
+        return steps
+
+    def hotkeys(rng):
+        steps = []
+        chords = [pin for pin in (UP, DOWN, LEFT, BUTTON_A) if pin != -1]
+
+        def chord(pin):
+            inputEdges([edge(HOTKEY, 0)])
+            inputEdges([edge(pin, 0)])
+            inputEdges([edge(pin, 1)])
+            inputEdges([edge(HOTKEY, 1)])
+
+        # Wi-Fi and Bluetooth toggles go through rfkill and the state files,
+        # keep them to a few per hundred chords like a real session
+        for i in range(count // 4):
+            pin = rng.choice(chords) if rng.random() < 0.05 else rng.choice(chords[:2])
+            steps.append(lambda pin=pin: chord(pin))
+        return steps
+
+    def joystick_motion(rng):
+        import math
+
+        center = VREF / 2
+        steps = []
+        timestamp = monotonic_ns()
+        for i in range(count):
+            timestamp += 4000000
+            x = int(center + center * 0.9 * math.sin(i / 50.0))
+            y = int(center + center * 0.9 * math.cos(i / 35.0))
+            values = [x + rng.randint(-4, 4), y + rng.randint(-4, 4)]
+            steps.append(lambda timestamp=timestamp, values=values: checkJoystickInput(timestamp, values))
+        return steps
+
+    def battery(rng):
+        # Full down to just above BATT_SHUTDOWN_VOLT and back, ADC counts
+        top = batt_full / 100.0
+        bottom = (batt_shdn + 3) / 100.0
+        steps = []
+
+        def sample(volts):
+            global lowbattery
+            ads1015.set_volts(0, volts)
+            checkShdn(readVoltage(), 1.0)
+            lowbattery = 0
+
+        for i in range(count // batt_samples):
+            phase = (i % 200) / 100.0
+            volts = top - (top - bottom) * (phase if phase <= 1 else 2 - phase)
+            steps.append(lambda volts=volts: sample(volts))
+        return steps
+
+    def osd_traffic(rng):
+        steps = []
+        for i in range(count):
+            if rng.random() < 0.25 and steps:
+                steps.append(steps[-1])
+                continue
+            args = (rng.randint(330, 372), rng.randint(0, 100), 20, rng.randint(0, 5), rng.randint(0, 10) * 10,
+                    0, rng.random() < 0.1, False, rng.random() < 0.5)
+            steps.append(lambda args=args: updateOSD(*args))
+        return steps
+
+    builders = {'buttons': buttons, 'hotkeys': hotkeys, 'joystick': joystick_motion, 'battery': battery,
+                'osd': osd_traffic}
+    device.keep = False
+    joystick = True
+    results = {}
+    # The monitor prints as it works, keep that out of the results
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    for name in options['scenarios']:
+        results[name] = _measure(lambda: builders[name](random.Random(options['seed'])))
+        sys.stderr.write('{:<9} {:>8} events {:>11.0f}/s  p50 {:>8.1f} us  p99 {:>8.1f} us  '
+                         'cpu {:>6.3f} s  objects {:>+6}\n'.format(
+                             name, results[name]['events'], results[name]['events_per_s'],
+                             results[name]['latency_us']['p50'], results[name]['latency_us']['p99'],
+                             results[name]['cpu_s'], results[name]['gc_objects']))
+    report = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': options['seed'],
+        'events': options['events'],
+        'scenarios': results,
+    }
+    sys.stdout = stdout
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if options['output']:
+        with open(options['output'], 'w') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+    loop.call_soon(loop.stop)
+
+
+if 'SIMULATE' in globals():
+    _benchmark(_options(sys.argv[sys.argv.index(SIM_SCRIPT) + 1:]))
+elif __name__ == '__main__':
+    monitor = os.path.join(BENCH_DIR, '..', 'monitor_evdev.py')
+    sys.exit(subprocess.call([sys.executable, monitor, '--simulate', os.path.abspath(__file__)] + sys.argv[1:]))
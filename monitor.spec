@@ -3,7 +3,7 @@
 block_cipher = None
 
 
-a = Analysis(['monitor.py'],
+a = Analysis(['monitor_evdev.py'],
              pathex=['/home/pi/Retropie-open-OSD'],
              binaries=[],
              datas=[],
@@ -19,22 +19,38 @@
 # You should have received a copy of the GNU General Public License
 # along with this repo. If not, see <http://www.gnu.org/licenses/>.
 #
-import Adafruit_ADS1x15
-import RPi.GPIO as gpio
 import configparser
+import hashlib
 import logging
 import logging.handlers
 import os
-import re
 import signal
 import sys
-import thread as thread
 import time
-import uinput
+from oneforall import evcodes as ev
+from oneforall import hal
+from oneforall.actions import ActionQueue
+from oneforall.adcsampler import ADCSampler
+from oneforall.battery import VoltageEstimator
+from oneforall.combos import ChordEngine, parse_combo
+from oneforall.debounce import Debouncer
+from oneforall.emitter import FrameEmitter
+from oneforall.idle import IdleMode
+from oneforall.latency import LatencyStats
+from oneforall.mixer import FakeMixer, VolumeControl, open_mixer
+from oneforall.rfkill import RfkillControl, RFKILL_TYPE_BLUETOOTH, RFKILL_TYPE_WLAN
+from oneforall.monoclock import monotonic_ns
+from oneforall.osdproto import FrameEncoder, StateTracker, F_ALL, F_RENDERED
+from oneforall.osdshm import SharedState
+from oneforall.reactor import Reactor
+from oneforall.scheduler import PollScheduler, Sensor, Backoff, Approach
+from oneforall.startup import Startup
+from oneforall.stick import AxisProcessor
+from oneforall.trace import (TraceRecorder, RecordedReads, RecordingADC, RecordingPins, read_trace, KIND_EDGE,
+                             KIND_READ)
+from oneforall.wireless import WirelessStatus
 # from evdev import uinput, UInput, AbsInfo, categorize, ecodes as e
-from subprocess import Popen, PIPE, check_output, check_call
-from threading import Event
-from threading import Timer
+from threading import active_count
 
 # Batt variables
 voltscale = 118.0  # ADJUST THIS
@@ -64,6 +80,7 @@ wifi_3bar = 5
 
 bin_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
 osd_path = bin_dir + '/osd/osd'
+state_path = osd_path  # prefix of the wifi/bluetooth state files
 rfkill_path = 'rfkill'
 
 # Configure buttons
@@ -85,8 +102,6 @@ SELECT = int(keys['SELECT'])
 START = int(keys['START'])
 HOTKEY = int(keys['HOTKEY'])
 QUICKSAVE = int(keys['QUICKSAVE'])
-QUICKLOAD = 99  # Probably not the cleanest way to do this, but we're pretending like quickload is GPIO pin 99
-ESCAPE = 99
 
 if config.has_option("GENERAL", "DEBUG"):
     logging.basicConfig(filename=bin_dir + '/osd.log', level=logging.DEBUG,
@@ -95,6 +110,66 @@ if config.has_option("GENERAL", "DEBUG"):
 
 SHUTDOWN = int(general['SHUTDOWN_DETECT'])
 LID_SENSOR = int(general['LID_SENSOR'])
+# Buttons, battery and status only: no hotkey combos, no joystick sampling
+RUN_MINIMAL = general.get('MINIMAL', 'False')
+
+
+# Value following a command line flag, or None
+def argValue(flag):
+    if flag not in sys.argv[:-1]:
+        return None
+    value = sys.argv[sys.argv.index(flag) + 1]
+    return None if value.startswith('--') else value
+
+
+# --simulate [script.py] runs on the simulated hardware in oneforall.sim,
+# --replay trace [--fast] feeds it a recorded trace (see oneforall.trace)
+REPLAY = argValue('--replay')
+REPLAY_FAST = '--fast' in sys.argv
+SIMULATE = '--simulate' in sys.argv or REPLAY is not None
+SIM_SCRIPT = argValue('--simulate')
+if SIMULATE:
+    import tempfile
+    from oneforall import sim
+
+    state_path = tempfile.mkdtemp(prefix='oneforall-sim') + '/osd'
+
+# GPIO backend: RPI (RPi.GPIO callbacks) or CDEV (/dev/gpiochipN bulk line request)
+GPIO_BACKEND = general.get('GPIO_BACKEND', 'RPI').upper()
+# Virtual pad backend, see oneforall/vinput.py; --output overrides keys.cfg
+OUTPUT_BACKEND = (argValue('--output') or general.get('OUTPUT_BACKEND', 'UINPUT')).upper()
+GPIO_CHIP = general.get('GPIO_CHIP', 'gpiochip0')
+
+# Latency histograms, dumped to LATENCY_FILE on SIGUSR2 and every
+# LATENCY_INTERVAL seconds (0 disables the periodic dump)
+statsConfig = config['STATS'] if config.has_section('STATS') else {}
+LATENCY_FILE = statsConfig.get('LATENCY_FILE', '/tmp/oneforall-latency.txt')
+LATENCY_INTERVAL = float(statsConfig.get('LATENCY_INTERVAL', 0))
+TRACE_FILE = statsConfig.get('TRACE_FILE', '')  # GPIO edge and ADC sample trace, empty disables
+
+# Audio mixer
+audioConfig = config['AUDIO'] if config.has_section('AUDIO') else {}
+MIXER_CONTROL = audioConfig.get('MIXER', 'PCM')
+MIXER_CARD = int(audioConfig.get('CARD', 0))
+
+# Wi-Fi signal, cached for WIFI_CACHE_TTL seconds
+wifiConfig = config['WIFI'] if config.has_section('WIFI') else {}
+WIFI_INTERFACES = [iface.strip() for iface in wifiConfig.get('INTERFACES', 'wlan0').split(',')]
+WIFI_CACHE_TTL = float(wifiConfig.get('CACHE_TTL', 5))
+WIFI_POLL_MIN = float(wifiConfig.get('POLL_MIN', 5))  # Signal poll interval while it changes (s)
+WIFI_POLL_MAX = float(wifiConfig.get('POLL_MAX', 60))  # ... and once it has been steady (s)
+
+# Bluetooth state poll, slowing down while it does not change
+btConfig = config['BLUETOOTH'] if config.has_section('BLUETOOTH') else {}
+BT_POLL_MIN = float(btConfig.get('POLL_MIN', 10))
+BT_POLL_MAX = float(btConfig.get('POLL_MAX', 120))
+
+# OSD transport: PIPE sends every update down the OSD's stdin, SHM publishes
+# it in a shared memory block and only wakes the OSD for visible changes
+osdConfig = config['OSD'] if config.has_section('OSD') else {}
+OSD_TRANSPORT = osdConfig.get('TRANSPORT', 'PIPE').upper()
+OSD_SHM_PATH = osdConfig.get('SHM_PATH', '/dev/shm/oneforall-osd')
+OSD_READY_TIMEOUT = float(osdConfig.get('READY_TIMEOUT', 5))  # Seconds to wait for the OSD to come up
 
 # Joystick Hardware settings
 joystickConfig = config['JOYSTICK']
@@ -102,6 +177,15 @@ DZONE = int(joystickConfig['DEADZONE'])  # dead zone applied to joystick (mV)
 VREF = int(joystickConfig['VCC'])  # joystick Vcc (mV)
 JOYSTICK_DISABLED = joystickConfig['DISABLED']
 ON_BY_DEFAULT = joystickConfig['ON_BY_DEFAULT']
+JOYSTICK_SAMPLE_RATE = int(joystickConfig.get('SAMPLE_RATE', 250))  # X/Y pairs per second
+JOYSTICK_DATA_RATE = int(joystickConfig.get('DATA_RATE', 3300))  # ADS1015 samples per second
+JOYSTICK_CURVE = float(joystickConfig.get('CURVE', 1.0))  # Response exponent, 1 is linear
+JOYSTICK_MIN_CUTOFF = float(joystickConfig.get('FILTER_MIN_CUTOFF', 1.0))  # One-Euro cutoff at rest (Hz)
+JOYSTICK_BETA = float(joystickConfig.get('FILTER_BETA', 0.007))  # One-Euro speed coefficient
+JOYSTICK_IDLE_RATE = float(joystickConfig.get('IDLE_SAMPLE_RATE', 30))  # Slowest rate while the stick rests
+JOYSTICK_IDLE_AFTER = float(joystickConfig.get('IDLE_AFTER', 1))  # Seconds at rest per halving of the rate
+JOYSTICK_X_CHANNEL = 1
+JOYSTICK_Y_CHANNEL = 2
 
 # Battery config
 battery = config['BATTERY']
@@ -109,67 +193,164 @@ monitoring_enabled = battery['ENABLED']
 batt_full = int(battery['FULL_BATT_VOLTAGE'])
 batt_low = int(battery['BATT_LOW_VOLTAGE'])
 batt_shdn = int(battery['BATT_SHUTDOWN_VOLT'])
+batt_samples = int(battery.get('SAMPLES_PER_READ', 3))  # ADC reads fed to the estimator per update
+batt_confidence = float(battery.get('MIN_CONFIDENCE', 0.5))  # Needed before warning or shutting down
+batt_poll_min = float(battery.get('POLL_MIN', 2))  # Poll interval at BATT_LOW_VOLTAGE or when unsettled (s)
+batt_poll_max = float(battery.get('POLL_MAX', 30))  # Poll interval POLL_SPAN or more above it (s)
+batt_poll_span = int(battery.get('POLL_SPAN', 20))
+
+# Idle mode, entered after IDLE_AFTER seconds without input (0 disables)
+powerConfig = config['POWER'] if config.has_section('POWER') else {}
+IDLE_AFTER = float(powerConfig.get('IDLE_AFTER', 60))
+IDLE_JOYSTICK_RATE = float(powerConfig.get('IDLE_JOYSTICK_RATE', 2))  # X/Y pairs per second while idle
+IDLE_BATTERY_INTERVAL = float(powerConfig.get('IDLE_BATTERY_INTERVAL', 60))  # Seconds between battery polls
+IDLE_STATUS_INTERVAL = float(powerConfig.get('IDLE_STATUS_INTERVAL', 60))  # Seconds between status passes
+STATUS_INTERVAL = 10
+
+# Slow side effects (rfkill and systemctl commands, amixer, the lid and
+# shutdown steps) run on a queue of worker threads, never on the loop
+actionsConfig = config['ACTIONS'] if config.has_section('ACTIONS') else {}
+ACTION_QUEUE_SIZE = int(actionsConfig.get('QUEUE_SIZE', 16))  # Most actions waiting at once
+ACTION_WORKERS = int(actionsConfig.get('WORKERS', 2))
+ACTION_SLOW_MS = int(actionsConfig.get('SLOW_MS', 500))  # Actions running longer are logged
 
 BUTTONS = [LEFT, RIGHT, DOWN, UP, BUTTON_A, BUTTON_B,
            BUTTON_X, BUTTON_Y, BUTTON_L1, BUTTON_R1, SELECT, START, QUICKSAVE]
 
-HOTKEYS = [LEFT, RIGHT, DOWN, UP, BUTTON_A, START, QUICKSAVE]
-
 BOUNCE_TIME = 0.03  # Debounce time in seconds
+FRAME_WINDOW_US = int(general.get('FRAME_WINDOW_US', 0))  # Extra time to gather an input frame
+
+# Per pin debounce: "<KEY> = <microseconds>[, high|low][, stable]" in [DEBOUNCE],
+# DEFAULT_US applies to everything else. Inputs are active low by default.
+debounceConfig = config['DEBOUNCE'] if config.has_section('DEBOUNCE') else {}
+DEBOUNCE_US = int(debounceConfig.get('DEFAULT_US', int(BOUNCE_TIME * 1000000)))
+
+# Every input line, requested in one go by the CDEV backend
+INPUT_PINS = BUTTONS + [pin for pin in (HOTKEY, SHUTDOWN, LID_SENSOR) if pin != -1 and pin not in BUTTONS]
+
+# Every handler, timer and event source runs on this one loop
+loop = Reactor()
+sensors = PollScheduler(loop)
+startup = Startup(loop)
+actions = ActionQueue(loop, ACTION_QUEUE_SIZE, ACTION_WORKERS, ACTION_SLOW_MS)
 
 # GPIO Init
-gpio.setwarnings(False)
-gpio.setmode(gpio.BCM)
-gpio.setup(BUTTONS, gpio.IN, pull_up_down=gpio.PUD_UP)
+if SIMULATE:
+    pins = sim.SimPins(INPUT_PINS)
+elif GPIO_BACKEND == 'CDEV':
+    pins = hal.CdevPins(GPIO_CHIP, INPUT_PINS, consumer='OneForAll')
+else:
+    pins = hal.RpiPins(INPUT_PINS, bouncetime={LID_SENSOR: 5})
 
-if not SHUTDOWN == -1:
-    gpio.setup(SHUTDOWN, gpio.IN, pull_up_down=gpio.PUD_UP)
+recorder = None
+if TRACE_FILE and REPLAY is None:
+    recorder = TraceRecorder(TRACE_FILE)
+    pins = RecordingPins(pins, recorder)
+    loop.call_every(1, recorder.flush)
+startup.phase('gpio')
+
+
+# Current level of an input pin. Backends that see every edge track levels
+# from the edge stream, so this never touches the hardware there.
+def readPin(pin):
+    return pins.read(pin)
 
-if not LID_SENSOR == -1:
-    gpio.setup(LID_SENSOR, gpio.IN, pull_up_down=gpio.PUD_UP)
 
-if not HOTKEY in BUTTONS:
-    if HOTKEY != -1:
-        gpio.setup(HOTKEY, gpio.IN, pull_up_down=gpio.PUD_UP)
+debouncer = Debouncer()
+PIN_NAMES = dict([(pin, name) for name, pin in keys.items()] +
+                 [(SHUTDOWN, 'SHUTDOWN_DETECT'), (LID_SENSOR, 'LID_SENSOR')])
+for pin in INPUT_PINS:
+    setting = debounceConfig.get(PIN_NAMES.get(pin, '').upper(), '').split(',')
+    debounce_us = int(setting[0]) if setting[0].strip() else DEBOUNCE_US
+    options = [option.strip().lower() for option in setting[1:]]
+    # Shutdown and lid only ever act on a level that has held for the window
+    stable = 'stable' in options or pin in (SHUTDOWN, LID_SENSOR)
+    debouncer.add_pin(pin, debounce_us, 'high' not in options, readPin(pin), stable)
+
 
 if JOYSTICK_DISABLED == 'False':
     KEYS = {  # EDIT KEYCODES IN THIS TABLE TO YOUR PREFERENCES:
         # See /usr/include/linux/input.h for keycode names
-        BUTTON_A: uinput.BTN_A,  # 'A' button
-        BUTTON_B: uinput.BTN_B,  # 'B' button
-        BUTTON_X: uinput.BTN_X,  # 'X' button
-        BUTTON_Y: uinput.BTN_Y,  # 'Y' button
-        BUTTON_L1: uinput.BTN_TL,  # 'L1' button
-        BUTTON_R1: uinput.BTN_TR,  # 'R1' button
-        SELECT: uinput.BTN_SELECT,  # 'Select' button
-        START: uinput.BTN_START,  # 'Start' button
-        UP: uinput.BTN_DPAD_UP,  # Analog up
-        DOWN: uinput.BTN_DPAD_DOWN,  # Analog down
-        LEFT: uinput.BTN_DPAD_LEFT,  # Analog left
-        RIGHT: uinput.BTN_DPAD_RIGHT,  # Analog right
-        10001: uinput.ABS_X + (0, VREF, 0, 0),
-        10002: uinput.ABS_Y + (0, VREF, 0, 0),
+        BUTTON_A: ev.BTN_A,  # 'A' button
+        BUTTON_B: ev.BTN_B,  # 'B' button
+        BUTTON_X: ev.BTN_X,  # 'X' button
+        BUTTON_Y: ev.BTN_Y,  # 'Y' button
+        BUTTON_L1: ev.BTN_TL,  # 'L1' button
+        BUTTON_R1: ev.BTN_TR,  # 'R1' button
+        SELECT: ev.BTN_SELECT,  # 'Select' button
+        START: ev.BTN_START,  # 'Start' button
+        UP: ev.BTN_DPAD_UP,  # Analog up
+        DOWN: ev.BTN_DPAD_DOWN,  # Analog down
+        LEFT: ev.BTN_DPAD_LEFT,  # Analog left
+        RIGHT: ev.BTN_DPAD_RIGHT,  # Analog right
+        10001: ev.ABS_X + (0, VREF, 0, 0),
+        10002: ev.ABS_Y + (0, VREF, 0, 0),
     }
 else:
     KEYS = {  # EDIT KEYCODES IN THIS TABLE TO YOUR PREFERENCES:
         # See /usr/include/linux/input.h for keycode names
-        BUTTON_A: uinput.KEY_LEFTCTRL,  # 'A' button
-        BUTTON_B: uinput.KEY_LEFTALT,  # 'B' button
-        BUTTON_X: uinput.KEY_Z,  # 'X' button
-        BUTTON_Y: uinput.KEY_X,  # 'Y' button
-        BUTTON_L1: uinput.KEY_G,  # 'L1' button
-        BUTTON_R1: uinput.KEY_H,  # 'R1' button
-        SELECT: uinput.KEY_SPACE,  # 'Select' button
-        START: uinput.KEY_ENTER,  # 'Start' button
-        UP: uinput.KEY_UP,  # Analog up
-        DOWN: uinput.KEY_DOWN,  # Analog down
-        LEFT: uinput.KEY_LEFT,  # Analog left
-        RIGHT: uinput.KEY_RIGHT,  # Analog right
-        QUICKSAVE: uinput.KEY_F2,  # Quick save key
-        QUICKLOAD: uinput.KEY_F4,  # Quick load key
-        ESCAPE: uinput.KEY_ESC  # dang
+        BUTTON_A: ev.KEY_LEFTCTRL,  # 'A' button
+        BUTTON_B: ev.KEY_LEFTALT,  # 'B' button
+        BUTTON_X: ev.KEY_Z,  # 'X' button
+        BUTTON_Y: ev.KEY_X,  # 'Y' button
+        BUTTON_L1: ev.KEY_G,  # 'L1' button
+        BUTTON_R1: ev.KEY_H,  # 'R1' button
+        SELECT: ev.KEY_SPACE,  # 'Select' button
+        START: ev.KEY_ENTER,  # 'Start' button
+        UP: ev.KEY_UP,  # Analog up
+        DOWN: ev.KEY_DOWN,  # Analog down
+        LEFT: ev.KEY_LEFT,  # Analog left
+        RIGHT: ev.KEY_RIGHT,  # Analog right
+        QUICKSAVE: ev.KEY_F2,  # Quick save key
     }
 
+# Hotkeys and other button chords, see oneforall/combos.py for the syntax.
+# These apply when keys.cfg has no [COMBOS] section.
+DEFAULT_COMBOS = [
+    ('VOLUME_UP', 'HOTKEY+UP -> volume_up'),
+    ('VOLUME_DOWN', 'HOTKEY+DOWN -> volume_down'),
+    ('WIFI', 'HOTKEY+LEFT -> wifi'),
+    ('BLUETOOTH', 'HOTKEY+BUTTON_A -> bluetooth'),
+    ('ESCAPE', 'HOTKEY+START -> key KEY_ESC 0.5'),  # for when Start+Select just doesn't cut it
+    ('QUICKSAVE', 'QUICKSAVE -> key SELECT+KEY_F2'),
+    ('QUICKLOAD', 'HOTKEY+QUICKSAVE -> key SELECT+KEY_F4'),
+]
+PIN_BY_NAME = dict((name.upper(), int(value)) for name, value in keys.items())
+
+
+# Input events for "A+B" in a key action: a button name stands for its key
+# in KEYS, anything else is a KEY_ or BTN_ name such as KEY_ESC
+def comboKeys(spec):
+    events = []
+    for name in spec.upper().split('+'):
+        if PIN_BY_NAME.get(name) in KEYS:
+            events.append(KEYS[PIN_BY_NAME[name]])
+        elif ev.key_event(name) is not None:
+            events.append(ev.key_event(name))
+        else:
+            raise ValueError("unknown key " + name)
+    return events
+
+
+# Combos from keys.cfg, a line that does not parse is logged and left out.
+# The pad also declares every key a combo sends, and rumble as a gamepad.
+COMBOS = []
+DEVICE_EVENTS = list(KEYS.values())
+if JOYSTICK_DISABLED == 'False':
+    DEVICE_EVENTS.append(ev.FF_RUMBLE)
+COMBO_LINES = config.items('COMBOS') if config.has_section('COMBOS') else DEFAULT_COMBOS
+if RUN_MINIMAL == 'True':
+    COMBO_LINES = []
+for name, text in COMBO_LINES:
+    try:
+        combo = parse_combo(name.upper(), text, PIN_BY_NAME)
+        if combo.action == 'key' and combo.args:
+            DEVICE_EVENTS += [key for key in comboKeys(combo.args[0]) if key not in DEVICE_EVENTS]
+    except ValueError as e:
+        logging.error("Ignoring [COMBOS] {} = {}: {}".format(name.upper(), text, e))
+        continue
+    COMBOS.append(combo)
+
 # Global Variables
 
 global brightness
@@ -188,177 +369,331 @@ info = False
 volt = 410
 volume = 1
 wifi = 2
+bluetooth = False
 charge = 0
 bat = 0
-last_bat_read = 450
+voltEstimator = VoltageEstimator()
+voltConfidence = 0.0
 joystick = False
 showOverlay = False
 lowbattery = 0
-overrideCounter = Event()
+updatePending = False
+lastEdgeNs = 0
+wifiStatus = WirelessStatus(WIFI_INTERFACES, WIFI_CACHE_TTL)
+latency = LatencyStats()
+edgeTimes = {}
 
-if ON_BY_DEFAULT == 'True':
+if ON_BY_DEFAULT == 'True' and RUN_MINIMAL == 'False':
     joystick = True
 
 # TO DO REPLACE A LOT OF OLD CALLS WITH THE CHECK_OUTPUT
-if monitoring_enabled == 'True':
-    adc = Adafruit_ADS1x15.ADS1015()
+if SIMULATE:
+    # A charged battery and a centered stick until a script says otherwise
+    ads1015 = sim.SimADC()
+    ads1015.set_volts(0, 3.7)
+    ads1015.set(JOYSTICK_X_CHANNEL, VREF / 2)
+    ads1015.set(JOYSTICK_Y_CHANNEL, VREF / 2)
+elif monitoring_enabled == 'True' or JOYSTICK_DISABLED == 'False':
+    ads1015 = hal.open_adc()
 else:
-    adc = False
+    ads1015 = None
+if recorder is not None and ads1015 is not None:
+    ads1015 = RecordingADC(ads1015, recorder)
+adc = ads1015 if monitoring_enabled == 'True' else False
+joystickSampler = None
+startup.phase('adc')
+
+
+# Edge to emit latency for the pins whose changes just went out in a frame
+def recordEmitLatency(pins):
+    now = loop.now()
+    for pin in pins:
+        latency.record(PIN_NAMES.get(pin, str(pin)), edgeTimes[pin], now)
+
 
 # Create virtual HID for Joystick
-if JOYSTICK_DISABLED == 'False':
-    device = uinput.Device(KEYS.values(), name="OneForAll-GP", version=0x3)
+DEVICE_NAME = "OneForAll-GP" if JOYSTICK_DISABLED == 'False' else "mintyPad"
+if SIMULATE:
+    device, uinput_fd = sim.SimInputDevice(DEVICE_EVENTS, name=DEVICE_NAME), None
 else:
-    device = uinput.Device(KEYS.values(), name="mintyPad", version=0x3)
+    device, uinput_fd = hal.open_input_device(DEVICE_EVENTS, DEVICE_NAME, OUTPUT_BACKEND)
+    # Usable as soon as udev made the node, no need to wait any longer
+    node = hal.wait_input_node(uinput_fd)
+    if node is None:
+        logging.warning("No /dev/input node for " + DEVICE_NAME + " yet, carrying on")
+    # Rumble effect uploads wait for an answer from the pad's owner
+    if hasattr(device, 'handle_ff') and ev.FF_RUMBLE in DEVICE_EVENTS:
+        loop.add_reader(uinput_fd, device.handle_ff)
+startup.phase('input device')
+emitter = FrameEmitter(device, uinput_fd, FRAME_WINDOW_US, recordEmitLatency, clock=loop.now)
 
-time.sleep(1)
+shell = sim.SimShell() if SIMULATE else hal.Shell()
 
 
-def hotkeyAction(key):
-    if not gpio.input(HOTKEY):
-        if key in HOTKEYS:
-            return True
-
-    return False
+def dumpLatency(signum=None, frame=None):
+    try:
+        latency.dump(LATENCY_FILE)
+    except Exception:
+        logging.exception("Failed to write latency stats")
 
 
-def handle_button(pin):
+def handle_button(pin, state):
     global showOverlay
-    time.sleep(BOUNCE_TIME)
-    state = 0 if gpio.input(pin) else 1
+    global info
 
     if pin == HOTKEY:
-        print "hotkey pressed"
-        if state == 1:
-            showOverlay = True
-        else:
-            showOverlay = False
-        try:
-            checkKeyInputPowerSaving()
-        except Exception:
-            pass
-        return
-    elif pin == QUICKSAVE:
-        print "quicksave pressed"
-        device.emit(KEYS[SELECT], state)
-        if not gpio.input(HOTKEY):
-            device.emit(KEYS[QUICKLOAD], state)
-        else:
-            device.emit(KEYS[QUICKSAVE], state)
-        time.sleep(BOUNCE_TIME)
-        device.syn()
+        # The overlay shows while HOTKEY is held
+        showOverlay = info = state == 1
+        requestUpdate()
+    if comboEngine.feed(pin, state, lastEdgeNs):
         return
 
-    key = KEYS[pin]
-    if not hotkeyAction(pin):
-        device.emit(key, state)
-        time.sleep(BOUNCE_TIME)
-        device.syn()
-    else:
-        checkKeyInputPowerSaving()
+    key = KEYS.get(pin)
+    if key is not None:
+        emitter.emit(key, state, pin)
 
     logging.debug("Pin: {}, KeyCode: {}, Event: {}".format(pin, key, 'press' if state else 'release'))
 
 
-def handle_shutdown(pin):
-    state = 0 if gpio.input(pin) else 1
+def handle_shutdown(pin, state):
     if (state):
         logging.info("SHUTDOWN")
         doShutdown()
 
 
-def handle_lid_close(pin):
-    state = gpio.input(pin)
+def handle_lid_close(pin, state):
     print 'Hall effect sensor tripped: ' + str(state)
-    if state == 0:
-        device.emit(KEYS[SELECT], 1)
-        device.emit(KEYS[QUICKSAVE], 1)
-        time.sleep(BOUNCE_TIME)
-        device.syn()
-        device.emit(KEYS[SELECT], 0)
-        device.emit(KEYS[QUICKSAVE], 0)
-        time.sleep(BOUNCE_TIME)
-        device.syn()
-        time.sleep(3)
-        os.system("killall retroarch")
-        time.sleep(2)
-        os.system('aplay ' + bin_dir + '/resources/lid_beep.wav')
-        doShutdown()
+    if state == 1:
+        emitter.emit(KEYS[SELECT], 1)
+        emitter.emit(KEYS[QUICKSAVE], 1)
+        emitter.flush()
+        loop.call_later(BOUNCE_TIME, lidSaveReleased)
 
 
-# Initialise Safe shutdown
-if not SHUTDOWN == -1:
-    gpio.add_event_detect(SHUTDOWN, gpio.BOTH, callback=handle_shutdown, bouncetime=1)
+# Lid closed: release the save combo, then quit the emulator and power off
+def lidSaveReleased():
+    emitter.emit(KEYS[SELECT], 0)
+    emitter.emit(KEYS[QUICKSAVE], 0)
+    emitter.flush()
+    loop.call_later(3, lidQuitEmulator)
+
+
+def lidQuitEmulator():
+    actions.submit('quit emulator', shell.system, ("killall retroarch",))
+    loop.call_later(2, lidShutdown)
+
 
+def lidShutdown():
+    doShutdown(sound=bin_dir + '/resources/lid_beep.wav')
+
+
+PIN_HANDLERS = dict((pin, handle_button) for pin in INPUT_PINS)
+if not SHUTDOWN == -1:
+    PIN_HANDLERS[SHUTDOWN] = handle_shutdown
 if not LID_SENSOR == -1:
-    gpio.add_event_detect(LID_SENSOR, gpio.BOTH, callback=handle_lid_close, bouncetime=5)
+    PIN_HANDLERS[LID_SENSOR] = handle_lid_close
+
+
+def dispatchPin(pin, state, edge_ns):
+    global lastEdgeNs
+    lastEdgeNs = edge_ns
+    edgeTimes[pin] = edge_ns
+    try:
+        PIN_HANDLERS[pin](pin, state)
+    except Exception:
+        logging.exception("GPIO handler failed for pin {}".format(pin))
+
+
+# When the debouncer or the pending input frame next need attention, in ns
+def inputDeadline():
+    deadline = debouncer.next_deadline()
+    frame_deadline = emitter.deadline()
+    if frame_deadline is not None and (deadline is None or frame_deadline < deadline):
+        deadline = frame_deadline
+    return deadline
+
+
+inputTimer = None
+
+
+# Keep one loop timer armed for the next input deadline
+def scheduleInput():
+    global inputTimer
+    deadline = inputDeadline()
+    if inputTimer is not None:
+        if inputTimer.deadline == deadline:
+            return
+        inputTimer.cancel()
+    inputTimer = None if deadline is None else loop.call_at(deadline, inputDue)
+
+
+# Backends that may miss edges have the settled level read back from the pin,
+# a fast replay answers from the trace
+settleRead = None if pins.exact else pins.read
+
+
+# Settles pins that bounced inside their debounce window, sends a due frame.
+def inputDue():
+    global inputTimer
+    inputTimer = None
+    for pin, state, edge_ns in debouncer.poll(loop.now(), settleRead):
+        dispatchPin(pin, state, edge_ns)
+    if emitter.due(loop.now()):
+        emitter.flush()
+    scheduleInput()
+
+
+# A batch of edges from the pins backend, dispatched in order
+def inputEdges(events):
+    idleMode.activity()
+    for event in events:
+        state = debouncer.feed(event.pin, event.level, event.timestamp_ns)
+        if state is not None:
+            dispatchPin(event.pin, state, event.timestamp_ns)
+    if emitter.due(loop.now()):
+        emitter.flush()
+    scheduleInput()
+
 
-# Initialise Buttons
 for button in BUTTONS:
-    gpio.add_event_detect(button, gpio.BOTH, callback=handle_button, bouncetime=1)
     logging.debug("Button: {}".format(button))
-
-if not HOTKEY in BUTTONS:
-    if HOTKEY != -1:
-        gpio.add_event_detect(HOTKEY, gpio.BOTH, callback=handle_button, bouncetime=1)
+pins.attach(loop, inputEdges)
 
 # Send centering commands
-device.emit(uinput.ABS_X, VREF / 2, syn=False)
-device.emit(uinput.ABS_Y, VREF / 2)
+emitter.emit(ev.ABS_X, VREF / 2)
+emitter.emit(ev.ABS_Y, VREF / 2)
+emitter.flush()
+lastAxis = [VREF / 2, VREF / 2]
+axisX = AxisProcessor(VREF, DZONE, curve=JOYSTICK_CURVE, min_cutoff=JOYSTICK_MIN_CUTOFF,
+                      beta=JOYSTICK_BETA)
+axisY = AxisProcessor(VREF, DZONE, curve=JOYSTICK_CURVE, min_cutoff=JOYSTICK_MIN_CUTOFF,
+                      beta=JOYSTICK_BETA)
+
+
+# One sampler pass, the processed stick position tells the scheduler whether it moved
+def pollJoystick():
+    joystickSampler.sample()
+    return tuple(lastAxis)
+
+
+# Maps one X/Y pass from the sampler onto ABS_X/ABS_Y
+def checkJoystickInput(timestamp, values):
+    if not joystick:
+        return
+    val = axisX.process(values[0], timestamp)
+    valy = axisY.process(values[1], timestamp)
+
+    if val != lastAxis[0]:
+        lastAxis[0] = val
+        edgeTimes['abs_x'] = timestamp
+        emitter.emit(ev.ABS_X, val, 'abs_x')
+        idleMode.activity()
+    if valy != lastAxis[1]:
+        lastAxis[1] = valy
+        edgeTimes['abs_y'] = timestamp
+        emitter.emit(ev.ABS_Y, valy, 'abs_y')
+        idleMode.activity()
+    emitter.flush()
+
+
+# Single-shot ADC read, through the joystick sampler when there is one so it
+# knows its scan was interrupted
+def readADC(channel, gain=1):
+    if joystickSampler is not None:
+        return joystickSampler.read_adc(channel, gain)
+    return adc.read_adc(channel, gain=gain)
+
+
+if JOYSTICK_DISABLED == 'False':
+    joystickSampler = ADCSampler(ads1015, [JOYSTICK_X_CHANNEL, JOYSTICK_Y_CHANNEL], gain=2 / 3,
+                                 data_rate=JOYSTICK_DATA_RATE, on_sample=checkJoystickInput)
+    if joystick:
+        sensors.add(Sensor('joystick', pollJoystick, 1.0 / JOYSTICK_SAMPLE_RATE,
+                           max_interval=1.0 / min(JOYSTICK_IDLE_RATE, JOYSTICK_SAMPLE_RATE),
+                           policy=Backoff(JOYSTICK_IDLE_AFTER, clock=loop.now),
+                           idle_interval=1.0 / IDLE_JOYSTICK_RATE))
 
 # Set up OSD service
+osdShared = None
+osdState = StateTracker()
 try:
-    if JOYSTICK_DISABLED == 'True':
-        osd_proc = Popen([osd_path, bin_dir, "nojoystick"], shell=False, stdin=PIPE, stdout=None, stderr=None)
-    else:
-        osd_proc = Popen([osd_path, bin_dir, "full"], shell=False, stdin=PIPE, stdout=None, stderr=None)
-    osd_in = osd_proc.stdin
-    time.sleep(1)
-    osd_poll = osd_proc.poll()
-    if (osd_poll):
-        logging.error("ERROR: Failed to start OSD, got return code [" + str(osd_poll) + "]\n")
-        sys.exit(1)
+    osd_mode = "nojoystick" if JOYSTICK_DISABLED == 'True' or RUN_MINIMAL == 'True' else "full"
+    osd_args = [osd_path, bin_dir, osd_mode]
+    if OSD_TRANSPORT == 'SHM':
+        try:
+            osdShared = SharedState(OSD_SHM_PATH)
+            osd_args += ["-s", OSD_SHM_PATH]
+        except (IOError, OSError):
+            logging.exception("Shared OSD state unavailable, using the pipe")
+    osd = sim.SimOSD() if SIMULATE else hal.ProcessOSD()
+    osd.start(osd_args)
+    osdEncoder = FrameEncoder()
 except Exception as e:
     logging.exception("ERROR: Failed start OSD binary")
     sys.exit(1)
+startup.phase('osd start')
+
+
+# The OSD signalled that it is up, or exited before it could. Updates sent
+# before then wait in its stdin.
+def osdReady():
+    ready = osd.read_ready()
+    loop.remove_reader(osd.ready_fd)
+    os.close(osd.ready_fd)
+    if not ready:
+        logging.error("ERROR: Failed to start OSD, got return code [" + str(osd.poll()) + "]\n")
+        sys.exit(1)
+    startup.end('osd')
+
+
+# An OSD built before the handshake never signals, it gets OSD_READY_TIMEOUT
+def osdReadyTimeout():
+    if startup.pending('osd'):
+        logging.warning("OSD did not signal readiness in " + str(OSD_READY_TIMEOUT) + " s, carrying on")
+        startup.end('osd')
+
+
+startup.begin('osd')
+loop.add_reader(osd.ready_fd, osdReady)
+loop.call_later(OSD_READY_TIMEOUT, osdReadyTimeout)
 
 
 def turnOffLowBatteryWarning():
     global lowbattery
     lowbattery = 2
-    overrideCounter.set()
+    requestUpdate()
     print "Turning off low battery"
 
 
 # Check for shutdown state
-def checkShdn(volt):
+def checkShdn(volt, confidence=1.0):
     global lowbattery
     global info
+    if confidence < batt_confidence:
+        return
     if volt < batt_low and lowbattery == 0:
         print "Triggering Low Batt warning"
         lowbattery = 1
-        t = Timer(2.0, turnOffLowBatteryWarning)
-        t.start()
+        loop.call_later(2.0, turnOffLowBatteryWarning)
     if volt < batt_shdn:
         logging.info("Low Voltage Shutdown Triggered")
         info = 1
-        overrideCounter.set()
+        requestUpdate()
         doShutdown()
 
 
-# Read voltage
+# Read voltage, smoothed by the estimator. Sets voltConfidence. None while
+# no reading has passed the estimator's floor yet.
 def readVoltage():
-    global last_bat_read
-    voltVal = adc.read_adc(0, gain=1)
-    volt = int((float(voltVal) * (4.09 / 2047.0)) * 100)
-    # volt = int(((voltVal * voltscale * dacres + (dacmax * 5)) / ((dacres * resdivval) / resdivmul)))
-
-    if volt < 300 or (last_bat_read > 300 and last_bat_read - volt > 6 and not last_bat_read == 450):
-        volt = last_bat_read
+    global voltConfidence
+    for i in range(batt_samples):
+        voltVal = readADC(0, gain=1)
+        volt = int((float(voltVal) * (4.09 / 2047.0)) * 100)
+        # volt = int(((voltVal * voltscale * dacres + (dacmax * 5)) / ((dacres * resdivval) / resdivmul)))
+        voltEstimator.add(volt)
 
-    last_bat_read = volt
-
-    return volt
+    voltConfidence = voltEstimator.confidence()
+    return voltEstimator.value()
 
 
 # Get voltage percent
@@ -367,61 +702,128 @@ def getVoltagepercent(volt):
 
 
 def readVolumeLevel():
-    process = os.popen("amixer | grep 'Left:' | awk -F'[][]' '{ print $2 }'")
-    res = process.readline()
-    process.close()
-
     vol = 0
     try:
-        vol = int(res.replace("%", "").replace("'C\n", ""))
+        vol = volumeControl.get()
     except Exception as e:
         logging.info("Audio Err    : " + str(e))
 
     return vol
 
 
+# Volume changed outside the monitor, refresh the OSD
+def volumeChanged(level):
+    global volume
+    volume = level
+    requestUpdate()
+
+
+# Block or unblock a radio, through /dev/rfkill when we could open it and
+# the rfkill command on the action queue otherwise
+def setRadioBlocked(radio, name, blocked):
+    change = ('block ' if blocked else 'unblock ') + name
+    if rfkillControl is not None:
+        rfkillControl.set_blocked(radio, blocked)
+        return 'rfkill ' + change
+    actions.submit('rfkill ' + name, shell.output, (['sudo', rfkill_path, 'block' if blocked else 'unblock', name],))
+    return rfkill_path + ' ' + change + ' queued'
+
+
+# A radio change the kernel has not confirmed or the rfkill command not made yet
+def radioPending(radio, name):
+    if rfkillControl is not None:
+        return rfkillControl.pending(radio)
+    return actions.busy('rfkill ' + name)
+
+
+# Run slow service commands one after the other
+def runCommands(*commands):
+    for command in commands:
+        try:
+            shell.call(command)
+        except Exception as e:
+            logging.info("Command " + ' '.join(command) + " failed: " + str(e))
+
+
+# Run them off the input path. A later request under the same key replaces
+# one that has not started yet.
+def runInBackground(key, *commands):
+    actions.submit(key, runCommands, commands)
+
+
+# The kernel confirmed a radio state change, refresh what the OSD shows
+def radioChanged(radio, blocked):
+    global wifi
+    global bluetooth
+    # Radios still being probed at startup get their state from the probe
+    if radio == RFKILL_TYPE_WLAN and wifi_state != 'UNKNOWN' and not startup.pending('wifi'):
+        if blocked:
+            wifi = wifi_off
+        else:
+            wifiStatus.invalidate()
+            # No signal straight after unblocking, keep showing the radio as on
+            wifi = readWifiSignal() if wifiStatus.strength() is not None else wifi_warning
+    elif radio == RFKILL_TYPE_BLUETOOTH and bt_state != 'UNKNOWN' and not startup.pending('bluetooth'):
+        bluetooth = not blocked
+    requestUpdate()
+
+
 # Read wifi (Credits: kite's SAIO project) Modified to only read, not set wifi.
 def readModeWifi(toggle=False):
-    ret = 0
-    wifiVal = not os.path.exists(osd_path + 'wifi')  # int(ser.readline().rstrip('\r\n'))
+    ret = setModeWifi(toggle)
+    if ret is not None:
+        return ret
+    # check signal
+    if toggle:
+        wifiStatus.invalidate()
+    return readWifiSignal()
+
+
+# Bring the radio in line with the state file, flipped first on a toggle.
+# Returns what the OSD shows, or None when that is the signal strength.
+def setModeWifi(toggle=False):
+    wifiVal = not os.path.exists(state_path + 'wifi')  # int(ser.readline().rstrip('\r\n'))
     if toggle:
         wifiVal = not wifiVal
     global wifi_state
     if (wifiVal):
-        if os.path.exists(osd_path + 'wifi'):
-            os.remove(osd_path + 'wifi')
+        if os.path.exists(state_path + 'wifi'):
+            os.remove(state_path + 'wifi')
         if (wifi_state != 'ON'):
             wifi_state = 'ON'
             logging.info("Wifi    [ENABLING]")
             try:
-                out = check_output(['sudo', rfkill_path, 'unblock', 'wifi'])
+                out = setRadioBlocked(RFKILL_TYPE_WLAN, 'wifi', False)
                 logging.info("Wifi    [" + str(out) + "]")
             except Exception as e:
                 logging.info("Wifi    : " + str(e))
-                ret = wifi_warning  # Get signal strength
+            if radioPending(RFKILL_TYPE_WLAN, 'wifi'):
+                # Optimistic until the radio is really on
+                return wifi_warning
+        return None
 
     else:
-        with open(osd_path + 'wifi', 'a'):
+        ret = 0
+        with open(state_path + 'wifi', 'a'):
             n = 1
         if (wifi_state != 'OFF'):
             wifi_state = 'OFF'
             logging.info("Wifi    [DISABLING]")
             try:
-                out = check_output(['sudo', rfkill_path, 'block', 'wifi'])
+                out = setRadioBlocked(RFKILL_TYPE_WLAN, 'wifi', True)
                 logging.info("Wifi    [" + str(out) + "]")
             except Exception as e:
                 logging.info("Wifi    : " + str(e))
                 ret = wifi_error
         return ret
-    # check signal
-    raw = check_output(['cat', '/proc/net/wireless'])
-    strengthObj = re.search(r'.wlan0: \d*\s*(\d*)\.\s*[-]?(\d*)\.', raw, re.I)
-    if strengthObj:
-        strength = 0
-        if (int(strengthObj.group(1)) > 0):
-            strength = int(strengthObj.group(1))
-        elif (int(strengthObj.group(2)) > 0):
-            strength = int(strengthObj.group(2))
+
+
+def readWifiSignal():
+    return wifiBars(wifiStatus.strength())
+
+
+def wifiBars(strength):
+    if strength is not None:
         logging.info("Wifi    [" + str(strength) + "]strength")
         if (strength > 55):
             ret = wifi_3bar
@@ -438,49 +840,86 @@ def readModeWifi(toggle=False):
 
 
 def readModeBluetooth(toggle=False):
-    ret = 0
-    BtVal = not os.path.exists(osd_path + 'bluetooth')  # int(ser.readline().rstrip('\r\n'))
+    ret = setModeBluetooth(toggle)
+    if ret is not None:
+        return ret
+    return readBluetoothEnabled()
+
+
+# Bring the radio in line with the state file, flipped first on a toggle.
+# Returns what the OSD shows, or None when the radio has to be read back.
+def setModeBluetooth(toggle=False):
+    BtVal = not os.path.exists(state_path + 'bluetooth')  # int(ser.readline().rstrip('\r\n'))
     if toggle:
         BtVal = not BtVal
     global bt_state
     if (BtVal):
-        if os.path.exists(osd_path + 'bluetooth'):
-            os.remove(osd_path + 'bluetooth')
+        if os.path.exists(state_path + 'bluetooth'):
+            os.remove(state_path + 'bluetooth')
         if (bt_state != 'ON'):
             bt_state = 'ON'
             logging.info("BT    [ENABLING]")
             try:
-                check_call("sudo systemctl enable hciuart.service && sudo systemctl start hciuart.service", shell=True)
-                out = check_output(['sudo', rfkill_path, 'unblock', 'bluetooth'])
+                runInBackground('hciuart', ['sudo', 'systemctl', 'enable', 'hciuart.service'],
+                                ['sudo', 'systemctl', 'start', 'hciuart.service'])
+                out = setRadioBlocked(RFKILL_TYPE_BLUETOOTH, 'bluetooth', False)
                 logging.info("BT      [" + str(out) + "]")
             except Exception as e:
                 logging.info("BT    : " + str(e))
-                ret = wifi_warning  # Get signal strength
+            if radioPending(RFKILL_TYPE_BLUETOOTH, 'bluetooth'):
+                return True
+        return None
 
     else:
-        with open(osd_path + 'bluetooth', 'a'):
+        ret = 0
+        with open(state_path + 'bluetooth', 'a'):
             n = 1
         if (bt_state != 'OFF'):
             bt_state = 'OFF'
             logging.info("BT    [DISABLING]")
             try:
-                check_call("sudo systemctl disable hciuart.service && sudo systemctl stop hciuart.service", shell=True)
-                out = check_output(['sudo', rfkill_path, 'block', 'bluetooth'])
+                out = setRadioBlocked(RFKILL_TYPE_BLUETOOTH, 'bluetooth', True)
+                runInBackground('hciuart', ['sudo', 'systemctl', 'disable', 'hciuart.service'],
+                                ['sudo', 'systemctl', 'stop', 'hciuart.service'])
                 logging.info("BT      [" + str(out) + "]")
             except Exception as e:
                 logging.info("BT    : " + str(e))
                 ret = wifi_error
         return ret
-    # check if it's enabled
-    raw = check_output(['hcitool', 'dev'])
+
+
+# check if it's enabled
+def readBluetoothEnabled():
+    if rfkillKnows(RFKILL_TYPE_BLUETOOTH):
+        return not rfkillControl.blocked(RFKILL_TYPE_BLUETOOTH)
+    return hciAdapterUp()
+
+
+def rfkillKnows(radio):
+    return rfkillControl is not None and rfkillControl.blocked(radio) is not None
+
+
+# Forks hcitool, the startup probe runs it off the loop
+def hciAdapterUp():
+    raw = shell.output(['hcitool', 'dev'])
     return True if raw.find("hci0") > -1 else False
 
 
-# Do a shutdown
-def doShutdown(channel=None):
-    check_call("sudo killall emulationstation", shell=True)
+# Do a shutdown, playing sound first when given. The commands run on the
+# action queue, the monitor exits once they are through.
+def doShutdown(channel=None, sound=None):
+    actions.submit('shutdown', shutdownCommands, (sound,), on_done=shutdownDone, force=True)
+
+
+def shutdownCommands(sound=None):
+    if sound is not None:
+        shell.system('aplay ' + sound)
+    shell.call("sudo killall emulationstation", shell=True)
     time.sleep(1)
-    check_call("sudo shutdown -h now", shell=True)
+    shell.call("sudo shutdown -h now", shell=True)
+
+
+def shutdownDone(result):
     try:
         sys.stdout.close()
     except:
@@ -492,17 +931,23 @@ def doShutdown(channel=None):
     sys.exit(0)
 
 
-# Signals the OSD binary
+# Sends the fields that changed since the last update to the OSD binary
 def updateOSD(volt=0, bat=0, temp=0, wifi=0, audio=0, lowbattery=0, info=False, charge=False, bluetooth=False):
-    commands = "s" + str(int(showOverlay)) + " v" + str(volt) + " b" + str(bat) + " t" + str(temp) + " w" + str(
-        wifi) + " a" + str(
-        audio) + " j" + ("1 " if joystick else "0 ") + " u" + ("1 " if bluetooth else "0 ") + " l" + str(
-        int(lowbattery)) + " " + ("on " if info else "off ") + (
-                   "charge" if charge else "ncharge") + "\n"
-    # print commands
-    osd_proc.send_signal(signal.SIGUSR1)
-    osd_in.write(commands)
-    osd_in.flush()
+    values = dict(show=showOverlay, voltage=volt, battery=bat, temp=temp, wifi=wifi, audio=audio,
+                  joystick=joystick, bluetooth=bluetooth, low_battery=lowbattery, info=info, charge=charge)
+    # While idle, fields the OSD does not draw wait for one it does rather
+    # than wake it up on their own
+    mask = osdState.changes(values, F_ALL & ~F_RENDERED if idleMode.idle and osdShared is None else 0)
+    if not mask:
+        return
+    if osdShared is None:
+        osd.write(osdEncoder.encode(mask=mask, **values))
+        return
+    # The shared block always holds the whole state. Voltage and temperature
+    # are not drawn, the OSD reads them on its next pass without a wake-up.
+    osdShared.publish(osdEncoder.encode(**values))
+    if mask & F_RENDERED:
+        osd.write(b'\n')
 
 
 # Misc functions
@@ -512,87 +957,341 @@ def clamp(n, minn, maxn):
 
 def volumeUp():
     global volume
-    volume = min(100, volume + 10)
-    os.system("amixer sset -q 'PCM' " + str(volume) + "%")
+    if volumeControl is not None:
+        volume = volumeControl.step(10)
+        requestUpdate()
 
 
 def volumeDown():
     global volume
-    volume = max(0, volume - 10)
-    os.system("amixer sset -q 'PCM' " + str(volume) + "%")
+    if volumeControl is not None:
+        volume = volumeControl.step(-10)
+        requestUpdate()
 
 
-def checkKeyInputPowerSaving():
-    global info
+def toggleWifi():
     global wifi
-    global joystick
+    if not startup.pending('wifi'):
+        wifi = readModeWifi(True)
+        sensors.poke('wifi')
+        requestUpdate()
+
+
+def toggleBluetooth():
     global bluetooth
-    global bat
-    global volume
-    global volt
-    global showOverlay
+    if not startup.pending('bluetooth'):
+        bluetooth = readModeBluetooth(True)
+        sensors.poke('bluetooth')
+        requestUpdate()
+
+
+# "key A[+B...] [seconds]": press the keys, release them after seconds or,
+# without, once the combo is let go
+def keyAction(args):
+    if not args:
+        raise ValueError("key needs the keys to send")
+    keys = comboKeys(args[0])
+    seconds = float(args[1]) if len(args) > 1 else None
+
+    def press():
+        for key in keys:
+            emitter.emit(key, 1)
+        emitter.flush()
+        if seconds is not None:
+            loop.call_later(seconds, release)
 
-    info = showOverlay
-    overrideCounter.set()
-
-    # TODO Convert to state
-    if not gpio.input(HOTKEY):
-        if not gpio.input(UP):
-            volumeUp()
-            time.sleep(0.5)
-        elif not gpio.input(DOWN):
-            volumeDown()
-            time.sleep(0.5)
-        elif not gpio.input(LEFT):
-            wifi = readModeWifi(True)
-            time.sleep(0.5)
-        elif not gpio.input(BUTTON_A):
-            bluetooth = readModeBluetooth(True)
-            time.sleep(0.5)
-        elif not gpio.input(QUICKSAVE):
-            device.emit(KEYS[QUICKLOAD], 1)
-            time.sleep(2)
-            device.syn()
-        elif not gpio.input(START):  # for when Start+Select just doesn't cut it
-            device.emit(uinput.KEY_ESC,1)
-            time.sleep(0.5)
-            device.emit(uinput.KEY_ESC,0)
-            device.syn()
+    def release():
+        for key in keys:
+            emitter.emit(key, 0)
+        emitter.flush()
+
+    return press, release if seconds is None else None
+
+
+def simpleAction(callback):
+    return lambda args: (callback, None)
+
+
+COMBO_ACTIONS = {
+    'volume_up': simpleAction(volumeUp),
+    'volume_down': simpleAction(volumeDown),
+    'wifi': simpleAction(toggleWifi),
+    'bluetooth': simpleAction(toggleBluetooth),
+    'key': keyAction,
+}
+comboEngine = ChordEngine(loop, COMBOS, COMBO_ACTIONS)
 
 
 def exit_gracefully(signum=None, frame=None):
-    gpio.cleanup
-    osd_proc.terminate()
+    pins.close()
+    if joystickSampler is not None:
+        joystickSampler.stop()
+    emitter.flush()
+    device.close()
+    if recorder is not None:
+        recorder.close()
+    osd.terminate()
+    if osdShared is not None:
+        osdShared.close()
     sys.exit(0)
 
 
 signal.signal(signal.SIGINT, exit_gracefully)
 signal.signal(signal.SIGTERM, exit_gracefully)
+signal.signal(signal.SIGUSR2, dumpLatency)
 
-# Read Initial States
-volume = readVolumeLevel()
 
-wifi = readModeWifi()
-bluetooth = bluetooth = readModeBluetooth()
+# Ask for a status pass (battery, OSD) as soon as the loop is free. Safe
+# from any thread, repeated requests before the pass are folded into one.
+def requestUpdate():
+    global updatePending
+    if not updatePending:
+        updatePending = True
+        loop.call_soon_threadsafe(monitorTick)
 
+
+# Status pass, every STATUS_INTERVAL seconds and whenever something asked for it
+def monitorTick():
+    global updatePending
+    updatePending = False
+    logging.debug('OSD updates sent ' + str(osdState.sent) + ', skipped ' + str(osdState.skipped))
+    logging.debug('Threads ' + str(active_count()) + ', loop wakeups ' + str(loop.wakeups) +
+                  ', OSD writes ' + str(osd.writes))
+    updateOSD(volt, bat, 20, wifi, volume, lowbattery, info, charge, bluetooth)
+
+
+# Read Initial States
 try:
-    while 1:
-        try:
-            if not adc == False:
-                volt = readVoltage()
-                logging.info('Battery Voltage' + str(volt));
-                bat = getVoltagepercent(volt)
-                logging.info('Battery Percent' + str(bat));
-            checkShdn(volt)
-            updateOSD(volt, bat, 20, wifi, volume, lowbattery, info, charge, bluetooth)
-            overrideCounter.wait(10)
-            if overrideCounter.is_set():
-                overrideCounter.clear()
-            runCounter = 0
-
-        except Exception:
-            logging.info("EXCEPTION")
-            pass
+    if SIMULATE:
+        simRfkill = sim.SimRfkill()
+        simRfkill.attach(loop)
+        rfkillControl = RfkillControl(loop, fd=simRfkill.fd, on_change=radioChanged)
+    else:
+        rfkillControl = RfkillControl(loop, on_change=radioChanged)
+except (IOError, OSError) as e:
+    logging.info("rfkill device unavailable, using " + rfkill_path + ": " + str(e))
+    rfkillControl = None
+startup.phase('rfkill')
+
+# The initial mixer, Wi-Fi and Bluetooth reads may fork (amixer, hcitool), so
+# they run side by side off the loop while input is already live. Only the
+# read runs on the probe thread, the radio state and its files are set here
+# and the result lands on the loop. Their hotkeys and polls wait for it.
+volumeControl = None
+
+
+def openMixer():
+    mixer = FakeMixer() if SIMULATE else open_mixer(MIXER_CONTROL, MIXER_CARD)
+    return mixer, mixer.get()
+
+
+def mixerOpened(result):
+    global volumeControl
+    global volume
+    mixer, level = result
+    volumeControl = VolumeControl(mixer, loop, volumeChanged, level=level, actions=actions)
+    volume = readVolumeLevel()
+    requestUpdate()
+
+
+def wifiProbed(strength):
+    global wifi
+    wifi = wifiBars(strength)
+    requestUpdate()
 
+
+def bluetoothProbed(value):
+    global bluetooth
+    bluetooth = value
+    requestUpdate()
+
+
+startup.probe('volume', openMixer, mixerOpened)
+shown = setModeWifi()
+if shown is None:
+    startup.probe('wifi', wifiStatus.strength, wifiProbed)
+else:
+    wifi = shown
+shown = setModeBluetooth()
+if shown is None and not rfkillKnows(RFKILL_TYPE_BLUETOOTH):
+    startup.probe('bluetooth', hciAdapterUp, bluetoothProbed)
+else:
+    bluetooth = readBluetoothEnabled() if shown is None else shown
+
+
+# Battery, polled faster as it nears BATT_LOW_VOLTAGE or while the estimate settles
+def pollBattery():
+    global volt
+    global bat
+    reading = readVoltage()
+    if reading is None:
+        # Nothing but glitches so far, keep showing the last value
+        logging.info('Battery Voltage unknown')
+        return None
+    volt = reading
+    logging.info('Battery Voltage' + str(volt));
+    bat = getVoltagepercent(volt)
+    logging.info('Battery Percent' + str(bat));
+    checkShdn(volt, voltConfidence)
+    requestUpdate()
+    return volt
+
+
+def pollWifi():
+    global wifi
+    if wifi_state == 'ON' and not startup.pending('wifi') and not radioPending(RFKILL_TYPE_WLAN, 'wifi'):
+        strength = readWifiSignal()
+        if strength != wifi:
+            wifi = strength
+            requestUpdate()
+    return wifi
+
+
+def pollBluetooth():
+    global bluetooth
+    if bt_state == 'ON' and not startup.pending('bluetooth') and \
+            not radioPending(RFKILL_TYPE_BLUETOOTH, 'bluetooth'):
+        enabled = readBluetoothEnabled()
+        if enabled != bluetooth:
+            bluetooth = enabled
+            requestUpdate()
+    return bluetooth
+
+
+# Effective polling rates of every sensor over the last minute
+def logPollRates():
+    logging.info('Polling ' + sensors.report())
+    if joystickSampler is not None:
+        logging.info('Joystick sampler {:.2f} passes/s'.format(joystickSampler.achieved_rate()))
+    logging.info('Wakeups ' + idleMode.report())
+    logging.info('Actions ' + actions.report())
+
+
+# No input for IDLE_AFTER seconds: sample the stick and battery at a crawl
+# and run the status pass less often. Any button edge or stick movement
+# (caught by the slowed sampling) brings back the full rates at once.
+def enterIdle():
+    sensors.set_idle(True)
+    statusTimer.interval = int(IDLE_STATUS_INTERVAL * 1e9)
+
+
+def leaveIdle():
+    sensors.set_idle(False)
+    statusTimer.interval = int(STATUS_INTERVAL * 1e9)
+    requestUpdate()
+
+
+if not adc == False:
+    sensors.add(Sensor('battery', pollBattery, batt_poll_min, max_interval=batt_poll_max,
+                       policy=Approach(batt_low, batt_poll_span, jitter=batt_poll_span / 4,
+                                       trusted=lambda: voltConfidence >= batt_confidence),
+                       idle_interval=IDLE_BATTERY_INTERVAL))
+sensors.add(Sensor('wifi', pollWifi, WIFI_POLL_MIN, max_interval=WIFI_POLL_MAX,
+                   policy=Backoff(WIFI_POLL_MIN * 2, clock=loop.now), budget=0.01),
+            delay=WIFI_POLL_MIN)
+sensors.add(Sensor('bluetooth', pollBluetooth, BT_POLL_MIN, max_interval=BT_POLL_MAX,
+                   policy=Backoff(BT_POLL_MIN * 2, clock=loop.now), budget=0.01),
+            delay=BT_POLL_MIN)
+statusTimer = loop.call_every(STATUS_INTERVAL, monitorTick)
+loop.call_every(60, logPollRates)
+if LATENCY_INTERVAL:
+    loop.call_every(LATENCY_INTERVAL, dumpLatency)
+idleMode = IdleMode(loop, IDLE_AFTER, on_idle=enterIdle, on_wake=leaveIdle,
+                    counters=[('loop', lambda: loop.wakeups), ('osd', lambda: osd.writes)])
+requestUpdate()
+
+
+# Fast replay runs the loop's timers (debounce windows, frame windows, combo
+# holds and repeats, timed key releases) on the trace's clock: replayClock
+# steps from deadline to deadline up to now_ns instead of sleeping.
+replayClock = [0]
+
+
+def replayUntil(now_ns):
+    deadline = loop.next_deadline()
+    while deadline is not None and deadline <= now_ns:
+        replayClock[0] = max(replayClock[0], deadline)
+        loop.run_timers(replayClock[0])
+        deadline = loop.next_deadline()
+    replayClock[0] = max(replayClock[0], now_ns)
+
+
+def replayRecord(record, offset_ns):
+    if record.kind == KIND_EDGE:
+        pins.set(record.source, record.value, record.timestamp_ns + offset_ns)
+    elif record.kind != KIND_READ:
+        ads1015.feed(record.source, record.value)
+
+
+def replayDone(records):
+    frames = [frame.events for frame in device.frames]
+    digest = hashlib.sha1(repr(frames).encode('ascii')).hexdigest()
+    sys.stderr.write("Replayed {} records: {} frames, {} events, sha1 {}\n".format(
+        len(records), len(frames), device.events, digest))
+    loop.call_soon(loop.stop)
+
+
+# Feed a recorded trace to the simulated hardware. At the original timing
+# the live loop reads it as it would the hardware; --fast runs it on the
+# trace's own clock before the loop starts, so the emitted stream depends on
+# nothing but the trace. The live timers (sensor polls, status) wait until it
+# is done, stick passes go to checkJoystickInput and every SAMPLES_PER_READ
+# battery samples to a battery poll. Recorded pin reads answer the settle
+# reads, as on the backend the trace came from.
+def replayTrace(path, fast):
+    global settleRead
+    records = read_trace(path)
+    if not records:
+        sys.stderr.write("Empty trace " + path + "\n")
+        loop.call_soon(loop.stop)
+        return
+    device.clear()
+    if not fast:
+        offset = monotonic_ns() + 100000000 - records[0].timestamp_ns
+        for record in records:
+            loop.call_at(record.timestamp_ns + offset, replayRecord, record, offset)
+        loop.call_at(records[-1].timestamp_ns + offset + 1000000000, replayDone, records)
+        return
+    live = loop.take_timers()
+    replayClock[0] = records[0].timestamp_ns
+    loop.clock = lambda: replayClock[0]
+    reads = RecordedReads(records, loop.now, pins.read)
+    if reads.count:
+        settleRead = reads.read
+    stick = {}
+    for record in records:
+        replayUntil(record.timestamp_ns)
+        if record.kind == KIND_EDGE:
+            inputEdges([hal.Edge(record.source, record.value, record.timestamp_ns)])
+        elif record.kind == KIND_READ:
+            continue
+        elif record.source in (JOYSTICK_X_CHANNEL, JOYSTICK_Y_CHANNEL):
+            stick[record.source] = record.value
+            if record.source == JOYSTICK_Y_CHANNEL and JOYSTICK_X_CHANNEL in stick:
+                checkJoystickInput(record.timestamp_ns, [stick.pop(JOYSTICK_X_CHANNEL), stick.pop(JOYSTICK_Y_CHANNEL)])
+        else:
+            ads1015.feed(record.source, record.value)
+            if ads1015.queued(0) >= batt_samples:
+                pollBattery()
+    replayUntil(records[-1].timestamp_ns + 1000000000)
+    emitter.flush()
+    settleRead = None if pins.exact else pins.read
+    # Back on the monotonic clock, timers the trace left pending keep their delay
+    loop.clock = monotonic_ns
+    loop.add_timers(loop.take_timers(), monotonic_ns() - replayClock[0])
+    loop.add_timers(live)
+    replayDone(records)
+
+
+if REPLAY is not None:
+    replayTrace(REPLAY, REPLAY_FAST)
+
+if SIM_SCRIPT:
+    startup.when_ready(sim.run_script, SIM_SCRIPT, globals())
+
+startup.phase('setup')
+try:
+    loop.run()
 except KeyboardInterrupt:
-    exit_gracefully()
+    pass
+exit_gracefully()
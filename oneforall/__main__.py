@@ -0,0 +1,18 @@
+#
+# python -m oneforall [options]: runs monitor_evdev.py, the monitor daemon,
+# from the checkout the package lives in. Options are the monitor's own
+# (--simulate, --replay, --output).
+#
+# The package holds the parts the daemon is built from (input and output
+# backends, event loop, emitter, sensors). The daemon itself is still the
+# script: it sets up and runs at module level on its globals, so it is run
+# here, not imported. monitor.py and monitor_evdev_old.py start it the same way.
+#
+import os
+import runpy
+import sys
+
+MONITOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'monitor_evdev.py')
+
+sys.argv[0] = MONITOR
+runpy.run_path(MONITOR, run_name='__main__')
@@ -0,0 +1,140 @@
+#
+# Background queue for slow side effects (oneforall.reactor).
+#
+# Hotkeys and the lid switch trigger work that forks or waits: rfkill and
+# systemctl commands, amixer writes, killing the emulator, powering off.
+# The input path only calls submit(), which queues the action and returns;
+# a few worker threads run it and on_done(result) is called back on the loop.
+#
+# Actions have a key. A queued action with the same key as a new one is
+# replaced in place (the newest arguments win, so "block wifi" followed by
+# "unblock wifi" runs once), and an action identical to the one running
+# right now is dropped along with whatever of its key was queued. Actions
+# with the same key never run side by side and keep their order. The queue
+# holds at most size actions, beyond that new ones are refused unless forced.
+#
+# Depth, merges, drops and per key run times are kept for report(). Runs
+# slower than slow_ms are logged as they finish.
+#
+import logging
+import threading
+from collections import OrderedDict
+
+from oneforall.monoclock import monotonic_ns
+
+
+class _Action(object):
+    __slots__ = ('key', 'fn', 'args', 'on_done', 'queued_ns')
+
+    def __init__(self, key, fn, args, on_done):
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.on_done = on_done
+        self.queued_ns = monotonic_ns()
+
+
+class ActionQueue(object):
+    def __init__(self, reactor, size=16, workers=2, slow_ms=500):
+        self.reactor = reactor
+        self.size = size
+        self.slow_ns = int(slow_ms * 1000000)
+        self.submitted = 0
+        self.merged = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_depth = 0
+        # key -> [runs, total ns, max ns, total ns waiting in the queue]
+        self.stats = {}
+        self._pending = OrderedDict()
+        self._running = {}
+        self._cond = threading.Condition()
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._run, name='actions-{}'.format(i))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    # Queue fn(*args) under key. False when it was refused because the queue
+    # is full; merged submissions count as queued.
+    def submit(self, key, fn, args=(), on_done=None, force=False):
+        action = _Action(key, fn, tuple(args), on_done)
+        with self._cond:
+            self.submitted += 1
+            running = self._running.get(key)
+            if running is not None and running.fn == fn and running.args == action.args:
+                # What is running already does it, anything queued after is void
+                self._pending.pop(key, None)
+                self.merged += 1
+                return True
+            if key in self._pending:
+                self._pending[key] = action
+                self.merged += 1
+                return True
+            if len(self._pending) >= self.size and not force:
+                self.dropped += 1
+                logging.warning("Action queue full, dropped {}".format(key))
+                return False
+            self._pending[key] = action
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._cond.notify()
+        return True
+
+    def depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def busy(self, key):
+        with self._cond:
+            return key in self._pending or key in self._running
+
+    def _next(self):
+        with self._cond:
+            while True:
+                for key in self._pending:
+                    if key not in self._running:
+                        action = self._pending.pop(key)
+                        self._running[key] = action
+                        return action
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            action = self._next()
+            start = monotonic_ns()
+            result = None
+            try:
+                result = action.fn(*action.args)
+                ok = True
+            except Exception:
+                logging.exception("Action {} failed".format(action.key))
+                ok = False
+            ns = monotonic_ns() - start
+            with self._cond:
+                del self._running[action.key]
+                stats = self.stats.setdefault(action.key, [0, 0, 0, 0])
+                stats[0] += 1
+                stats[1] += ns
+                stats[2] = max(stats[2], ns)
+                stats[3] += start - action.queued_ns
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                # An action of this key may have been held back for this one
+                self._cond.notify_all()
+            if ns > self.slow_ns:
+                logging.warning("Action {} took {:.0f} ms".format(action.key, ns / 1e6))
+            if ok and action.on_done is not None:
+                self.reactor.call_soon_threadsafe(action.on_done, result)
+
+    def report(self):
+        with self._cond:
+            parts = ['depth {} (max {}), {} done, {} failed, {} merged, {} dropped'.format(
+                len(self._pending), self.max_depth, self.completed, self.failed, self.merged, self.dropped)]
+            for key, (runs, total, longest, waited) in sorted(self.stats.items()):
+                parts.append('{} {}x avg {:.1f} ms max {:.1f} ms wait {:.1f} ms'.format(
+                    key, runs, total / 1e6 / runs, longest / 1e6, waited / 1e6 / runs))
+        return '; '.join(parts)
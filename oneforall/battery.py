@@ -0,0 +1,66 @@
+#
+# Battery voltage estimator.
+#
+# Readings (in hundredths of a volt, like readVoltage) go into a fixed size
+# ring. Readings under the floor are ADC glitches and are dropped outright.
+# The median of the ring rejects short dips such as the sag under emulator
+# load, and an EMA over that median gives a steady value for the percentage.
+# A reading far from the median is counted as an outlier and kept out of the
+# EMA, but it still enters the ring, so a real step (charger unplugged) wins
+# the median within half a ring.
+#
+# confidence() says how much the estimate can be trusted: it grows as the ring
+# fills and drops when recent readings disagree with each other.
+#
+
+
+class VoltageEstimator(object):
+    def __init__(self, size=15, alpha=0.2, max_jump=10, floor=300):
+        self.size = size
+        self.alpha = alpha
+        self.max_jump = max_jump
+        self.floor = floor
+        self.ring = [0] * size
+        self.count = 0
+        self.rejected = 0
+        self.outliers = 0
+        self.ema = None
+        self.median = None
+
+    def _samples(self):
+        return self.ring[:min(self.count, self.size)]
+
+    def add(self, volt):
+        if volt < self.floor:
+            self.rejected += 1
+            return self.value()
+
+        self.ring[self.count % self.size] = volt
+        self.count += 1
+        samples = sorted(self._samples())
+        self.median = samples[len(samples) // 2]
+
+        if self.ema is None:
+            self.ema = float(self.median)
+        elif abs(volt - self.median) > self.max_jump:
+            self.outliers += 1
+        else:
+            self.ema += self.alpha * (self.median - self.ema)
+        return self.value()
+
+    # Smoothed voltage, None until the first valid reading
+    def value(self):
+        if self.ema is None:
+            return None
+        return int(round(self.ema))
+
+    def confidence(self):
+        n = min(self.count, self.size)
+        if not n:
+            return 0.0
+        samples = self._samples()
+        # Median absolute deviation as the spread of recent readings
+        deviations = sorted(abs(v - self.median) for v in samples)
+        mad = deviations[len(deviations) // 2]
+        fill = n / float(self.size)
+        return fill / (1.0 + float(mad) / self.max_jump)
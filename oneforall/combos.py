@@ -0,0 +1,186 @@
+#
+# Button chords (combos) compiled into a per pin dispatch table.
+#
+# A combo is written in keys.cfg [COMBOS] as
+#
+#   NAME = BUTTON[+BUTTON...] [press | hold <s> | release] [within <s>]
+#          [max <s>] [repeat <s>] -> action [arguments]
+#
+#   press      fires when the last of its buttons goes down (default). The
+#              edge of that button is consumed, neither it nor its release
+#              reach the pad.
+#   hold <s>   fires once every button has been down for s seconds
+#   release    fires when the complete chord is let go, max <s> only if it
+#              was held for at most s seconds (a tap)
+#   within <s> the buttons have to go down within s seconds of each other
+#   repeat <s> fires again every s seconds while the chord stays down
+#
+# When several combos complete on the same edge only the ones with the most
+# buttons fire, so HOTKEY+QUICKSAVE overrides QUICKSAVE on its own.
+#
+# Button state comes from the debounced edges fed in, never from the pins.
+# Every button has a bit and every combo a mask; an edge looks up the
+# combos of its button in a dict and compares masks, so its cost does not
+# grow with the number of combos configured for other buttons.
+#
+import logging
+
+PRESS = 'press'
+HOLD = 'hold'
+RELEASE = 'release'
+
+
+class Combo(object):
+    __slots__ = ('name', 'pins', 'mask', 'trigger', 'hold_ns', 'within_ns', 'max_ns', 'repeat_ns',
+                 'action', 'args', 'fire', 'end', 'active', 'timer', 'complete_ns')
+
+    def __init__(self, name, pins, trigger=PRESS, hold=None, within=None, max_held=None, repeat=None,
+                 action=None, args=()):
+        self.name = name
+        self.pins = tuple(pins)
+        self.mask = 0
+        self.trigger = trigger
+        self.hold_ns = None if hold is None else int(hold * 1e9)
+        self.within_ns = None if within is None else int(within * 1e9)
+        self.max_ns = None if max_held is None else int(max_held * 1e9)
+        self.repeat_ns = None if repeat is None else int(repeat * 1e9)
+        self.action = action
+        self.args = tuple(args)
+        self.fire = None
+        self.end = None
+        self.active = False
+        self.timer = None
+        self.complete_ns = None
+
+
+_SECONDS = {'hold': 'hold', 'within': 'within', 'max': 'max_held', 'repeat': 'repeat'}
+
+
+# Combo from a [COMBOS] line; pins maps button names to pin numbers
+def parse_combo(name, text, pins):
+    if '->' not in text:
+        raise ValueError('Combo {}: no "-> action" in {!r}'.format(name, text))
+    chord, action = [part.split() for part in text.split('->', 1)]
+    if not chord or not action:
+        raise ValueError('Combo {}: expected buttons and an action in {!r}'.format(name, text))
+    members = []
+    for button in chord[0].upper().split('+'):
+        if pins.get(button, -1) == -1:
+            raise ValueError('Combo {}: unknown or unused button {}'.format(name, button))
+        members.append(pins[button])
+    options = {}
+    words = iter(chord[1:])
+    for word in words:
+        word = word.lower()
+        if word in (PRESS, RELEASE):
+            options['trigger'] = word
+            continue
+        if word not in _SECONDS:
+            raise ValueError('Combo {}: unknown option {}'.format(name, word))
+        try:
+            options[_SECONDS[word]] = float(next(words))
+        except (StopIteration, ValueError):
+            raise ValueError('Combo {}: {} needs a number of seconds'.format(name, word))
+        if word == HOLD:
+            options['trigger'] = HOLD
+    return Combo(name, members, action=action[0].lower(), args=action[1:], **options)
+
+
+class ChordEngine(object):
+    # actions maps an action name to a factory(args) returning (fire, end):
+    # fire() runs when the combo fires, end() (or None) once it is let go
+    def __init__(self, reactor, combos, actions):
+        self.reactor = reactor
+        self.bits = {}
+        self.table = {}
+        self.combos = []
+        self.held = 0
+        self.consumed = 0
+        self.fired = 0
+        self._down_ns = {}
+        for combo in combos:
+            factory = actions.get(combo.action)
+            if factory is None:
+                logging.error("Combo {}: unknown action {}".format(combo.name, combo.action))
+                continue
+            try:
+                combo.fire, combo.end = factory(combo.args)
+            except Exception as e:
+                logging.error("Combo {}: {}".format(combo.name, e))
+                continue
+            for pin in combo.pins:
+                combo.mask |= self.bits.setdefault(pin, 1 << len(self.bits))
+            self.combos.append(combo)
+        # Per button, its combos with the biggest chords first
+        for combo in sorted(self.combos, key=lambda c: -len(c.pins)):
+            for pin in combo.pins:
+                self.table.setdefault(pin, []).append(combo)
+
+    # A debounced button edge. True when a combo consumed it and it should
+    # not be passed on to the pad.
+    def feed(self, pin, pressed, timestamp_ns):
+        combos = self.table.get(pin)
+        if combos is None:
+            return False
+        bit = self.bits[pin]
+        if pressed:
+            self.held |= bit
+            self._down_ns[pin] = timestamp_ns
+            return self._pressed(bit, combos, timestamp_ns)
+        self.held &= ~bit
+        for combo in combos:
+            self._broken(combo, timestamp_ns)
+        if self.consumed & bit:
+            self.consumed &= ~bit
+            return True
+        return False
+
+    def _pressed(self, bit, combos, timestamp_ns):
+        held = self.held
+        size = 0
+        for combo in combos:
+            if held & combo.mask != combo.mask or len(combo.pins) < size:
+                continue
+            if combo.within_ns is not None and \
+                    timestamp_ns - min(self._down_ns[p] for p in combo.pins) > combo.within_ns:
+                continue
+            size = len(combo.pins)
+            combo.complete_ns = timestamp_ns
+            if combo.trigger == PRESS:
+                self.consumed |= bit
+                self._fire(combo)
+            elif combo.trigger == HOLD:
+                combo.timer = self.reactor.call_at(timestamp_ns + combo.hold_ns, self._held, combo)
+        return bool(self.consumed & bit)
+
+    def _broken(self, combo, timestamp_ns):
+        if combo.complete_ns is None:
+            return
+        if combo.timer is not None:
+            combo.timer.cancel()
+            combo.timer = None
+        if combo.trigger == RELEASE and (combo.max_ns is None or timestamp_ns - combo.complete_ns <= combo.max_ns):
+            self._fire(combo)
+        combo.complete_ns = None
+        if combo.active:
+            combo.active = False
+            if combo.end is not None:
+                self._run(combo, combo.end)
+
+    def _held(self, combo):
+        combo.timer = None
+        if self.held & combo.mask == combo.mask:
+            self._fire(combo)
+
+    def _fire(self, combo):
+        self.fired += 1
+        combo.active = combo.trigger != RELEASE
+        self._run(combo, combo.fire)
+        if combo.repeat_ns is not None and combo.active:
+            combo.timer = self.reactor.call_later(combo.repeat_ns / 1e9, self._held, combo)
+
+    def _run(self, combo, callback):
+        try:
+            callback()
+        except Exception:
+            logging.exception("Combo {} failed".format(combo.name))
@@ -0,0 +1,117 @@
+#
+# Timestamp driven, non-blocking button debouncer.
+#
+# Each pin uses a leading-edge lockout. A level change that arrives after the
+# pin has been quiet for its debounce window is reported straight away, so a
+# press costs no added latency. The pin is then locked for the window: edges
+# inside it only update the raw level, and once the window has passed poll()
+# reports whatever level the pin settled on. The level is not required to be
+# stable before it is reported, so a single glitch on an idle pin reads as a
+# press lasting one window.
+#
+# Pins added with stable=True trade that latency for glitch immunity: a new
+# level is only reported once it has held for the whole window, and a level
+# that flips back inside the window is never reported at all. Nothing here
+# sleeps or locks: it is used from the event loop only, which waits until
+# next_deadline().
+#
+
+
+class PinState(object):
+    __slots__ = ('window_ns', 'active_low', 'stable', 'raw', 'edge_ns', 'pressed', 'lock_until', 'pending')
+
+    def __init__(self, window_ns, active_low, stable, level):
+        self.window_ns = window_ns
+        self.active_low = active_low
+        self.stable = stable
+        self.raw = level
+        self.edge_ns = 0
+        self.pressed = self.is_pressed(level)
+        self.lock_until = 0
+        self.pending = False
+
+    def is_pressed(self, level):
+        return 1 if (level == 0) == self.active_low else 0
+
+
+class Debouncer(object):
+    def __init__(self):
+        self.pins = {}
+        self._pending = set()
+
+    # level is the physical level the pin currently reads
+    def add_pin(self, pin, debounce_us, active_low=True, level=None, stable=False):
+        if level is None:
+            level = 1 if active_low else 0
+        self.pins[pin] = PinState(int(debounce_us) * 1000, active_low, stable, level)
+
+    def pressed(self, pin):
+        return self.pins[pin].pressed
+
+    # Feed one edge sample. Returns the new pressed state (0/1) when it should
+    # be reported now, otherwise None.
+    def feed(self, pin, level, timestamp_ns):
+        state = self.pins[pin]
+        state.raw = level
+        state.edge_ns = timestamp_ns
+        if state.stable:
+            self._hold(pin, state, timestamp_ns)
+            return None
+        if timestamp_ns < state.lock_until:
+            if not state.pending:
+                state.pending = True
+                self._pending.add(pin)
+            return None
+        pressed = state.is_pressed(level)
+        if pressed == state.pressed:
+            return None
+        state.pressed = pressed
+        state.lock_until = timestamp_ns + state.window_ns
+        return pressed
+
+    # Stable pins: wait for the raw level to hold a window from its last edge
+    def _hold(self, pin, state, timestamp_ns):
+        state.lock_until = timestamp_ns + state.window_ns
+        if state.is_pressed(state.raw) != state.pressed:
+            state.pending = True
+            self._pending.add(pin)
+        elif state.pending:
+            state.pending = False
+            self._pending.discard(pin)
+
+    # Settle pins whose window has expired. read is an optional callable used
+    # to sample the live level when the caller does not get every edge.
+    # Returns a list of (pin, pressed, edge_ns) changes to report, edge_ns
+    # being the time of the last edge seen on that pin.
+    def poll(self, now_ns, read=None):
+        changes = []
+        if not self._pending:
+            return changes
+        for pin in list(self._pending):
+            state = self.pins[pin]
+            if now_ns < state.lock_until:
+                continue
+            if state.stable and read is not None:
+                level = read(pin)
+                if level != state.raw:
+                    # An edge the backend missed, the hold starts over
+                    state.raw = level
+                    state.edge_ns = now_ns
+                    self._hold(pin, state, now_ns)
+                    continue
+            elif read is not None:
+                state.raw = read(pin)
+            state.pending = False
+            self._pending.discard(pin)
+            pressed = state.is_pressed(state.raw)
+            if pressed != state.pressed:
+                state.pressed = pressed
+                state.lock_until = now_ns + state.window_ns
+                changes.append((pin, pressed, state.edge_ns))
+        return changes
+
+    # Earliest time poll() has work to do, or None if nothing is pending
+    def next_deadline(self):
+        if not self._pending:
+            return None
+        return min(self.pins[pin].lock_until for pin in self._pending)
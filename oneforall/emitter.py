@@ -0,0 +1,98 @@
+#
+# Frame coalescing uinput emitter.
+#
+# Button and axis changes are collected into one input frame and written
+# together, terminated by a single SYN_REPORT. With the uinput fd at hand the
+# whole frame goes out in one write(); otherwise it falls back to
+# python-uinput's per event emit with syn=False plus one syn().
+#
+# Within a frame an axis keeps only its latest value. A key that changes
+# twice (a press and its release) closes the frame first, so no transition is
+# ever folded away.
+#
+import os
+import struct
+import threading
+
+from oneforall.monoclock import monotonic_ns
+
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+SYN_REPORT = 0
+
+# struct input_event: struct timeval, __u16 type, __u16 code, __s32 value
+INPUT_EVENT = struct.Struct('llHHi')
+_SYN = INPUT_EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+
+
+class FrameEmitter(object):
+    # device is a python-uinput Device, fd its /dev/uinput descriptor if it
+    # was created with one. Frames are due window_us after their first event,
+    # on clock().
+    def __init__(self, device, fd=None, window_us=0, on_flush=None, clock=monotonic_ns):
+        self.device = device
+        self.clock = clock
+        self.fd = fd
+        self.window_ns = int(window_us) * 1000
+        self.on_flush = on_flush
+        self.frames = 0
+        self.events = 0
+        self._lock = threading.RLock()
+        self._frame = []
+        self._index = {}
+        self._tags = []
+        self._started = 0
+
+    # Queue a change; tag is handed to on_flush once the frame is written
+    def emit(self, event, value, tag=None):
+        key = (event[0], event[1])
+        with self._lock:
+            pos = self._index.get(key)
+            if pos is not None:
+                if key[0] == EV_ABS:
+                    self._frame[pos][2] = value
+                    if tag is not None:
+                        self._tags.append(tag)
+                    return
+                self._flush()
+            if not self._frame:
+                self._started = self.clock()
+            self._index[key] = len(self._frame)
+            self._frame.append([key[0], key[1], value])
+            if tag is not None:
+                self._tags.append(tag)
+
+    # Time the pending frame should be flushed, or None if there is none
+    def deadline(self):
+        if not self._frame:
+            return None
+        return self._started + self.window_ns
+
+    def due(self, now_ns):
+        deadline = self.deadline()
+        return deadline is not None and now_ns >= deadline
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        frame = self._frame
+        if not frame:
+            return
+        tags = self._tags
+        self._frame = []
+        self._index = {}
+        self._tags = []
+        if self.fd is not None:
+            pack = INPUT_EVENT.pack
+            os.write(self.fd, b''.join([pack(0, 0, t, c, v) for t, c, v in frame]) + _SYN)
+        else:
+            for t, c, v in frame:
+                self.device.emit((t, c), v, syn=False)
+            self.device.syn()
+        self.frames += 1
+        self.events += len(frame)
+        if self.on_flush is not None and tags:
+            self.on_flush(tags)
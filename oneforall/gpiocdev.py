@@ -0,0 +1,242 @@
+#
+# GPIO character device (/dev/gpiochipN) input backend.
+#
+# Uses the v2 line uAPI from linux/gpio.h: every pin we care about is taken in
+# a single bulk line request with both edges enabled, and edge events are read
+# from the request fd in batches. Each event carries the kernel's
+# CLOCK_MONOTONIC timestamp and a sequence number, so edges queued while we
+# were busy are not lost and can be told apart from dropped ones.
+#
+# Works the same against gpio-sim/gpio-mockup, e.g.:
+#
+#   modprobe gpio-mockup gpio_mockup_ranges=-1,32
+#   python -m oneforall.gpiocdev gpio-mockup-A 4 15 17
+#
+import errno
+import fcntl
+import math
+import os
+import select
+import struct
+import sys
+
+O_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+GPIO_MAX_NAME_SIZE = 32
+GPIO_V2_LINES_MAX = 64
+GPIO_V2_LINE_NUM_ATTRS_MAX = 10
+
+# enum gpio_v2_line_flag
+GPIO_V2_LINE_FLAG_USED = 1 << 0
+GPIO_V2_LINE_FLAG_ACTIVE_LOW = 1 << 1
+GPIO_V2_LINE_FLAG_INPUT = 1 << 2
+GPIO_V2_LINE_FLAG_OUTPUT = 1 << 3
+GPIO_V2_LINE_FLAG_EDGE_RISING = 1 << 4
+GPIO_V2_LINE_FLAG_EDGE_FALLING = 1 << 5
+GPIO_V2_LINE_FLAG_OPEN_DRAIN = 1 << 6
+GPIO_V2_LINE_FLAG_OPEN_SOURCE = 1 << 7
+GPIO_V2_LINE_FLAG_BIAS_PULL_UP = 1 << 8
+GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN = 1 << 9
+GPIO_V2_LINE_FLAG_BIAS_DISABLED = 1 << 10
+
+# enum gpio_v2_line_attr_id
+GPIO_V2_LINE_ATTR_ID_FLAGS = 1
+GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES = 2
+GPIO_V2_LINE_ATTR_ID_DEBOUNCE = 3
+
+# enum gpio_v2_line_event_id
+GPIO_V2_LINE_EVENT_RISING_EDGE = 1
+GPIO_V2_LINE_EVENT_FALLING_EDGE = 2
+
+# struct gpio_v2_line_config_attribute: id, padding, union(u64), mask
+_ATTR_FMT = '=IIQQ'
+# struct gpio_v2_line_config: flags, num_attrs, padding[5], attrs[10]
+_CONFIG_FMT = '=QI5I' + (_ATTR_FMT[1:] * GPIO_V2_LINE_NUM_ATTRS_MAX)
+# struct gpio_v2_line_request: offsets[64], consumer[32], config,
+# num_lines, event_buffer_size, padding[5], fd
+_REQUEST_FMT = '=' + str(GPIO_V2_LINES_MAX) + 'I' + str(GPIO_MAX_NAME_SIZE) + 's' + _CONFIG_FMT[1:] + 'II5Ii'
+# struct gpio_v2_line_values: bits, mask
+_VALUES_FMT = '=QQ'
+# struct gpio_v2_line_event: timestamp_ns, id, offset, seqno, line_seqno, padding[6]
+_EVENT_FMT = '=QIIII6I'
+# struct gpiochip_info: name[32], label[32], lines
+_CHIPINFO_FMT = '=32s32sI'
+
+_REQUEST_SIZE = struct.calcsize(_REQUEST_FMT)
+_VALUES_SIZE = struct.calcsize(_VALUES_FMT)
+_CHIPINFO_SIZE = struct.calcsize(_CHIPINFO_FMT)
+EVENT_SIZE = struct.calcsize(_EVENT_FMT)
+_REQUEST_FD_OFFSET = _REQUEST_SIZE - 4
+
+
+def _iowr(nr, size):
+    return (3 << 30) | (size << 16) | (0xB4 << 8) | nr
+
+
+def _ior(nr, size):
+    return (2 << 30) | (size << 16) | (0xB4 << 8) | nr
+
+
+GPIO_GET_CHIPINFO_IOCTL = _ior(0x01, _CHIPINFO_SIZE)
+GPIO_V2_GET_LINE_IOCTL = _iowr(0x07, _REQUEST_SIZE)
+GPIO_V2_LINE_GET_VALUES_IOCTL = _iowr(0x0E, _VALUES_SIZE)
+
+assert _REQUEST_SIZE == 592 and EVENT_SIZE == 48
+
+
+class EdgeEvent(object):
+    __slots__ = ('pin', 'level', 'timestamp_ns', 'seqno', 'line_seqno')
+
+    def __init__(self, pin, level, timestamp_ns, seqno, line_seqno):
+        self.pin = pin
+        self.level = level
+        self.timestamp_ns = timestamp_ns
+        self.seqno = seqno
+        self.line_seqno = line_seqno
+
+    def __repr__(self):
+        return 'EdgeEvent(pin={}, level={}, timestamp_ns={}, seqno={})'.format(
+            self.pin, self.level, self.timestamp_ns, self.seqno)
+
+
+def chip_label(path):
+    fd = os.open(path, os.O_RDONLY | O_CLOEXEC)
+    try:
+        buf = bytearray(_CHIPINFO_SIZE)
+        fcntl.ioctl(fd, GPIO_GET_CHIPINFO_IOCTL, buf, True)
+        name, label, lines = struct.unpack(_CHIPINFO_FMT, bytes(buf))
+        return label.rstrip(b'\0').decode('ascii', 'replace')
+    finally:
+        os.close(fd)
+
+
+# Resolve a chip by path, by name (gpiochip0) or by label (pinctrl-bcm2835,
+# gpio-mockup-A, gpio-sim.0-node0)
+def find_chip(name):
+    if name.startswith('/'):
+        return name
+    if os.path.exists('/dev/' + name):
+        return '/dev/' + name
+    for entry in sorted(os.listdir('/dev')):
+        if not entry.startswith('gpiochip'):
+            continue
+        path = '/dev/' + entry
+        try:
+            if chip_label(path) == name:
+                return path
+        except (IOError, OSError):
+            continue
+    raise IOError(errno.ENODEV, 'No GPIO chip named ' + name)
+
+
+class LineRequest(object):
+    # Pins are line offsets on the chip, which are the BCM numbers on a Pi.
+    # Levels are physical (1 = high); with pull-ups a pressed button reads 0.
+    def __init__(self, chip, pins, consumer='oneforall', pull_up=True, edges=True,
+                 debounce_us=0, event_buffer_size=0):
+        pins = list(pins)
+        if not pins or len(pins) > GPIO_V2_LINES_MAX:
+            raise ValueError('Need between 1 and {} pins'.format(GPIO_V2_LINES_MAX))
+        if len(set(pins)) != len(pins):
+            raise ValueError('Duplicate pins in line request')
+
+        self.pins = pins
+        self.chip = find_chip(chip)
+        self._index = dict((pin, i) for i, pin in enumerate(pins))
+        self._all_mask = (1 << len(pins)) - 1
+
+        flags = GPIO_V2_LINE_FLAG_INPUT
+        flags |= GPIO_V2_LINE_FLAG_BIAS_PULL_UP if pull_up else GPIO_V2_LINE_FLAG_BIAS_DISABLED
+        if edges:
+            flags |= GPIO_V2_LINE_FLAG_EDGE_RISING | GPIO_V2_LINE_FLAG_EDGE_FALLING
+
+        attrs = [0, 0, 0, 0] * GPIO_V2_LINE_NUM_ATTRS_MAX
+        num_attrs = 0
+        if debounce_us:
+            attrs[0:4] = [GPIO_V2_LINE_ATTR_ID_DEBOUNCE, 0, debounce_us, self._all_mask]
+            num_attrs = 1
+
+        offsets = pins + [0] * (GPIO_V2_LINES_MAX - len(pins))
+        # Room for every line to bounce a few times before the kernel drops events
+        if not event_buffer_size:
+            event_buffer_size = min(len(pins) * 16, 1024)
+        buf = bytearray(struct.pack(_REQUEST_FMT,
+                                    *(offsets + [consumer.encode('ascii')[:GPIO_MAX_NAME_SIZE - 1],
+                                                 flags, num_attrs, 0, 0, 0, 0, 0] + attrs +
+                                      [len(pins), event_buffer_size, 0, 0, 0, 0, 0, 0])))
+
+        chip_fd = os.open(self.chip, os.O_RDONLY | O_CLOEXEC)
+        try:
+            fcntl.ioctl(chip_fd, GPIO_V2_GET_LINE_IOCTL, buf, True)
+        finally:
+            os.close(chip_fd)
+
+        self.fd = struct.unpack_from('=i', bytes(buf), _REQUEST_FD_OFFSET)[0]
+        self._values = bytearray(_VALUES_SIZE)
+        self._read_size = EVENT_SIZE * event_buffer_size
+        self.dropped = 0
+        self._last_seqno = 0
+
+    def fileno(self):
+        return self.fd
+
+    # Read all line levels with one ioctl, returned as {pin: level}
+    def get_values(self):
+        struct.pack_into(_VALUES_FMT, self._values, 0, 0, self._all_mask)
+        fcntl.ioctl(self.fd, GPIO_V2_LINE_GET_VALUES_IOCTL, self._values, True)
+        bits = struct.unpack_from(_VALUES_FMT, bytes(self._values))[0]
+        return dict((pin, (bits >> i) & 1) for pin, i in self._index.items())
+
+    def get_value(self, pin):
+        return self.get_values()[pin]
+
+    # Block up to timeout seconds (None = forever) for edges, then drain every
+    # queued event with a single read. Returns a list of EdgeEvent.
+    def read_events(self, timeout=None):
+        if timeout is not None:
+            poller = select.poll()
+            poller.register(self.fd, select.POLLIN)
+            if not poller.poll(int(math.ceil(timeout * 1000))):
+                return []
+        try:
+            data = os.read(self.fd, self._read_size)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        return self.decode_events(data)
+
+    def decode_events(self, data):
+        events = []
+        unpack_from = struct.unpack_from
+        for offset in range(0, len(data) - EVENT_SIZE + 1, EVENT_SIZE):
+            ts, event_id, pin, seqno, line_seqno = unpack_from('=QIIII', data, offset)
+            # seqno is per request, gaps mean the kernel FIFO overflowed
+            if self._last_seqno and seqno > self._last_seqno + 1:
+                self.dropped += seqno - self._last_seqno - 1
+            self._last_seqno = seqno
+            events.append(EdgeEvent(pin, 1 if event_id == GPIO_V2_LINE_EVENT_RISING_EDGE else 0,
+                                    ts, seqno, line_seqno))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        sys.stderr.write('Usage: {} <chip> <pin> [pin ...]\n'.format(sys.argv[0]))
+        sys.exit(1)
+    with LineRequest(sys.argv[1], [int(p) for p in sys.argv[2:]]) as request:
+        print('levels: {}'.format(request.get_values()))
+        while True:
+            for event in request.read_events():
+                print(event)
@@ -0,0 +1,196 @@
+#
+# Hardware backends of the monitor.
+#
+# Everything the daemon touches outside its own process goes through one of
+# these small interfaces, so oneforall.sim can stand in for all of them and
+# the monitor runs headless on any Linux box:
+#
+#   pins      read(pin), attach(reactor, on_edges), close(). on_edges(events)
+#             runs on the loop with a batch of edges (.pin, .level,
+#             .timestamp_ns). exact is True when every edge is delivered, so
+#             levels can be tracked from the edge stream alone.
+#   adc       read_adc(), start_adc(), stop_adc() as Adafruit_ADS1x15.ADS1015
+#   input     a python-uinput style device plus its fd (or None), see
+#             FrameEmitter and oneforall.vinput for the backends
+#   osd       start(args), write(data), poll(), terminate(). writes counts
+#             write() calls, each of them wakes the OSD up. ready_fd turns
+#             readable once the OSD is up (or gone), read_ready() tells which.
+#   shell     call(), output(), system() for the system commands
+#
+# Hardware modules are imported when a backend is created, not at import.
+#
+import errno
+import fcntl
+import logging
+import os
+import sys
+import time
+from collections import namedtuple
+from subprocess import Popen, PIPE, check_output, check_call
+
+from oneforall.monoclock import monotonic_ns
+
+Edge = namedtuple('Edge', 'pin level timestamp_ns')
+
+
+class CdevPins(object):
+    # Every pin in one GPIO character device line request, see gpiocdev
+    exact = True
+
+    def __init__(self, chip, pins, consumer='oneforall'):
+        from oneforall import gpiocdev
+
+        self.request = gpiocdev.LineRequest(chip, pins, consumer=consumer)
+        self.levels = self.request.get_values()
+        self._reactor = None
+        self._on_edges = None
+
+    def read(self, pin):
+        return self.levels[pin]
+
+    def attach(self, reactor, on_edges):
+        self._reactor = reactor
+        self._on_edges = on_edges
+        reactor.add_reader(self.request.fileno(), self._ready)
+
+    # The line request is readable: hand over the waiting edge batch in order
+    def _ready(self):
+        events = self.request.read_events(0)
+        for event in events:
+            self.levels[event.pin] = event.level
+        if self.request.dropped:
+            logging.warning("GPIO edges dropped: {}".format(self.request.dropped))
+            self.request.dropped = 0
+        if events:
+            self._on_edges(events)
+
+    def close(self):
+        if self._reactor is not None and self.request.fd >= 0:
+            self._reactor.remove_reader(self.request.fd)
+        self.request.close()
+
+
+class RpiPins(object):
+    # RPi.GPIO inputs with pull-ups. Its edge callbacks run on a library
+    # thread and can miss edges, so levels are read back from the pins.
+    exact = False
+
+    def __init__(self, pins, bouncetime=None):
+        import RPi.GPIO as gpio
+
+        self.gpio = gpio
+        self.pins = list(pins)
+        self.bouncetime = bouncetime or {}
+        gpio.setwarnings(False)
+        gpio.setmode(gpio.BCM)
+        gpio.setup(self.pins, gpio.IN, pull_up_down=gpio.PUD_UP)
+
+    def read(self, pin):
+        return self.gpio.input(pin)
+
+    def attach(self, reactor, on_edges):
+        # Sample the pin once on the callback thread and hand the edge over
+        def edge(pin):
+            reactor.call_soon_threadsafe(on_edges, [Edge(pin, self.gpio.input(pin), monotonic_ns())])
+
+        for pin in self.pins:
+            self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=edge, bouncetime=self.bouncetime.get(pin, 1))
+
+    def close(self):
+        self.gpio.cleanup()
+
+
+def open_adc():
+    import Adafruit_ADS1x15
+
+    return Adafruit_ADS1x15.ADS1015()
+
+
+# Virtual input device for events (evcodes tuples) on one of the
+# oneforall.vinput backends. Its /dev/uinput fd comes along so that whole
+# input frames can be written with a single write().
+def open_input_device(events, name, backend='UINPUT'):
+    from oneforall import vinput
+
+    device = vinput.open_device(backend, events, name)
+    return device, device.fd
+
+
+UI_GET_SYSNAME = (2 << 30) | (64 << 16) | (ord('U') << 8) | 44
+
+
+# Wait until udev made the /dev/input node of the uinput device on fd, so
+# readers can open it. Returns its path, or None after timeout seconds.
+def wait_input_node(fd, timeout=1.0):
+    deadline = time.time() + timeout
+    try:
+        sysname = fcntl.ioctl(fd, UI_GET_SYSNAME, b'\0' * 64).split(b'\0')[0].decode('ascii')
+    except (IOError, OSError) as e:
+        # Kernels before 3.15 cannot name the device, give udev the time
+        logging.info("uinput device name unavailable: " + str(e))
+        time.sleep(timeout)
+        return None
+    sysdir = '/sys/devices/virtual/input/' + sysname
+    while True:
+        for entry in os.listdir(sysdir) if os.path.isdir(sysdir) else ():
+            if entry.startswith('event') and os.path.exists('/dev/input/' + entry):
+                return '/dev/input/' + entry
+        if time.time() >= deadline:
+            return None
+        time.sleep(0.005)
+
+
+class ProcessOSD(object):
+    # The osd binary, fed through its stdin. It writes a line to the pipe
+    # named in OSD_READY_FD once its layers are up.
+    def __init__(self):
+        self.process = None
+        self.writes = 0
+        self.ready_fd = None
+        self._fd = None
+
+    def start(self, args):
+        self.ready_fd, ready_w = os.pipe()
+        env = dict(os.environ, OSD_READY_FD=str(ready_w))
+        extra = {'pass_fds': (ready_w,)} if sys.version_info[0] >= 3 else {}
+        try:
+            self.process = Popen(args, shell=False, stdin=PIPE, stdout=None, stderr=None, env=env, **extra)
+        finally:
+            os.close(ready_w)
+        self._fd = self.process.stdin.fileno()
+
+    # True once the OSD signalled, False if it exited first, None before
+    def read_ready(self):
+        return read_ready(self.ready_fd)
+
+    def write(self, data):
+        self.writes += 1
+        os.write(self._fd, data)
+
+    def poll(self):
+        return self.process.poll()
+
+    def terminate(self):
+        self.process.terminate()
+
+
+def read_ready(fd):
+    try:
+        data = os.read(fd, 64)
+    except OSError as e:
+        if e.errno == errno.EAGAIN:
+            return None
+        raise
+    return bool(data)
+
+
+class Shell(object):
+    # Exit status, failures are not an error
+    def system(self, command):
+        return os.system(command)
+
+    def call(self, command, shell=False):
+        check_call(command, shell=shell)
+
+    def output(self, command):
+        return check_output(command)
@@ -0,0 +1,87 @@
+#
+# Idle detection for the monitor (oneforall.reactor).
+#
+# activity() is called on every input edge and stick movement and only
+# stores a timestamp. One timer checks it every idle_after seconds, and
+# once that much time passed without activity on_idle() runs. The next
+# activity() runs on_wake() right away, on the same loop pass.
+#
+# Wakeups are counted per state, so the log can show what idle saves: each
+# counter is a callable returning a running total (loop wakeups, OSD writes)
+# and report() gives its rate while active and while idle.
+#
+import logging
+
+
+class IdleMode(object):
+    def __init__(self, reactor, idle_after, on_idle=None, on_wake=None, counters=()):
+        self.reactor = reactor
+        self.idle_after_ns = int(idle_after * 1e9)
+        self.on_idle = on_idle
+        self.on_wake = on_wake
+        self.counters = list(counters)
+        self.idle = False
+        self.transitions = 0
+        self._last = self.reactor.now()
+        self._timer = None
+        # state -> [ns spent, totals of every counter]
+        self._totals = {False: [0, [0] * len(self.counters)], True: [0, [0] * len(self.counters)]}
+        self._since = self._last
+        self._start = self._snapshot()
+        self._arm()
+
+    def _snapshot(self):
+        return [count() for name, count in self.counters]
+
+    def _arm(self):
+        if self.idle_after_ns > 0 and self._timer is None:
+            self._timer = self.reactor.call_at(self._last + self.idle_after_ns, self._check)
+
+    def _check(self):
+        self._timer = None
+        if self.reactor.now() - self._last >= self.idle_after_ns:
+            self._switch(True)
+        else:
+            self._arm()
+
+    def activity(self):
+        self._last = self.reactor.now()
+        if self.idle:
+            self._switch(False)
+            self._arm()
+
+    def _close_period(self):
+        now = self.reactor.now()
+        counts = self._snapshot()
+        totals = self._totals[self.idle]
+        totals[0] += now - self._since
+        totals[1] = [total + count - start for total, count, start in zip(totals[1], counts, self._start)]
+        self._since = now
+        self._start = counts
+
+    def _switch(self, idle):
+        self._close_period()
+        self.idle = idle
+        self.transitions += 1
+        logging.info('{} ({})'.format('Idle' if idle else 'Awake', self.report()))
+        callback = self.on_idle if idle else self.on_wake
+        if callback is not None:
+            try:
+                callback()
+            except Exception:
+                logging.exception("Idle mode {} failed".format('entry' if idle else 'exit'))
+
+    # state ('active', 'idle') -> (seconds spent, {counter: wakeups per second})
+    def rates(self):
+        self._close_period()
+        rates = {}
+        for idle, (ns, counts) in self._totals.items():
+            seconds = ns / 1e9
+            rates['idle' if idle else 'active'] = (seconds, dict(
+                (name, count / seconds if seconds else 0.0) for (name, fn), count in zip(self.counters, counts)))
+        return rates
+
+    def report(self):
+        return ', '.join('{} {:.0f} s: {}'.format(state, seconds, ' '.join(
+            '{} {:.2f}/s'.format(name, rates[name]) for name, fn in self.counters))
+            for state, (seconds, rates) in sorted(self.rates().items()))
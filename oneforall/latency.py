@@ -0,0 +1,104 @@
+#
+# Fixed bucket latency histograms for the input pipeline.
+#
+# Buckets are log-linear like HdrHistogram: every power of two is split into
+# 2**SUB_BITS linear sub-buckets, so any value is kept within ~6% using a
+# small fixed array. Recording is an int bit_length, a shift and an increment;
+# there is no locking, a lost increment under contention is acceptable here.
+#
+import os
+
+SUB_BITS = 4
+SUB_COUNT = 1 << SUB_BITS
+MAX_SHIFT = 32
+
+
+def bucket_index(value):
+    if value < SUB_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    if shift > MAX_SHIFT:
+        shift = MAX_SHIFT
+        value = (2 * SUB_COUNT - 1) << shift
+    return (shift + 1) * SUB_COUNT + (value >> shift) - SUB_COUNT
+
+
+# Highest value that lands in a bucket
+def bucket_upper(index):
+    if index < SUB_COUNT:
+        return index
+    shift = index // SUB_COUNT - 1
+    return ((SUB_COUNT + index % SUB_COUNT + 1) << shift) - 1
+
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = [0] * ((MAX_SHIFT + 2) * SUB_COUNT)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0
+        target = max(1, int(self.count * pct / 100.0 + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            if n:
+                seen += n
+                if seen >= target:
+                    return min(bucket_upper(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / float(self.count) if self.count else 0.0
+
+
+# Named histograms of microsecond latencies, e.g. one per pin and per axis
+class LatencyStats(object):
+    def __init__(self):
+        self.histograms = {}
+
+    def histogram(self, name):
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram()
+        return hist
+
+    # Record the time between two monotonic_ns readings
+    def record(self, name, start_ns, end_ns):
+        self.histogram(name).record((end_ns - start_ns) // 1000)
+
+    def report(self):
+        lines = ['{:<16} {:>8} {:>8} {:>8} {:>8} {:>8}'.format('name', 'count', 'mean', 'p50', 'p99', 'max')]
+        for name in sorted(self.histograms):
+            hist = self.histograms[name]
+            lines.append('{:<16} {:>8} {:>8.0f} {:>8} {:>8} {:>8}'.format(
+                name, hist.count, hist.mean(), hist.percentile(50), hist.percentile(99), hist.max))
+        return '\n'.join(lines) + '\n'
+
+    # Replace path with the current report (latencies in microseconds)
+    def dump(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.report())
+        os.rename(tmp, path)
+
+    def reset(self):
+        for hist in self.histograms.values():
+            hist.reset()
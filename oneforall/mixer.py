@@ -0,0 +1,159 @@
+#
+# In-process volume control.
+#
+# Keeps one ALSA mixer handle open (pyalsaaudio) instead of forking amixer
+# for every read and step. Bursts of volume steps are coalesced: callers only
+# update the target and a loop timer (oneforall.reactor) writes the last value
+# once the burst is over. The loop also watches the mixer's poll descriptors,
+# so changes made elsewhere (alsamixer, the emulator) show up through
+# on_change without polling.
+#
+# Without pyalsaaudio the amixer command line is used, without change events.
+# Its writes fork, with an action queue (oneforall.actions) they run there.
+# FakeMixer stands in for the hardware in tests and simulation.
+#
+import logging
+import os
+import re
+from subprocess import check_output, check_call
+
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
+
+class AlsaMixer(object):
+    def __init__(self, control='PCM', cardindex=0):
+        self.mixer = alsaaudio.Mixer(control, cardindex=cardindex)
+
+    def get(self):
+        levels = self.mixer.getvolume()
+        return int(sum(levels) / len(levels)) if levels else 0
+
+    def set(self, level):
+        self.mixer.setvolume(level)
+
+    def descriptors(self):
+        return [fd for fd, mask in self.mixer.polldescriptors()]
+
+    def handle_events(self):
+        self.mixer.handleevents()
+
+
+class AmixerMixer(object):
+    # set() forks amixer and waits for it
+    blocking = True
+
+    def __init__(self, control='PCM', cardindex=0):
+        self.control = control
+        self.card = str(cardindex)
+
+    def get(self):
+        out = check_output(['amixer', '-c', self.card, 'sget', self.control])
+        levels = re.findall(r'\[(\d+)%\]', out.decode('ascii', 'replace'))
+        return int(levels[0]) if levels else 0
+
+    def set(self, level):
+        check_call(['amixer', '-q', '-c', self.card, 'sset', self.control, str(level) + '%'])
+
+    def descriptors(self):
+        return []
+
+    def handle_events(self):
+        pass
+
+
+class FakeMixer(object):
+    def __init__(self, level=50):
+        self.level = level
+        self.writes = []
+        self._r, self._w = os.pipe()
+
+    def get(self):
+        return self.level
+
+    def set(self, level):
+        self.level = level
+        self.writes.append(level)
+        os.write(self._w, b'x')
+
+    # Simulate a change made by another program
+    def external_set(self, level):
+        self.level = level
+        os.write(self._w, b'x')
+
+    def descriptors(self):
+        return [self._r]
+
+    def handle_events(self):
+        os.read(self._r, 4096)
+
+
+def open_mixer(control='PCM', cardindex=0):
+    if alsaaudio is not None:
+        try:
+            return AlsaMixer(control, cardindex)
+        except Exception:
+            logging.exception("ALSA mixer unavailable, falling back to amixer")
+    return AmixerMixer(control, cardindex)
+
+
+class VolumeControl(object):
+    # on_change(level) is called on the loop when the volume is changed by
+    # someone else. coalesce_ms is how long a burst of steps may keep moving
+    # the target before it is written. level is the mixer's current level
+    # when the caller already read it. Writes of a blocking mixer go through
+    # actions, an ActionQueue, when one is given.
+    def __init__(self, mixer, reactor, on_change=None, coalesce_ms=50, level=None, actions=None):
+        self.mixer = mixer
+        self.actions = actions if getattr(mixer, 'blocking', False) else None
+        self.on_change = on_change
+        self.coalesce_ns = int(coalesce_ms * 1000000)
+        self.level = mixer.get() if level is None else level
+        self.writes = 0
+        self._target = None
+        self._written = self.level
+        self._reactor = reactor
+        for fd in mixer.descriptors():
+            reactor.add_reader(fd, self._external_change)
+
+    def get(self):
+        return self.level
+
+    def set(self, level):
+        level = max(0, min(100, int(level)))
+        self.level = level
+        if self._target is None:
+            self._reactor.call_at(self._reactor.now() + self.coalesce_ns, self._flush)
+        self._target = level
+        return level
+
+    def step(self, delta):
+        return self.set(self.level + delta)
+
+    def _flush(self):
+        target = self._target
+        if target is None:
+            return
+        self._target = None
+        if target != self._written:
+            if self.actions is not None:
+                self.actions.submit('volume', self.mixer.set, (target,))
+            else:
+                self.mixer.set(target)
+            self._written = target
+            self.writes += 1
+
+    def _external_change(self):
+        self.mixer.handle_events()
+        level = self.mixer.get()
+        # Our own write echoing back, or a step still waiting to be written
+        if level == self._written or self._target is not None:
+            return
+        self._written = level
+        if level == self.level:
+            return
+        self.level = level
+        if self.on_change is not None:
+            self.on_change(level)
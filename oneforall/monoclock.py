@@ -0,0 +1,33 @@
+#
+# Monotonic nanosecond clock shared by the input pipeline.
+#
+# The GPIO character device stamps edges with CLOCK_MONOTONIC, so everything
+# that compares against those stamps has to read the same clock. Python 2 has
+# no time.monotonic, so fall back to clock_gettime through ctypes there.
+#
+import ctypes
+import ctypes.util
+import time
+
+CLOCK_MONOTONIC = 1
+
+if hasattr(time, 'monotonic_ns'):
+    monotonic_ns = time.monotonic_ns
+else:
+    class _timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    _librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+    _clock_gettime = _librt.clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+    def monotonic_ns():
+        ts = _timespec()
+        if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, 'clock_gettime failed')
+        return ts.tv_sec * 1000000000 + ts.tv_nsec
+
+
+def monotonic():
+    return monotonic_ns() / 1e9
@@ -0,0 +1,144 @@
+#
+# Binary monitor -> OSD protocol.
+#
+# Each update is one fixed layout frame written to the OSD's stdin in a single
+# write(); the OSD polls its stdin, so no signal is needed. The layout mirrors
+# struct osd_frame in osd/osd_frame.h:
+#
+#   u32 magic    "\xa5OSD", never the first byte of a text command
+#   u16 version  OSD_FRAME_VERSION of the sender
+#   u16 length   size of the whole frame in bytes
+#   u32 seq      incremented per frame, lets the OSD spot lost updates
+#   u32 mask     F_* bits of the fields this frame carries
+#   u16 voltage  hundredths of a volt
+#   s16 temp     tenths of a degree C
+#   u8  battery, wifi, audio, low_battery
+#   u8  flags    FLAG_* booleans (show, joystick, bluetooth, info, charge, hud)
+#   u8  reserved[3]
+#
+# New fields are only ever appended and announced through the mask. The
+# reader trusts length rather than its own sizeof, so an older OSD skips
+# fields it does not know and never reads past a frame.
+#
+import struct
+
+MAGIC = 0x44534fa5
+VERSION = 1
+
+OSD_FRAME = struct.Struct('<IHHIIHhBBBBB3x')
+HEADER_SIZE = 16
+MAX_SIZE = 256
+
+# Field mask
+F_SHOW = 1 << 0
+F_VOLTAGE = 1 << 1
+F_BATTERY = 1 << 2
+F_TEMP = 1 << 3
+F_WIFI = 1 << 4
+F_AUDIO = 1 << 5
+F_JOYSTICK = 1 << 6
+F_BLUETOOTH = 1 << 7
+F_LOW_BATTERY = 1 << 8
+F_INFO = 1 << 9
+F_CHARGE = 1 << 10
+F_HUD = 1 << 11
+F_ALL = (1 << 12) - 1
+# Fields the OSD draws; voltage and temperature are only carried along
+F_RENDERED = F_ALL & ~(F_VOLTAGE | F_TEMP)
+
+# Bits of the flags byte, for the boolean fields
+FLAG_SHOW = 1 << 0
+FLAG_JOYSTICK = 1 << 1
+FLAG_BLUETOOTH = 1 << 2
+FLAG_INFO = 1 << 3
+FLAG_CHARGE = 1 << 4
+FLAG_HUD = 1 << 5
+
+# Field name -> (mask bit, flag bit or None for numeric fields)
+FIELDS = {
+    'show': (F_SHOW, FLAG_SHOW),
+    'voltage': (F_VOLTAGE, None),
+    'battery': (F_BATTERY, None),
+    'temp': (F_TEMP, None),
+    'wifi': (F_WIFI, None),
+    'audio': (F_AUDIO, None),
+    'joystick': (F_JOYSTICK, FLAG_JOYSTICK),
+    'bluetooth': (F_BLUETOOTH, FLAG_BLUETOOTH),
+    'low_battery': (F_LOW_BATTERY, None),
+    'info': (F_INFO, FLAG_INFO),
+    'charge': (F_CHARGE, FLAG_CHARGE),
+    'hud': (F_HUD, FLAG_HUD),
+}
+
+
+class FrameEncoder(object):
+    def __init__(self):
+        self.seq = 0
+        self._buffer = bytearray(OSD_FRAME.size)
+
+    # Pack one frame into the encoder's buffer and return it. Fields not in
+    # mask are still packed but the OSD leaves its copy of them alone.
+    def encode(self, mask=F_ALL, show=False, voltage=0, battery=0, temp=0, wifi=0, audio=0,
+               joystick=False, bluetooth=False, low_battery=0, info=False, charge=False, hud=True):
+        self.seq = (self.seq + 1) & 0xffffffff
+        flags = ((FLAG_SHOW if show else 0) | (FLAG_JOYSTICK if joystick else 0) |
+                 (FLAG_BLUETOOTH if bluetooth else 0) | (FLAG_INFO if info else 0) |
+                 (FLAG_CHARGE if charge else 0) | (FLAG_HUD if hud else 0))
+        OSD_FRAME.pack_into(self._buffer, 0, MAGIC, VERSION, OSD_FRAME.size, self.seq, mask,
+                            min(0xffff, max(0, int(voltage))),
+                            min(0x7fff, max(-0x8000, int(round(temp * 10)))),
+                            min(255, max(0, int(battery))), min(255, max(0, wifi)), min(255, max(0, audio)),
+                            min(255, max(0, int(low_battery))), flags)
+        return self._buffer
+
+
+# Remembers the last state handed to the OSD so only changed fields are sent
+class StateTracker(object):
+    def __init__(self):
+        self.last = {}
+        self.sent = 0
+        self.skipped = 0
+
+    # Mask of the fields in values that differ from the last published state,
+    # 0 if the update can be skipped. The new values count as published.
+    # Changes confined to the fields in hold are not published yet, they go
+    # out with the next update that changes anything else.
+    def changes(self, values, hold=0):
+        mask = 0
+        last = self.last
+        for name, value in values.items():
+            if name not in last or last[name] != value:
+                mask |= FIELDS[name][0]
+        if mask and not mask & ~hold:
+            mask = 0
+        if mask:
+            last.update(values)
+            self.sent += 1
+        else:
+            self.skipped += 1
+        return mask
+
+    # Send everything again on the next update, e.g. after the OSD restarted
+    def reset(self):
+        self.last.clear()
+
+
+# Decode a frame (as the OSD does) into (seq, {field: value}) holding only the
+# masked fields, or None if data does not start with a complete frame
+def decode(data):
+    if len(data) < HEADER_SIZE:
+        return None
+    magic, version, length, seq, mask = struct.unpack_from('<IHHII', data)
+    if magic != MAGIC or length < HEADER_SIZE or length > len(data):
+        return None
+    if length < OSD_FRAME.size:
+        data = bytes(data[:length]) + b'\0' * (OSD_FRAME.size - length)
+    (magic, version, length, seq, mask, voltage, temp, battery, wifi, audio,
+     low_battery, flags) = OSD_FRAME.unpack_from(data)
+    numbers = {'voltage': voltage, 'battery': battery, 'temp': temp / 10.0, 'wifi': wifi,
+               'audio': audio, 'low_battery': low_battery}
+    values = {}
+    for name, (bit, flag) in FIELDS.items():
+        if mask & bit:
+            values[name] = bool(flags & flag) if flag is not None else numbers[name]
+    return seq, values
@@ -0,0 +1,80 @@
+#
+# OSD state published through shared memory.
+#
+# The monitor keeps its latest OSD frame (see osdproto) in a small file under
+# /dev/shm that the OSD maps read only and reads whenever it renders. The
+# block is guarded by a seqlock: the counter is odd while the frame is being
+# rewritten, and a reader retries until it sees the same even value before and
+# after its copy, so it never uses a torn frame.
+#
+#   u32 seq       seqlock counter
+#   u32 reserved
+#   ...           struct osd_frame, as in osd/osd_frame.h
+#
+# Python has no memory fences. The writer takes and releases a private pthread
+# mutex around the frame copy instead, which POSIX defines as a full memory
+# barrier, so the counter and the frame reach other cores in order.
+#
+import ctypes
+import ctypes.util
+import mmap
+import os
+import struct
+
+from oneforall.osdproto import OSD_FRAME
+
+SEQ = struct.Struct('<I')
+STATE_OFFSET = 8
+SHM_SIZE = STATE_OFFSET + OSD_FRAME.size
+
+try:
+    _libpthread = ctypes.CDLL(ctypes.util.find_library('pthread') or None)
+    _fence_mutex = ctypes.create_string_buffer(64)  # zeroed is PTHREAD_MUTEX_INITIALIZER
+
+    def _fence():
+        _libpthread.pthread_mutex_lock(_fence_mutex)
+        _libpthread.pthread_mutex_unlock(_fence_mutex)
+except (OSError, AttributeError):
+    def _fence():
+        pass
+
+
+class SharedState(object):
+    def __init__(self, path='/dev/shm/oneforall-osd'):
+        self.path = path
+        self.seq = 0
+        self.publishes = 0
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, SHM_SIZE)
+            self._map = mmap.mmap(fd, SHM_SIZE)
+        finally:
+            os.close(fd)
+
+    # Replace the published frame, readers see either the old or the new one
+    def publish(self, frame):
+        self._map[0:SEQ.size] = SEQ.pack(self.seq + 1)
+        _fence()
+        self._map[STATE_OFFSET:STATE_OFFSET + len(frame)] = bytes(frame)
+        _fence()
+        self.seq += 2
+        self._map[0:SEQ.size] = SEQ.pack(self.seq)
+        self.publishes += 1
+
+    # Consistent copy of the published frame, as the OSD reads it
+    def snapshot(self):
+        while True:
+            seq = SEQ.unpack(self._map[0:SEQ.size])[0]
+            if seq & 1:
+                continue
+            frame = self._map[STATE_OFFSET:SHM_SIZE]
+            if SEQ.unpack(self._map[0:SEQ.size])[0] == seq:
+                return frame
+
+    def close(self, unlink=True):
+        self._map.close()
+        if unlink:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
@@ -0,0 +1,184 @@
+#
+# Single threaded event loop for the monitor daemon.
+#
+# One thread waits in poll() on every event source (GPIO line request,
+# rfkill, mixer) and runs timers from a heap, so handlers never run
+# concurrently and the daemon's globals need no locks. Work that has to start
+# on another thread (RPi.GPIO callbacks, background commands) is handed over
+# with call_soon_threadsafe(), which wakes the loop through a pipe.
+#
+# This plays the role asyncio would on Python 3, but runs on the Python 2
+# interpreter the scripts target. Sources are plain ready callbacks rather
+# than coroutines.
+#
+# Timers run on clock(), monotonic_ns unless the caller swaps in another one;
+# code that compares times with timer deadlines reads it through now(). A
+# fast trace replay runs them on the trace's clock: it sets its timers aside
+# with take_timers(), calls run_timers() up to each record and puts the live
+# ones back afterwards.
+#
+import errno
+import fcntl
+import heapq
+import logging
+import os
+import select
+import threading
+from collections import deque
+
+from oneforall.monoclock import monotonic_ns
+
+
+class Timer(object):
+    __slots__ = ('deadline', 'callback', 'args', 'interval', 'cancelled')
+
+    def __init__(self, deadline, callback, args, interval=None):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Reactor(object):
+    def __init__(self, clock=monotonic_ns):
+        self.clock = clock
+        self._poller = select.poll()
+        self._readers = {}
+        self._timers = []
+        self._sequence = 0
+        self._calls = deque()
+        self._lock = threading.Lock()
+        self._running = False
+        self._wake_r, self._wake_w = os.pipe()
+        # A full pipe already guarantees a wake-up, never block on it
+        fcntl.fcntl(self._wake_w, fcntl.F_SETFL, fcntl.fcntl(self._wake_w, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self._poller.register(self._wake_r, select.POLLIN)
+        self.wakeups = 0
+        self.callbacks = 0
+
+    def now(self):
+        return self.clock()
+
+    # callback() runs on the loop whenever fd is readable
+    def add_reader(self, fd, callback):
+        self._readers[fd] = callback
+        self._poller.register(fd, select.POLLIN)
+
+    def remove_reader(self, fd):
+        if self._readers.pop(fd, None) is not None:
+            self._poller.unregister(fd)
+
+    def call_at(self, deadline_ns, callback, *args):
+        return self._schedule(Timer(deadline_ns, callback, args))
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.clock() + int(delay * 1e9), callback, *args)
+
+    # Run callback every interval seconds until the returned timer is
+    # cancelled. The callback may change timer.interval (in ns) to speed the
+    # timer up or slow it down.
+    def call_every(self, interval, callback, *args):
+        interval_ns = int(interval * 1e9)
+        return self._schedule(Timer(self.clock() + interval_ns, callback, args, interval_ns))
+
+    def _schedule(self, timer):
+        self._sequence += 1
+        heapq.heappush(self._timers, (timer.deadline, self._sequence, timer))
+        return timer
+
+    # Queue callback for the next loop pass. Safe from any thread.
+    def call_soon_threadsafe(self, callback, *args):
+        with self._lock:
+            self._calls.append((callback, args))
+        try:
+            os.write(self._wake_w, b'x')
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    call_soon = call_soon_threadsafe
+
+    # Deadline of the next timer, None without one
+    def next_deadline(self):
+        while self._timers and self._timers[0][2].cancelled:
+            heapq.heappop(self._timers)
+        return self._timers[0][0] if self._timers else None
+
+    # Remove every pending timer and return them, for add_timers()
+    def take_timers(self):
+        timers = [timer for deadline, sequence, timer in sorted(self._timers) if not timer.cancelled]
+        self._timers = []
+        return timers
+
+    # Schedule timers from take_timers() again, shift_ns later
+    def add_timers(self, timers, shift_ns=0):
+        for timer in timers:
+            timer.deadline += shift_ns
+            self._schedule(timer)
+
+    def _timeout_ms(self):
+        deadline = self.next_deadline()
+        if self._calls:
+            return 0
+        if deadline is None:
+            return None
+        # Round up, waking early would just spin until the deadline
+        return max(0, -(-(deadline - self.clock()) // 1000000))
+
+    def _call(self, callback, args):
+        self.callbacks += 1
+        try:
+            callback(*args)
+        except Exception:
+            logging.exception("Event loop callback {} failed".format(getattr(callback, '__name__', callback)))
+
+    # One pass: wait for the next event or timer, then run what is ready
+    def run_once(self):
+        try:
+            ready = self._poller.poll(self._timeout_ms())
+        except (IOError, OSError, select.error) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            ready = []
+        self.wakeups += 1
+        for fd, mask in ready:
+            if fd == self._wake_r:
+                os.read(self._wake_r, 4096)
+                continue
+            callback = self._readers.get(fd)
+            if callback is not None:
+                self._call(callback, ())
+
+        with self._lock:
+            calls = list(self._calls)
+            self._calls.clear()
+        for callback, args in calls:
+            self._call(callback, args)
+        self.run_timers(self.clock())
+
+    # Run the timers due by now_ns in deadline order
+    def run_timers(self, now):
+        while self._timers and self._timers[0][0] <= now:
+            deadline, sequence, timer = heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+            self._call(timer.callback, timer.args)
+            if timer.interval is not None and not timer.cancelled:
+                # Keep the cadence, but skip runs missed during a stall
+                timer.deadline = deadline + timer.interval
+                if timer.deadline <= now:
+                    timer.deadline = now + timer.interval
+                self._schedule(timer)
+
+    def run(self):
+        self._running = True
+        while self._running:
+            self.run_once()
+
+    def stop(self):
+        self._running = False
+        self.call_soon_threadsafe(lambda: None)
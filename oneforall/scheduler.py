@@ -0,0 +1,182 @@
+#
+# Adaptive per-sensor polling on the event loop (oneforall.reactor).
+#
+# Every sensor has its own poll function and a timer. After each poll a
+# policy looks at the new reading and picks the next interval, which is kept
+# within the sensor's [min_interval, max_interval]. A sensor may also have a
+# cost budget, the share of wall time its polls may take (0.01 is 1%); when
+# the measured cost of a poll would exceed it, the interval is stretched to
+# fit whatever the policy asked for.
+#
+# rates() reports the effective poll rate of every sensor since the previous
+# call, so the log shows what the policies actually settled on.
+#
+# A sensor with an idle_interval is polled at most that often while the
+# scheduler is idle (set_idle(), see oneforall.idle), and right away at its
+# fastest rate when it leaves idle.
+#
+import logging
+
+from oneforall.monoclock import monotonic_ns
+
+
+class Backoff(object):
+    # Poll at the sensor's fastest rate while readings change, then double the
+    # interval each time idle_after seconds pass without a change, on clock()
+    def __init__(self, idle_after, changed=None, clock=monotonic_ns):
+        self.idle_after = idle_after
+        self.changed = changed if changed is not None else (lambda old, new: old != new)
+        self.clock = clock
+        self._last = None
+        self._since = None
+
+    def __call__(self, sensor, value):
+        now = self.clock()
+        if self._since is None or self.changed(self._last, value):
+            self._last = value
+            self._since = now
+            return sensor.min_interval
+        if now - self._since < self.idle_after * 1e9:
+            return sensor.interval
+        self._since = now
+        return sensor.interval * 2
+
+
+class Approach(object):
+    # Poll faster the closer a reading gets to threshold: max_interval at
+    # span or more above it, min_interval at or below it, linear in between.
+    # A jump of more than jitter between two readings, or a reading that is
+    # not yet trusted (trusted() False), also polls at min_interval.
+    def __init__(self, threshold, span, jitter=None, trusted=None):
+        self.threshold = threshold
+        self.span = float(span)
+        self.jitter = jitter
+        self.trusted = trusted
+        self._last = None
+
+    def __call__(self, sensor, value):
+        last, self._last = self._last, value
+        if value is None or (self.trusted is not None and not self.trusted()):
+            return sensor.min_interval
+        if self.jitter is not None and last is not None and abs(value - last) > self.jitter:
+            return sensor.min_interval
+        distance = min(max((value - self.threshold) / self.span, 0.0), 1.0)
+        return sensor.min_interval + (sensor.max_interval - sensor.min_interval) * distance
+
+
+class Sensor(object):
+    # poll() returns the reading handed to policy(sensor, value), which
+    # returns the next interval in seconds. Without a policy the interval
+    # stays fixed.
+    def __init__(self, name, poll, interval, min_interval=None, max_interval=None,
+                 policy=None, budget=None, idle_interval=None):
+        self.name = name
+        self.poll = poll
+        self.min_interval = interval if min_interval is None else min_interval
+        self.max_interval = interval if max_interval is None else max_interval
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        self.policy = policy
+        self.budget = budget
+        self.idle_interval = idle_interval
+        self.idle = False
+        self.polls = 0
+        self.errors = 0
+        self.cost_ns = 0
+        self.max_cost_ns = 0
+        self.timer = None
+        self._rate_polls = 0
+        self._rate_cost_ns = 0
+        self._rate_start = monotonic_ns()
+
+    def _clamp(self, interval):
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        if self.budget and self.polls:
+            # Never stretch past max_interval, a sensor still has to be read
+            interval = min(max(interval, self.cost_ns / 1e9 / self.polls / self.budget), self.max_interval)
+        if self.idle:
+            interval = max(interval, self.idle_interval)
+        return interval
+
+    def run(self):
+        start = monotonic_ns()
+        try:
+            value = self.poll()
+        except Exception:
+            self.errors += 1
+            logging.exception("Polling {} failed".format(self.name))
+            return
+        finally:
+            cost = monotonic_ns() - start
+            self.polls += 1
+            self.cost_ns += cost
+            self.max_cost_ns = max(self.max_cost_ns, cost)
+            self._rate_polls += 1
+            self._rate_cost_ns += cost
+        self.set_interval(self.interval if self.policy is None else self.policy(self, value))
+
+    def set_interval(self, interval):
+        self.interval = self._clamp(interval)
+        if self.timer is not None:
+            self.timer.interval = int(self.interval * 1e9)
+
+    # (polls per second, mean cost in seconds) since the previous call
+    def rate(self):
+        now = monotonic_ns()
+        elapsed = now - self._rate_start
+        rate = self._rate_polls * 1e9 / elapsed if elapsed > 0 else 0.0
+        cost = self._rate_cost_ns / 1e9 / self._rate_polls if self._rate_polls else 0.0
+        self._rate_polls = 0
+        self._rate_cost_ns = 0
+        self._rate_start = now
+        return rate, cost
+
+
+class PollScheduler(object):
+    def __init__(self, reactor):
+        self.reactor = reactor
+        self.sensors = {}
+
+    # Start polling sensor, first right away unless delay (seconds) is given
+    def add(self, sensor, delay=0):
+        self.remove(sensor.name)
+        self.sensors[sensor.name] = sensor
+        sensor.timer = self.reactor.call_later(delay, self._first, sensor)
+        return sensor
+
+    def _first(self, sensor):
+        sensor.timer = self.reactor.call_every(sensor.interval, sensor.run)
+        sensor.run()
+
+    def remove(self, name):
+        sensor = self.sensors.pop(name, None)
+        if sensor is not None and sensor.timer is not None:
+            sensor.timer.cancel()
+            sensor.timer = None
+
+    # Poll name on the next loop pass and restart at its fastest rate, for
+    # when something else (a hotkey, an rfkill event) suggests it changed
+    def poke(self, name):
+        sensor = self.sensors.get(name)
+        if sensor is not None:
+            sensor.set_interval(sensor.min_interval)
+            self.add(sensor)
+
+    # Slow every sensor with an idle_interval down to it, or poll them all
+    # right away and at full rate again
+    def set_idle(self, idle):
+        for sensor in list(self.sensors.values()):
+            if sensor.idle_interval is None:
+                continue
+            sensor.idle = idle
+            if idle:
+                sensor.set_interval(sensor.interval)
+            else:
+                self.poke(sensor.name)
+
+    # name -> (polls per second, mean cost in seconds, current interval)
+    def rates(self):
+        return dict((name, sensor.rate() + (sensor.interval,)) for name, sensor in self.sensors.items())
+
+    def report(self):
+        return ', '.join('{} {:.2f}/s ({:.2f} ms, every {:.2f} s)'.format(name, rate, cost * 1000, interval)
+                         for name, (rate, cost, interval) in sorted(self.rates().items()))
@@ -0,0 +1,294 @@
+#
+# Simulated hardware for the monitor, see oneforall.hal for the interfaces.
+#
+# The stand-ins are scriptable: edges are injected on SimPins, voltages and
+# stick positions set on SimADC, and what the daemon produces is captured by
+# SimInputDevice (uinput frames), SimOSD (decoded OSD state) and SimShell
+# (system commands, never run). SimRfkill answers block requests the way the
+# kernel does. Injection is safe from any thread.
+#
+# Run the daemon on them with
+#
+#   monitor_evdev.py --simulate [script.py]
+#
+# The script is run in the monitor's namespace on the event loop once startup
+# completed (oneforall.startup), so it can schedule injections on loop and
+# call the monitor's own functions.
+#
+import os
+import random
+import socket
+import struct
+import threading
+from collections import deque, namedtuple
+
+from oneforall.hal import Edge, read_ready
+from oneforall.monoclock import monotonic_ns
+from oneforall.osdproto import decode
+from oneforall.rfkill import (RFKILL_EVENT, RFKILL_OP_ADD, RFKILL_OP_CHANGE, RFKILL_OP_CHANGE_ALL,
+                              RFKILL_TYPE_ALL, RFKILL_TYPE_BLUETOOTH, RFKILL_TYPE_WLAN)
+
+# ADS1015 full scale voltage per gain
+ADS1015_FULL_SCALE = {2 / 3.0: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
+
+Frame = namedtuple('Frame', 'timestamp_ns events')
+
+
+class SimPins(object):
+    # Inputs idle high (pulled up), a pressed button reads 0
+    exact = True
+
+    def __init__(self, pins, levels=None):
+        self.levels = dict((pin, 1) for pin in pins)
+        self.levels.update(levels or {})
+        self.edges = 0
+        self._reactor = None
+        self._on_edges = None
+        self._lock = threading.Lock()
+        self._batch = []
+
+    def read(self, pin):
+        return self.levels[pin]
+
+    def attach(self, reactor, on_edges):
+        self._reactor = reactor
+        self._on_edges = on_edges
+
+    # Queue an edge, delivered on the next loop pass together with every
+    # other edge queued before it, like one read of a line request
+    def set(self, pin, level, timestamp_ns=None):
+        if pin not in self.levels:
+            raise KeyError('Pin {} is not simulated'.format(pin))
+        edge = Edge(pin, level, monotonic_ns() if timestamp_ns is None else timestamp_ns)
+        with self._lock:
+            self._batch.append(edge)
+            first = len(self._batch) == 1
+        if first and self._reactor is not None:
+            self._reactor.call_soon_threadsafe(self._deliver)
+
+    def press(self, pin, timestamp_ns=None):
+        self.set(pin, 0, timestamp_ns)
+
+    def release(self, pin, timestamp_ns=None):
+        self.set(pin, 1, timestamp_ns)
+
+    # count extra contact bounces spacing_us apart, settling on level
+    def bounce(self, pin, level, count=3, spacing_us=200):
+        start = monotonic_ns()
+        for i in range(count * 2 + 1):
+            self.set(pin, level if i % 2 == 0 else 1 - level, start + i * spacing_us * 1000)
+
+    def _deliver(self):
+        with self._lock:
+            batch, self._batch = self._batch, []
+        for edge in batch:
+            self.levels[edge.pin] = edge.level
+        self.edges += len(batch)
+        if batch and self._on_edges is not None:
+            self._on_edges(batch)
+
+    def close(self):
+        self._on_edges = None
+
+
+class SimADC(object):
+    # A channel holds a raw reading or a callable(timestamp_ns) returning one,
+    # for sweeps and stick motion. noise adds up to +-noise counts per read
+    # from a seeded generator, so runs repeat exactly. Readings queued with
+    # feed() (a replayed trace) are returned first, in order.
+    def __init__(self, values=None, noise=0, seed=0):
+        self.values = dict(values or {})
+        self.noise = noise
+        self.reads = 0
+        self._random = random.Random(seed)
+        self._queues = {}
+
+    def set(self, channel, value):
+        self.values[channel] = value
+
+    def set_volts(self, channel, volts, gain=1):
+        self.values[channel] = int(volts / ADS1015_FULL_SCALE[gain] * 2047)
+
+    # Queue a reading for a later read, the channel keeps the last one
+    def feed(self, channel, value):
+        self._queues.setdefault(channel, deque()).append(value)
+
+    def queued(self, channel):
+        return len(self._queues.get(channel, ()))
+
+    def read_adc(self, channel, gain=1, data_rate=None):
+        self.reads += 1
+        queue = self._queues.get(channel)
+        if queue:
+            self.values[channel] = queue.popleft()
+            return self.values[channel]
+        value = self.values.get(channel, 0)
+        if callable(value):
+            value = value(monotonic_ns())
+        if self.noise:
+            value += self._random.randint(-self.noise, self.noise)
+        return max(-2048, min(2047, int(value)))
+
+    def start_adc(self, channel, gain=1, data_rate=None):
+        return self.read_adc(channel, gain, data_rate)
+
+    def stop_adc(self):
+        pass
+
+
+class SimInputDevice(object):
+    # Captures python-uinput style emits as frames, one per syn()
+    def __init__(self, events=(), name='sim'):
+        self.name = name
+        self.capabilities = list(events)
+        self.frames = []
+        self.events = 0
+        self.state = {}
+        self.keep = True
+        self._pending = []
+
+    def emit(self, event, value, syn=True):
+        self._pending.append((event[0], event[1], value))
+        if syn:
+            self.syn()
+
+    def syn(self):
+        pending, self._pending = self._pending, []
+        for event_type, code, value in pending:
+            self.state[(event_type, code)] = value
+        self.events += len(pending)
+        if self.keep:
+            self.frames.append(Frame(monotonic_ns(), pending))
+
+    def clear(self):
+        self.frames = []
+        self.events = 0
+
+    def close(self):
+        pass
+
+
+class SimOSD(object):
+    # Decodes the binary frames the monitor writes, state holds every field
+    # as the OSD would know it
+    def __init__(self):
+        self.args = None
+        self.state = {}
+        self.frames = 0
+        self.writes = 0
+        self.wakes = 0
+        self.bytes = 0
+        self.running = False
+        self.ready_fd = None
+
+    # Up at once, the readiness line is waiting when the monitor looks
+    def start(self, args):
+        self.args = list(args)
+        self.running = True
+        self.ready_fd, ready_w = os.pipe()
+        os.write(ready_w, b'ready\n')
+        os.close(ready_w)
+
+    def read_ready(self):
+        return read_ready(self.ready_fd)
+
+    def write(self, data):
+        data = bytes(data)
+        self.writes += 1
+        self.bytes += len(data)
+        while data:
+            if data[:1] == b'\n':
+                self.wakes += 1
+                data = data[1:]
+                continue
+            frame = decode(data)
+            if frame is None:
+                raise ValueError('Undecodable OSD write {!r}'.format(data[:16]))
+            self.state.update(frame[1])
+            self.frames += 1
+            data = data[struct.unpack_from('<H', data, 6)[0]:]
+
+    def poll(self):
+        return None if self.running else 0
+
+    def terminate(self):
+        self.running = False
+
+
+class SimShell(object):
+    # Records commands instead of running them. output() answers from
+    # responses, keyed by the command as a string, or returns ''.
+    def __init__(self, responses=None):
+        self.commands = []
+        self.responses = dict(responses or {})
+
+    def _record(self, command):
+        command = command if isinstance(command, str) else ' '.join(command)
+        self.commands.append(command)
+        return command
+
+    def system(self, command):
+        self._record(command)
+        return 0
+
+    def call(self, command, shell=False):
+        self._record(command)
+
+    def output(self, command):
+        return self.responses.get(self._record(command), '')
+
+
+class SimRfkill(object):
+    # One Wi-Fi and one Bluetooth switch behind a socketpair. Hand fd to
+    # RfkillControl; block requests written to it are answered with CHANGE
+    # records once attached to the loop, and switch() flips one as a
+    # hardware switch would.
+    def __init__(self, blocked=False):
+        pair = socket.socketpair()
+        self.fd, self._peer = [os.dup(s.fileno()) for s in pair]
+        for s in pair:
+            s.close()
+        for fd in (self.fd, self._peer):
+            _nonblocking(fd)
+        self.devices = {0: [RFKILL_TYPE_WLAN, blocked, False], 1: [RFKILL_TYPE_BLUETOOTH, blocked, False]}
+        self.requests = 0
+        for idx in self.devices:
+            self._send(idx, RFKILL_OP_ADD)
+
+    def attach(self, reactor):
+        reactor.add_reader(self._peer, self._request)
+
+    def _send(self, idx, op):
+        radio, soft, hard = self.devices[idx]
+        os.write(self._peer, RFKILL_EVENT.pack(idx, radio, op, int(soft), int(hard)))
+
+    def _request(self):
+        data = os.read(self._peer, 64)
+        for offset in range(0, len(data) - RFKILL_EVENT.size + 1, RFKILL_EVENT.size):
+            idx, radio, op, soft, hard = RFKILL_EVENT.unpack(data[offset:offset + RFKILL_EVENT.size])
+            if op != RFKILL_OP_CHANGE_ALL:
+                continue
+            self.requests += 1
+            for idx, device in self.devices.items():
+                if radio in (RFKILL_TYPE_ALL, device[0]) and device[1] != bool(soft):
+                    device[1] = bool(soft)
+                    self._send(idx, RFKILL_OP_CHANGE)
+
+    def switch(self, radio, blocked):
+        for idx, device in self.devices.items():
+            if device[0] == radio:
+                device[2] = bool(blocked)
+                self._send(idx, RFKILL_OP_CHANGE)
+
+
+def _nonblocking(fd):
+    import fcntl
+
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+
+# Run a simulation script in namespace (the monitor's globals)
+def run_script(path, namespace):
+    with open(path) as f:
+        code = compile(f.read(), path, 'exec')
+    exec(code, namespace)
@@ -0,0 +1,85 @@
+#
+# Staged daemon startup.
+#
+# The monitor brings up what input needs first and starts its loop right
+# away; everything slower becomes a step that completes later on the loop:
+#
+#   phase(name)                a synchronous step that just finished
+#   probe(name, fn, on_result) fn() runs on its own thread, on_result(value)
+#                              on the loop once it returns
+#   begin(name) / end(name)    a step completed by some other event (the OSD
+#                              signalling readiness)
+#
+# Each step is logged with its duration, and when_ready() callbacks run once
+# no step is left.
+#
+import logging
+import threading
+
+from oneforall.monoclock import monotonic_ns
+
+
+class Startup(object):
+    def __init__(self, reactor):
+        self.reactor = reactor
+        self.start = monotonic_ns()
+        self.steps = []
+        self.ready_ns = None
+        self._last = self.start
+        self._pending = {}
+        self._waiting = []
+
+    def _log(self, name, ns):
+        self.steps.append((name, ns))
+        logging.info('Startup {}: {:.1f} ms'.format(name, ns / 1e6))
+
+    def phase(self, name):
+        now = monotonic_ns()
+        self._log(name, now - self._last)
+        self._last = now
+
+    def begin(self, name):
+        self._pending[name] = monotonic_ns()
+
+    def end(self, name):
+        began = self._pending.pop(name, None)
+        if began is None:
+            return
+        self._log(name, monotonic_ns() - began)
+        if not self._pending:
+            self.ready_ns = monotonic_ns() - self.start
+            logging.info('Startup complete in {:.1f} ms'.format(self.ready_ns / 1e6))
+            waiting, self._waiting = self._waiting, []
+            for callback, args in waiting:
+                self.reactor.call_soon(callback, *args)
+
+    def pending(self, name):
+        return name in self._pending
+
+    def probe(self, name, fn, on_result):
+        self.begin(name)
+
+        def run():
+            try:
+                value = fn()
+            except Exception:
+                logging.exception("Startup probe {} failed".format(name))
+                self.reactor.call_soon_threadsafe(self.end, name)
+                return
+            self.reactor.call_soon_threadsafe(self._landed, name, on_result, value)
+
+        worker = threading.Thread(target=run, name='probe-' + name)
+        worker.daemon = True
+        worker.start()
+
+    def _landed(self, name, on_result, value):
+        try:
+            on_result(value)
+        finally:
+            self.end(name)
+
+    def when_ready(self, callback, *args):
+        if self._pending:
+            self._waiting.append((callback, args))
+        else:
+            self.reactor.call_soon(callback, *args)
@@ -0,0 +1,127 @@
+#
+# Joystick signal processing between the raw ADC counts and the uinput axis.
+#
+# Per axis: raw samples are smoothed with a One-Euro filter (heavy smoothing
+# when the stick is still, little lag when it moves), the resting center and
+# the travel extents are learned at runtime, and the result is mapped to an
+# axis value through a lookup table built once from the deadzone and response
+# curve. The per sample cost is a few float ops and one list index. Earlier
+# passes are not averaged in ahead of the filter, that would only add lag.
+#
+import math
+
+# Raw counts are quantised to this many LUT steps per side of center
+LUT_STEPS = 256
+
+# How fast the learned center follows the stick while it rests in the dead band
+CENTER_TRACKING = 0.01
+
+
+class OneEuroFilter(object):
+    # Casiez et al., "1 Euro Filter: A Simple Speed-based Low-pass Filter"
+    def __init__(self, min_cutoff=1.0, beta=0.007, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.x = None
+        self.dx = 0.0
+        self.t = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, value, t):
+        if self.x is None:
+            self.x = float(value)
+            self.t = t
+            return self.x
+        dt = t - self.t
+        if dt <= 0:
+            return self.x
+        self.t = t
+        a_d = self._alpha(self.d_cutoff, dt)
+        self.dx += a_d * ((value - self.x) / dt - self.dx)
+        cutoff = self.min_cutoff + self.beta * abs(self.dx)
+        self.x += self._alpha(cutoff, dt) * (value - self.x)
+        return self.x
+
+
+def build_lut(deadzone, curve, out_min, out_max):
+    # Maps a normalised deflection step (0..LUT_STEPS) to an axis offset.
+    # deadzone is a fraction of travel, curve an exponent (1 = linear).
+    half = (out_max - out_min) / 2.0
+    lut = []
+    for step in range(LUT_STEPS + 1):
+        x = step / float(LUT_STEPS)
+        if x <= deadzone:
+            lut.append(0)
+        else:
+            lut.append(int(round(half * ((x - deadzone) / (1.0 - deadzone)) ** curve)))
+    return lut
+
+
+class AxisProcessor(object):
+    # vcc is the full scale in raw counts and deadzone its dead band in counts
+    # either side of center, as in keys.cfg. out_min/out_max are the axis range.
+    # travel is the fraction of each half assumed reachable until the real
+    # extents have been seen.
+    def __init__(self, vcc, deadzone, out_min=0, out_max=None, curve=1.0, min_cutoff=1.0,
+                 beta=0.007, travel=0.8, invert=False):
+        if out_max is None:
+            out_max = vcc
+        self.out_min = out_min
+        self.out_max = out_max
+        self.out_center = (out_min + out_max) // 2
+        self.invert = invert
+        self.filter = OneEuroFilter(min_cutoff, beta)
+        self.deadzone = float(deadzone)
+        self._travel = travel * vcc / 2.0
+        self.calibrate(vcc / 2.0)
+        self._calibrated = False
+        self.lut = build_lut(deadzone / (vcc / 2.0), curve, out_min, out_max)
+
+    # Take value as the resting position and reset the travel around it
+    def calibrate(self, center):
+        self.center = float(center)
+        self.low = self.center - self._travel
+        self.high = self.center + self._travel
+        self._calibrated = True
+
+    # raw is an ADC count, timestamp_ns the time it was sampled
+    def process(self, raw, timestamp_ns):
+        if not self._calibrated:
+            # The stick is assumed to be at rest when sampling starts
+            self.calibrate(raw)
+        value = self.filter(raw, timestamp_ns / 1e9)
+
+        # Follow slow drift of the resting position
+        if abs(value - self.center) < self.deadzone:
+            self.center += CENTER_TRACKING * (value - self.center)
+
+        # Widen the travel whenever the stick goes further than seen so far
+        if value < self.low:
+            self.low = value
+        elif value > self.high:
+            self.high = value
+
+        if value >= self.center:
+            span = self.high - self.center
+            sign = 1
+        else:
+            span = self.center - self.low
+            sign = -1
+        if span <= 0:
+            return self.out_center
+        step = int(abs(value - self.center) * LUT_STEPS / span)
+        if step > LUT_STEPS:
+            step = LUT_STEPS
+        if self.invert:
+            sign = -sign
+        out = self.out_center + sign * self.lut[step]
+        if out < self.out_min:
+            return self.out_min
+        if out > self.out_max:
+            return self.out_max
+        return out
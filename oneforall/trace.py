@@ -0,0 +1,201 @@
+#
+# Compact binary traces of GPIO edges and ADC samples.
+#
+# A trace is a sequence of segments, one per recording session, appended to
+# the same file:
+#
+#   header  4s magic "OFAT", u16 version, u16 record size, u64 base ns
+#   record  u8 kind, u8 pin/channel, s16 level/raw value, s32 delta ns
+#
+# Deltas are taken from the previous record of the segment, in the order the
+# monitor saw the records (edges carry the kernel's timestamp, so they can
+# be a little older than an ADC read logged before them). A gap that does not
+# fit in 32 bits is written as a TIME record followed by a u64 timestamp.
+#
+# Recording wraps the pins and ADC backends of oneforall.hal, so it costs one
+# struct pack per edge or sample and a write() per few hundred of them. On a
+# backend that may miss edges (RPi.GPIO) the debouncer settles pins by reading
+# them, and those reads are recorded as READ records too.
+#
+#   monitor_evdev.py --replay trace [--fast]
+#
+# feeds a trace to the simulated hardware. At the original timing the live
+# loop samples it as usual; --fast runs it on the trace's own clock, so the
+# emitted frames are the same on every run (their sha1 is printed), and
+# RecordedReads answers the settle reads with the recorded levels. At the
+# original timing the simulated pins answer them, so a trace with reads only
+# replays approximately there.
+#
+import os
+import struct
+from collections import deque, namedtuple
+
+from oneforall.monoclock import monotonic_ns
+
+MAGIC = b'OFAT'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQ')
+RECORD = struct.Struct('<BBhi')
+TIMESTAMP = struct.Struct('<Q')
+
+KIND_EDGE = 1
+KIND_ADC = 2
+KIND_TIME = 3
+KIND_READ = 4
+
+DELTA_MIN = -(1 << 31)
+DELTA_MAX = (1 << 31) - 1
+FLUSH_SIZE = 4096
+
+Record = namedtuple('Record', 'kind timestamp_ns source value')
+
+
+class TraceRecorder(object):
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._buffer = bytearray()
+        self._last = None
+
+    def _add(self, kind, source, value, timestamp_ns):
+        if self._last is None:
+            self._buffer += HEADER.pack(MAGIC, VERSION, RECORD.size, timestamp_ns)
+            self._last = timestamp_ns
+        delta = timestamp_ns - self._last
+        if not DELTA_MIN <= delta <= DELTA_MAX:
+            self._buffer += RECORD.pack(KIND_TIME, 0, 0, 0) + TIMESTAMP.pack(timestamp_ns)
+            delta = 0
+        self._buffer += RECORD.pack(kind, source, value, delta)
+        self._last = timestamp_ns
+        self.records += 1
+        if len(self._buffer) >= FLUSH_SIZE:
+            self.flush()
+
+    def edge(self, pin, level, timestamp_ns):
+        self._add(KIND_EDGE, pin, level, timestamp_ns)
+
+    def adc(self, channel, value, timestamp_ns):
+        self._add(KIND_ADC, channel, value, timestamp_ns)
+
+    def read(self, pin, level, timestamp_ns):
+        self._add(KIND_READ, pin, level, timestamp_ns)
+
+    def flush(self):
+        if self._buffer:
+            os.write(self._fd, bytes(self._buffer))
+            del self._buffer[:]
+
+    def close(self):
+        if self._fd is not None:
+            self.flush()
+            os.close(self._fd)
+            self._fd = None
+
+
+# Every Record of a trace file, in recorded order
+def read_trace(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = []
+    offset = 0
+    size = RECORD.size
+    last = 0
+    while offset < len(data):
+        if data[offset:offset + len(MAGIC)] == MAGIC:
+            magic, version, size, last = HEADER.unpack_from(data, offset)
+            if version != VERSION:
+                raise ValueError('Unsupported trace version {} at offset {}'.format(version, offset))
+            offset += HEADER.size
+            continue
+        if offset + size > len(data):
+            break  # cut short by a crash, keep what is complete
+        kind, source, value, delta = RECORD.unpack_from(data, offset)
+        offset += size
+        if kind == KIND_TIME:
+            if offset + TIMESTAMP.size > len(data):
+                break
+            last = TIMESTAMP.unpack_from(data, offset)[0]
+            offset += TIMESTAMP.size
+            continue
+        last += delta
+        records.append(Record(kind, last, source, value))
+    return records
+
+
+class RecordingPins(object):
+    # Logs every edge a pins backend delivers, then passes the batch on, and
+    # the level reads made on a backend that may miss edges. Anything else
+    # goes to the backend, so simulated pins stay scriptable.
+    def __init__(self, pins, recorder):
+        self.pins = pins
+        self.recorder = recorder
+        self.exact = pins.exact
+
+    def read(self, pin):
+        level = self.pins.read(pin)
+        if not self.exact:
+            self.recorder.read(pin, level, monotonic_ns())
+        return level
+
+    def attach(self, reactor, on_edges):
+        def recorded(events):
+            for event in events:
+                self.recorder.edge(event.pin, event.level, event.timestamp_ns)
+            on_edges(events)
+
+        self.pins.attach(reactor, recorded)
+
+    def close(self):
+        self.pins.close()
+
+    def __getattr__(self, name):
+        return getattr(self.pins, name)
+
+
+class RecordedReads(object):
+    # Answers the settle reads of a fast replay from the READ records of a
+    # trace. A read at clock() gets the first level recorded for that pin at
+    # or after it; live reads happen a little after the deadline the replay
+    # runs them at. Pins without such a record fall back to fallback(pin).
+    def __init__(self, records, clock, fallback):
+        self.clock = clock
+        self.fallback = fallback
+        self.count = 0
+        self._queues = {}
+        for record in records:
+            if record.kind == KIND_READ:
+                self._queues.setdefault(record.source, deque()).append(record)
+                self.count += 1
+
+    def read(self, pin):
+        now = self.clock()
+        queue = self._queues.get(pin)
+        while queue and queue[0].timestamp_ns < now:
+            queue.popleft()
+        if queue:
+            return queue.popleft().value
+        return self.fallback(pin)
+
+
+class RecordingADC(object):
+    # Logs every conversion result of an ADS1015 backend
+    def __init__(self, adc, recorder):
+        self.adc = adc
+        self.recorder = recorder
+
+    def read_adc(self, channel, gain=1, data_rate=None):
+        value = self.adc.read_adc(channel, gain=gain, data_rate=data_rate)
+        self.recorder.adc(channel, value, monotonic_ns())
+        return value
+
+    def start_adc(self, channel, gain=1, data_rate=None):
+        value = self.adc.start_adc(channel, gain=gain, data_rate=data_rate)
+        self.recorder.adc(channel, value, monotonic_ns())
+        return value
+
+    def stop_adc(self):
+        self.adc.stop_adc()
+
+    def __getattr__(self, name):
+        return getattr(self.adc, name)
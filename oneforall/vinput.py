@@ -0,0 +1,156 @@
+#
+# Virtual input device backends.
+#
+# Every backend creates the gamepad on /dev/uinput and looks like a
+# python-uinput Device to the rest of the monitor: emit(event, value,
+# syn=True), syn(), close(), plus fd, the /dev/uinput descriptor the
+# FrameEmitter writes whole frames to in one write(). Events are evcodes
+# tuples, (type, code) or (EV_ABS, code, min, max, fuzz, flat).
+#
+#   UINPUT  python-uinput (libsuinput)
+#   EVDEV   python-evdev's UInput
+#   RAW     the uinput ioctls driven from here, needs no library at all
+#
+# Only EVDEV declares force feedback (FF_RUMBLE in events), as the old EVDEV
+# monitor did for emulators that look for a rumble pad. The kernel hands
+# effect uploads to the device and the uploading game waits for the answer,
+# so handle_ff() must run whenever fd is readable. There is no motor: effects
+# are accepted and never played. The other backends leave EV_FF out.
+#
+# The library of a backend is imported when it is opened, not at import.
+#
+import fcntl
+import os
+import struct
+
+from oneforall.emitter import INPUT_EVENT, EV_SYN, SYN_REPORT
+from oneforall.evcodes import EV_ABS, EV_FF, EV_KEY, EV_UINPUT, UI_FF_ERASE, UI_FF_UPLOAD
+
+BACKENDS = ('UINPUT', 'EVDEV', 'RAW')
+
+BUS_USB = 0x03
+UINPUT_PATH = '/dev/uinput'
+
+# linux/uinput.h
+UI_DEV_CREATE = 0x5501
+UI_DEV_DESTROY = 0x5502
+UI_SET_EVBIT = 0x40045564
+UI_SET_KEYBIT = 0x40045565
+UI_SET_ABSBIT = 0x40045567
+ABS_CNT = 64
+# struct uinput_user_dev: name, struct input_id, ff_effects_max and the
+# absmax/absmin/absfuzz/absflat arrays
+UINPUT_USER_DEV = struct.Struct('80sHHHHi{0}i{0}i{0}i{0}i'.format(ABS_CNT))
+
+
+def _split(events):
+    keys = [event[1] for event in events if event[0] == EV_KEY]
+    axes = [(event[1],) + tuple(event[2:6]) + (0, 0, 0, 0)[len(event) - 2:] for event in events
+            if event[0] == EV_ABS]
+    return keys, axes
+
+
+class _FdDevice(object):
+    # emit() and syn() for backends that hold the /dev/uinput fd
+    def emit(self, event, value, syn=True):
+        data = INPUT_EVENT.pack(0, 0, event[0], event[1], value)
+        if syn:
+            data += INPUT_EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+        os.write(self.fd, data)
+
+    def syn(self):
+        os.write(self.fd, INPUT_EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0))
+
+
+class UinputDevice(object):
+    def __init__(self, events, name, version=0x3):
+        import uinput
+
+        self.fd = uinput.fdopen()
+        events = [event for event in events if event[0] != EV_FF]
+        self.device = uinput.Device(events, name=name, version=version, fd=self.fd)
+
+    def emit(self, event, value, syn=True):
+        self.device.emit(event, value, syn=syn)
+
+    def syn(self):
+        self.device.syn()
+
+    def close(self):
+        self.device.destroy()
+
+
+class EvdevDevice(_FdDevice):
+    def __init__(self, events, name, version=0x3):
+        from evdev import AbsInfo, UInput
+
+        keys, axes = _split(events)
+        capabilities = {EV_KEY: keys}
+        if axes:
+            capabilities[EV_ABS] = [(code, AbsInfo(value=0, min=low, max=high, fuzz=fuzz, flat=flat, resolution=0))
+                                    for code, low, high, fuzz, flat in axes]
+        effects = [event[1] for event in events if event[0] == EV_FF]
+        if effects:
+            capabilities[EV_FF] = effects
+        self.ui = UInput(capabilities, name=name, version=version, bustype=BUS_USB)
+        self.fd = self.ui.fd
+
+    # Answer the kernel's force feedback requests, call when fd is readable
+    def handle_ff(self):
+        try:
+            events = list(self.ui.read())
+        except (IOError, OSError):
+            return
+        for event in events:
+            if event.type != EV_UINPUT:
+                continue
+            if event.code == UI_FF_UPLOAD:
+                upload = self.ui.begin_upload(event.value)
+                upload.retval = 0
+                self.ui.end_upload(upload)
+            elif event.code == UI_FF_ERASE:
+                erase = self.ui.begin_erase(event.value)
+                erase.retval = 0
+                self.ui.end_erase(erase)
+
+    def close(self):
+        self.ui.close()
+
+
+class RawDevice(_FdDevice):
+    # Legacy uinput_user_dev setup, every kernel with uinput understands it
+    def __init__(self, events, name, version=0x3, path=UINPUT_PATH):
+        keys, axes = _split(events)
+        self.fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        try:
+            absmax, absmin, absfuzz, absflat = [[0] * ABS_CNT for i in range(4)]
+            if keys:
+                fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_KEY)
+            for code in keys:
+                fcntl.ioctl(self.fd, UI_SET_KEYBIT, code)
+            if axes:
+                fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_ABS)
+            for code, low, high, fuzz, flat in axes:
+                fcntl.ioctl(self.fd, UI_SET_ABSBIT, code)
+                absmin[code], absmax[code], absfuzz[code], absflat[code] = low, high, fuzz, flat
+            os.write(self.fd, UINPUT_USER_DEV.pack(name.encode('ascii')[:79], BUS_USB, 0, 0, version, 0,
+                                                   *(absmax + absmin + absfuzz + absflat)))
+            fcntl.ioctl(self.fd, UI_DEV_CREATE)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def close(self):
+        if self.fd is not None:
+            fcntl.ioctl(self.fd, UI_DEV_DESTROY)
+            os.close(self.fd)
+            self.fd = None
+
+
+DEVICES = {'UINPUT': UinputDevice, 'EVDEV': EvdevDevice, 'RAW': RawDevice}
+
+
+def open_device(backend, events, name):
+    if backend not in DEVICES:
+        raise ValueError('Unknown input backend {}, pick from {}'.format(backend, ', '.join(BACKENDS)))
+    return DEVICES[backend](list(events), name)
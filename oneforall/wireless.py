@@ -0,0 +1,109 @@
+#
+# Wi-Fi signal strength from /proc/net/wireless, read in process.
+#
+# The file is kept open and re-read into one preallocated buffer; interface
+# lines are located with find() and the link/level columns are parsed by
+# walking the bytes, so a refresh makes no per line strings or lists.
+# Results are cached for ttl seconds.
+#
+#   Inter-| sta-|   Quality        |   Discarded packets               | Missed | WE
+#    face | tus | link level noise |  nwid  crypt   frag  retry   misc | beacon | 22
+#    wlan0: 0000   54.  -56.  -256        0      0      0      0     33        0
+#
+import io
+
+from oneforall.monoclock import monotonic_ns
+
+BUFFER_SIZE = 4096
+
+_SPACE = ord(' ')
+_NEWLINE = ord('\n')
+_MINUS = ord('-')
+_ZERO = ord('0')
+_NINE = ord('9')
+_DOT = ord('.')
+
+
+def _number(data, i, end):
+    # Parse "[-]digits[.]" at data[i:], returns (abs value, index after it)
+    while i < end and data[i] == _SPACE:
+        i += 1
+    if i < end and data[i] == _MINUS:
+        i += 1
+    value = 0
+    while i < end and _ZERO <= data[i] <= _NINE:
+        value = value * 10 + data[i] - _ZERO
+        i += 1
+    if i < end and data[i] == _DOT:
+        i += 1
+    return value, i
+
+
+# Signal strength of iface in data (a bytearray holding /proc/net/wireless), or None
+# when the interface is not listed. This is the link quality, or the absolute
+# signal level for drivers that do not report link quality.
+def parse_strength(data, iface, length=None):
+    if length is None:
+        length = len(data)
+    key = iface.encode('ascii') + b':'
+    start = data.find(key, 0, length)
+    # Names are right aligned, so a match must start the column
+    while start > 0 and data[start - 1] not in (_SPACE, _NEWLINE):
+        start = data.find(key, start + 1, length)
+    if start < 0:
+        return None
+    end = data.find(b'\n', start, length)
+    if end < 0:
+        end = length
+    i = start + len(key)
+    status, i = _number(data, i, end)
+    link, i = _number(data, i, end)
+    level, i = _number(data, i, end)
+    return link if link > 0 else level
+
+
+class WirelessStatus(object):
+    def __init__(self, interfaces=('wlan0',), ttl=5.0, path='/proc/net/wireless'):
+        self.interfaces = list(interfaces)
+        self.ttl = ttl
+        self.path = path
+        self.reads = 0
+        self._buffer = bytearray(BUFFER_SIZE)
+        self._file = None
+        self._strength = None
+        self._expires_ns = 0
+
+    def _read(self):
+        if self._file is None:
+            self._file = io.open(self.path, 'rb', buffering=0)
+        else:
+            self._file.seek(0)
+        length = self._file.readinto(self._buffer)
+        self.reads += 1
+        best = None
+        for iface in self.interfaces:
+            strength = parse_strength(self._buffer, iface, length)
+            if strength is not None and (best is None or strength > best):
+                best = strength
+        return best
+
+    # Best strength over the configured interfaces, None if none is associated
+    def strength(self):
+        now = monotonic_ns()
+        if now >= self._expires_ns:
+            try:
+                self._strength = self._read()
+            except (IOError, OSError):
+                self._strength = None
+                self.close()
+            self._expires_ns = now + int(self.ttl * 1e9)
+        return self._strength
+
+    # Force the next strength() to re-read, e.g. after toggling the radio
+    def invalidate(self):
+        self._expires_ns = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,131 @@
+//-------------------------------------------------------------------------
+//
+// Decoded icon cache, see iconCache.h.
+//
+//-------------------------------------------------------------------------
+
+#define _GNU_SOURCE
+
+#include <dirent.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <strings.h>
+#include <time.h>
+
+#include "iconCache.h"
+#include "imageGraphics.h"
+#include "loadpng.h"
+
+//-------------------------------------------------------------------------
+
+static RGBA8_T clearColor = {0,0,0,0};
+
+uint64_t monotonicNs()
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ull + ts.tv_nsec;
+}
+
+static bool isPng(const char *name)
+{
+    size_t len = strlen(name);
+    return len > 4 && strcasecmp(name + len - 4, ".png") == 0;
+}
+
+int loadIconCache(ICON_CACHE_T *cache, const char *dir)
+{
+    uint64_t start = monotonicNs();
+    struct dirent *entry;
+    DIR *d = opendir(dir);
+
+    memset(cache, 0, sizeof(*cache));
+    if (d == NULL)
+    {
+        perror("opening icon directory");
+        return 0;
+    }
+    while ((entry = readdir(d)) != NULL)
+    {
+        if (!isPng(entry->d_name))
+            continue;
+        ICON_T *icons = realloc(cache->icons, (cache->count + 1) * sizeof(ICON_T));
+        if (icons == NULL)
+            break;
+        cache->icons = icons;
+        ICON_T *icon = &icons[cache->count];
+        memset(icon, 0, sizeof(*icon));
+        if (asprintf(&icon->path, "%s/%s", dir, entry->d_name) < 0)
+            break;
+        if (loadPng(&icon->image, icon->path) == false)
+        {
+            fprintf(stderr, "unable to load %s\n", icon->path);
+            free(icon->path);
+            continue;
+        }
+        cache->bytes += icon->image.size;
+        cache->count++;
+    }
+    closedir(d);
+    cache->decodeNs = monotonicNs() - start;
+    return cache->count;
+}
+
+const IMAGE_T *findIcon(const ICON_CACHE_T *cache, const char *path)
+{
+    int i;
+    for (i = 0; i < cache->count; i++)
+    {
+        if (strcmp(cache->icons[i].path, path) == 0)
+            return &cache->icons[i].image;
+    }
+    fprintf(stderr, "icon %s not cached\n", path);
+    return NULL;
+}
+
+void copyIcon(IMAGE_T *image, const IMAGE_T *icon)
+{
+    if (icon->type == image->type
+        && icon->width == image->width
+        && icon->height == image->height
+        && icon->pitch == image->pitch)
+    {
+        memcpy(image->buffer, icon->buffer, image->size);
+        return;
+    }
+    clearImageRGB(image, &clearColor);
+    if (icon->type != image->type)
+        return;
+    int width = icon->width < image->width ? icon->width : image->width;
+    int height = icon->height < image->height ? icon->height : image->height;
+    size_t rowBytes = (size_t)width * image->bitsPerPixel / 8;
+    int row;
+    for (row = 0; row < height; row++)
+    {
+        memcpy((uint8_t*)image->buffer + row * image->pitch,
+               (const uint8_t*)icon->buffer + row * icon->pitch,
+               rowBytes);
+    }
+}
+
+void showIcon(IMAGE_LAYER_T *layer, const IMAGE_T *icon)
+{
+    if (icon == NULL)
+        clearImageRGB(&(layer->image), &clearColor);
+    else
+        copyIcon(&(layer->image), icon);
+    changeSourceAndUpdateImageLayer(layer);
+}
+
+void destroyIconCache(ICON_CACHE_T *cache)
+{
+    int i;
+    for (i = 0; i < cache->count; i++)
+    {
+        destroyImage(&cache->icons[i].image);
+        free(cache->icons[i].path);
+    }
+    free(cache->icons);
+    memset(cache, 0, sizeof(*cache));
+}
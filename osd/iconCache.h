@@ -0,0 +1,50 @@
+//-------------------------------------------------------------------------
+//
+// Decoded icon cache. Every PNG under a directory is decoded once at
+// startup; layers then copy pixels from the cache instead of reading and
+// inflating the file on every render pass.
+//
+//-------------------------------------------------------------------------
+
+#ifndef ICON_CACHE_H
+#define ICON_CACHE_H
+
+#include <stdbool.h>
+#include <stdint.h>
+
+#include "image.h"
+#include "imageLayer.h"
+
+typedef struct
+{
+    char *path;
+    IMAGE_T image;
+} ICON_T;
+
+typedef struct
+{
+    ICON_T *icons;
+    int count;
+    size_t bytes;           // decoded pixel memory held
+    uint64_t decodeNs;      // time spent in loadIconCache
+} ICON_CACHE_T;
+
+// Decode every *.png in dir, keyed by "<dir>/<name>". Returns the number of
+// icons loaded; files that fail to decode are reported and skipped.
+int loadIconCache(ICON_CACHE_T *cache, const char *dir);
+
+// Decoded image for path, or NULL when it is not cached
+const IMAGE_T *findIcon(const ICON_CACHE_T *cache, const char *path);
+
+// Copy icon into image (top left aligned, the rest cleared). The image keeps
+// its own buffer, so clearing it later never touches the cache.
+void copyIcon(IMAGE_T *image, const IMAGE_T *icon);
+
+// copyIcon into a layer and submit it, or clear the layer for a NULL icon
+void showIcon(IMAGE_LAYER_T *layer, const IMAGE_T *icon);
+
+void destroyIconCache(ICON_CACHE_T *cache);
+
+uint64_t monotonicNs();
+
+#endif
@@ -27,6 +27,7 @@
 #include <assert.h>
 #include <stdbool.h>
 #include <stdio.h>
+#include <string.h>
 #include <limits.h>
 #include <stdlib.h>
 #include <unistd.h>
@@ -38,8 +39,16 @@
 #include "loadpng.h"
 #include <unistd.h>
 #include <math.h>
+#include <poll.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sched.h>
+#include <sys/timerfd.h>
 
 #include "bcm_host.h"
+#include "osd_frame.h"
+#include "iconCache.h"
 
 //-------------------------------------------------------------------------
 
@@ -51,12 +60,15 @@
 #define INFO_NO_JOYSTICK "./resources/main_no_joystick.png"
 #define JOYSTICK_IMAGE "./resources/joystick.png"
 #define BLUETOOTH_IMAGE "./resources/bluetooth.png"
+#define RESOURCES_DIR "./resources"
 #define BATTERY_TH 20
+#define FRAME_NS 16000000ull   // least time between two render passes
 #define AUDIO_IMAGES (const char*[5]){"./resources/AUD0.png","./resources/AUD25.png","./resources/AUD50.png","./resources/AUD75.png","./resources/AUD100.png"}
 #define WIFI_IMAGES (const char*[5]){"./resources/wifi_warning.png", "./resources/wifi_error.png", "./resources/wifi_1.png", "./resources/wifi_2.png", "./resources/wifi_3.png"}
 
 volatile bool run = true;
 volatile bool show = false;
+volatile bool reportStats = false;
 
 //-------------------------------------------------------------------------
 
@@ -65,14 +77,38 @@ static RGBA8_T backgroundColour = { 0, 0, 0, 100 };
 static RGBA8_T textColour = { 255, 255, 255, 255 };
 static RGBA8_T greenColour = { 0, 255, 0, 200 };
 static RGBA8_T redColour = { 255, 0, 0, 200 };
-static int battery = 0, infos = 0, hud = 1, charge = 0, low_battery = 0, audio = 0, wifi = 0, wifi_loaded = 0, voltage = 0, vol_image = 0, infos_loaded = 0, warning_loaded = 0, joystick = 0, bluetooth = 0;
+static int battery = 0, infos = 0, hud = 1, charge = 0, low_battery = 0, audio = 0, wifi = 0, voltage = 0, joystick = 0, bluetooth = 0;
 static float temp = 0.f;
 
-void updateInfo(IMAGE_LAYER_T*, char[]);
+// Bytes read from stdin that do not yet make a whole frame or text line
+static unsigned char input[2 * OSD_FRAME_MAX_SIZE];
+static size_t inputLen = 0;
+static uint32_t lastSeq = 0;
+static unsigned long framesLost = 0;
+
+// State block mapped from the monitor with -s, NULL when it only uses stdin
+static const struct osd_shm *shared = NULL;
+static uint32_t sharedSeq = 0;
+
+// Every icon in RESOURCES_DIR, decoded once at startup
+static ICON_CACHE_T iconCache;
+
+// Render pass timing, printed on SIGUSR2 and at exit
+static unsigned long wakeups = 0, submissions = 0;
+static unsigned long renderPasses = 0;
+static uint64_t renderNs = 0, renderMaxNs = 0;
+
 void updateInfoText(IMAGE_LAYER_T*, bool);
-void getInput();
+void parseText(char*);
+void applyFrame(const unsigned char*, size_t);
+void applyState(const struct osd_frame*);
+void readShared();
+bool waitInput(int);
+void setIcon(IMAGE_LAYER_T*, const IMAGE_T**, const IMAGE_T*);
 void clearLayer(IMAGE_LAYER_T*);
 void updateBattery(float, IMAGE_LAYER_T*);
+void printIconStats();
+void printStats();
 char *getcwd(char *buf, size_t size);
 
 static void
@@ -81,7 +117,12 @@ signalHandler(int signalNumber)
     switch (signalNumber)
     {
         case SIGUSR1:
-            getInput();
+            // Older monitors signal before writing a text command. The
+            // input is read by the main loop, the signal only cuts its
+            // wait short.
+            break;
+        case SIGUSR2:
+            reportStats = true;
             break;
         case SIGINT:
         case SIGTERM:
@@ -120,14 +161,9 @@ int getImageIconFromVolume(int vol) {
     return 1;
 }
 
-void getInput()
+// Text command line, e.g. "s1 v372 b80 t20 w5 a60 j0 u1 l0 off ncharge"
+void parseText(char *buffer)
 {
-    char buffer[100];
-    char *bp = buffer;
-    int c;
-    while(run && '\n' != (c=fgetc(stdin)) && (bp-buffer) < sizeof(buffer))
-        *bp++=c;
-    *bp = 0;//terminator
 #ifndef NDEBUG
     printf("buffer: %s\n", buffer);
 #endif
@@ -213,6 +249,224 @@ void getInput()
 #endif
 }
 
+// Apply a binary frame of len bytes, only the fields named in its mask
+void applyFrame(const unsigned char *data, size_t len)
+{
+    struct osd_frame frame;
+    memset(&frame, 0, sizeof(frame));
+    memcpy(&frame, data, len < sizeof(frame) ? len : sizeof(frame));
+
+    // A restarted monitor starts over from 1, only count gaps going forward
+    if (lastSeq != 0 && frame.seq > lastSeq + 1)
+        framesLost += frame.seq - lastSeq - 1;
+    lastSeq = frame.seq;
+#ifndef NDEBUG
+    printf("frame: v%u seq %u mask %x lost %lu\n", frame.version, frame.seq, frame.mask, framesLost);
+#endif
+    applyState(&frame);
+}
+
+// Take over the fields named in a frame's mask
+void applyState(const struct osd_frame *frame)
+{
+    uint32_t mask = frame->mask;
+    if (mask & OSD_F_SHOW)
+        show = (frame->flags & OSD_FLAG_SHOW) != 0;
+    if (mask & OSD_F_VOLTAGE)
+        voltage = frame->voltage;
+    if (mask & OSD_F_BATTERY)
+        battery = frame->battery;
+    if (mask & OSD_F_TEMP)
+        temp = frame->temp / 10.f;
+    if (mask & OSD_F_WIFI)
+        wifi = frame->wifi;
+    if (mask & OSD_F_AUDIO)
+        audio = frame->audio;
+    if (mask & OSD_F_JOYSTICK)
+        joystick = (frame->flags & OSD_FLAG_JOYSTICK) != 0;
+    if (mask & OSD_F_BLUETOOTH)
+        bluetooth = (frame->flags & OSD_FLAG_BLUETOOTH) != 0;
+    if (mask & OSD_F_LOW_BATTERY)
+        low_battery = frame->low_battery;
+    if (mask & OSD_F_INFO)
+        infos = (frame->flags & OSD_FLAG_INFO) != 0;
+    if (mask & OSD_F_CHARGE)
+        charge = (frame->flags & OSD_FLAG_CHARGE) != 0;
+    if (mask & OSD_F_HUD)
+        hud = (frame->flags & OSD_FLAG_HUD) != 0;
+}
+
+// Apply the monitor's shared state block if it changed since the last pass.
+// The seqlock counter must read the same even value before and after the
+// copy, otherwise the monitor was writing and the copy is retried.
+void readShared()
+{
+    struct osd_frame frame;
+    int tries;
+    if (shared == NULL)
+        return;
+    for (tries = 0; tries < 100; tries++)
+    {
+        uint32_t seq = __atomic_load_n(&shared->seq, __ATOMIC_ACQUIRE);
+        if (seq & 1)
+        {
+            sched_yield();
+            continue;
+        }
+        if (seq == sharedSeq)
+            return;
+        memcpy(&frame, (const void*)&shared->state, sizeof(frame));
+        __atomic_thread_fence(__ATOMIC_ACQUIRE);
+        if (__atomic_load_n(&shared->seq, __ATOMIC_RELAXED) != seq)
+            continue;
+        sharedSeq = seq;
+        if (frame.magic == OSD_FRAME_MAGIC)
+            applyState(&frame);
+        return;
+    }
+}
+
+// Take whole frames and text lines off the front of the input buffer
+static void processInput()
+{
+    size_t used = 0;
+    while (used < inputLen)
+    {
+        unsigned char *p = input + used;
+        size_t left = inputLen - used;
+        if (p[0] == OSD_FRAME_MAGIC0)
+        {
+            struct osd_frame header;
+            if (left < OSD_FRAME_HEADER_SIZE)
+                break;
+            memcpy(&header, p, OSD_FRAME_HEADER_SIZE);
+            if (header.magic != OSD_FRAME_MAGIC
+                || header.length < OSD_FRAME_HEADER_SIZE
+                || header.length > OSD_FRAME_MAX_SIZE)
+            {
+                // Not a frame start, resynchronise on the next byte
+                used++;
+                continue;
+            }
+            if (left < header.length)
+                break;
+            applyFrame(p, header.length);
+            used += header.length;
+        }
+        else
+        {
+            unsigned char *end = memchr(p, '\n', left);
+            unsigned char *frameStart = memchr(p, OSD_FRAME_MAGIC0, end ? (size_t)(end - p) : left);
+            if (frameStart != NULL)
+            {
+                // Stray bytes in front of a frame
+                used += frameStart - p;
+                continue;
+            }
+            if (end == NULL)
+            {
+                // A line that cannot fit is garbage, drop it
+                if (left == sizeof(input))
+                    used = inputLen;
+                break;
+            }
+            *end = 0;
+            parseText((char*)p);
+            used += end - p + 1;
+        }
+    }
+    memmove(input, input + used, inputLen - used);
+    inputLen -= used;
+}
+
+// Sleep until input arrives or the timer fires, apply whatever arrived in one
+// read(). Returns true when the state may have changed or a pass is due.
+bool waitInput(int timer)
+{
+    struct pollfd pfd[2] = {
+        { STDIN_FILENO, POLLIN, 0 },
+        { timer, POLLIN, 0 },
+    };
+    if (poll(pfd, 2, -1) <= 0)
+        return false;
+    wakeups++;
+    if (pfd[1].revents & POLLIN)
+    {
+        uint64_t expirations;
+        if (read(timer, &expirations, sizeof(expirations)) < 0 && errno != EAGAIN)
+            perror("reading render timer");
+    }
+    if (!(pfd[0].revents & (POLLIN | POLLHUP)))
+        return true;
+    ssize_t n = read(STDIN_FILENO, input + inputLen, sizeof(input) - inputLen);
+    if (n == 0)
+    {
+        // The monitor is gone, nobody is left to drive the display
+        run = false;
+        return false;
+    }
+    if (n < 0)
+    {
+        if (errno != EINTR && errno != EAGAIN)
+            run = false;
+        return false;
+    }
+    inputLen += n;
+    processInput();
+    return true;
+}
+
+// Tell the monitor the layers are up. It passes the write end of a pipe in
+// OSD_READY_FD and waits on it instead of sleeping; closing it without a
+// line means we failed.
+static void signalReady(void)
+{
+    const char *env = getenv("OSD_READY_FD");
+    if (env == NULL)
+        return;
+    int fd = atoi(env);
+    if (write(fd, "ready\n", 6) != 6)
+        perror("signalling readiness");
+    close(fd);
+}
+
+// One shot timer for the next render pass
+static void armTimer(int timer, uint64_t ns)
+{
+    struct itimerspec spec;
+    memset(&spec, 0, sizeof(spec));
+    spec.it_value.tv_sec = ns / 1000000000ull;
+    spec.it_value.tv_nsec = ns % 1000000000ull;
+    if (timerfd_settime(timer, 0, &spec, NULL) < 0)
+        perror("arming render timer");
+}
+
+// Show icon on a layer (NULL clears it) unless the layer already shows it
+void setIcon(IMAGE_LAYER_T *layer, const IMAGE_T **shown, const IMAGE_T *icon)
+{
+    if (*shown == icon)
+        return;
+    *shown = icon;
+    showIcon(layer, icon);
+    submissions++;
+}
+
+void printIconStats()
+{
+    fprintf(stderr, "osd: %d icons (%zu KiB) decoded in %.1f ms at startup\n",
+            iconCache.count, iconCache.bytes / 1024, iconCache.decodeNs / 1e6);
+}
+
+void printStats()
+{
+    printIconStats();
+    fprintf(stderr, "osd: %lu wakeups, %lu layer submissions\n", wakeups, submissions);
+    fprintf(stderr, "osd: %lu render passes, %.1f us mean, %.1f us max\n",
+            renderPasses,
+            renderPasses ? renderNs / 1e3 / renderPasses : 0.0,
+            renderMaxNs / 1e3);
+}
+
 void clearLayer(IMAGE_LAYER_T *layer)
 {
     IMAGE_T *image = &(layer->image);
@@ -246,7 +500,9 @@ int main(int argc, char *argv[])
 
     int opt;
 
-    while ((opt = getopt(argc, argv, "d:")) != -1)
+    const char *sharedPath = NULL;
+
+    while ((opt = getopt(argc, argv, "d:s:")) != -1)
     {
         switch (opt)
         {
@@ -255,14 +511,35 @@ int main(int argc, char *argv[])
             displayNumber = atoi(optarg);
             break;
 
+        case 's':
+
+            sharedPath = optarg;
+            break;
+
         default:
 
-            fprintf(stderr, "Usage: %s [-d <number>]\n", basename(argv[0]));
+            fprintf(stderr, "Usage: %s [-d <number>] [-s <path>]\n", basename(argv[0]));
             fprintf(stderr, "    -d - Raspberry Pi display number\n");
+            fprintf(stderr, "    -s - state block shared by the monitor\n");
             exit(EXIT_FAILURE);
             break;
         }
     }
+
+    if (sharedPath != NULL)
+    {
+        int fd = open(sharedPath, O_RDONLY | O_CLOEXEC);
+        void *map = MAP_FAILED;
+        if (fd >= 0)
+        {
+            map = mmap(NULL, sizeof(struct osd_shm), PROT_READ, MAP_SHARED, fd, 0);
+            close(fd);
+        }
+        if (map == MAP_FAILED)
+            perror("mapping shared state, reading stdin only");
+        else
+            shared = map;
+    }
     
     if (signal(SIGINT, signalHandler) == SIG_ERR)
     {
@@ -286,6 +563,31 @@ int main(int argc, char *argv[])
         exit(EXIT_FAILURE);
     }
 
+    if (signal(SIGUSR2, signalHandler) == SIG_ERR)
+    {
+        perror("installing SIGUSR2 signal handler");
+        exit(EXIT_FAILURE);
+    }
+
+    //-------------------------------------------------------------------
+
+    loadIconCache(&iconCache, RESOURCES_DIR);
+    const IMAGE_T *batteryIcon = findIcon(&iconCache, BATTERY_IMAGE);
+    const IMAGE_T *chargeIcon = findIcon(&iconCache, CHARGE_IMAGE);
+    const IMAGE_T *joystickIcon = findIcon(&iconCache, JOYSTICK_IMAGE);
+    const IMAGE_T *bluetoothIcon = findIcon(&iconCache, BLUETOOTH_IMAGE);
+    const IMAGE_T *audioIcons[5];
+    const IMAGE_T *wifiIcons[5];
+    int i;
+    for (i = 0; i < 5; i++)
+    {
+        audioIcons[i] = findIcon(&iconCache, AUDIO_IMAGES[i]);
+        wifiIcons[i] = findIcon(&iconCache, WIFI_IMAGES[i]);
+    }
+    if (batteryIcon == NULL)
+        exit(EXIT_FAILURE);
+    printIconStats();
+
     //-------------------------------------------------------------------
 
     VC_IMAGE_TYPE_T type = VC_IMAGE_RGBA32;
@@ -332,10 +634,11 @@ int main(int argc, char *argv[])
     createResourceImageLayer(&warningLayer, layer);
     
     IMAGE_LAYER_T bimageLayer;
-    if (loadPng(&(bimageLayer.image), BATTERY_IMAGE) == false)
-    {
-        fprintf(stderr, "unable to load %s\n", argv[optind]);
-    }
+    initImageLayer(&bimageLayer,
+                   batteryIcon->width,
+                   batteryIcon->height,
+                   batteryIcon->type);
+    copyIcon(&(bimageLayer.image), batteryIcon);
     createResourceImageLayer(&bimageLayer, layer+2);
     
     IMAGE_LAYER_T batteryLayer;
@@ -456,124 +759,102 @@ int main(int argc, char *argv[])
     result = vc_dispmanx_update_submit_sync(update);
     assert(result == 0);
     
-    while (run)
+    // What every layer shows now; a pass only rebuilds and submits the
+    // layers whose content differs
+    const IMAGE_T *infoIcon = findIcon(&iconCache, no_joystick ? INFO_NO_JOYSTICK : INFO_IMAGE);
+    const IMAGE_T *warningIcon = findIcon(&iconCache, LOW_BATTERY_IMAGE);
+    const IMAGE_T *infoShown = NULL, *warningShown = NULL, *frameShown = batteryIcon;
+    const IMAGE_T *chargeShown = NULL, *wifiShown = NULL, *audioShown = NULL;
+    const IMAGE_T *joystickShown = NULL, *bluetoothShown = NULL;
+    int batteryShown = -1;
+    int infoText[4] = { -1, -1, -1, -1 };
+    bool infoTextShown = false;
+
+    int timer = timerfd_create(CLOCK_MONOTONIC, TFD_CLOEXEC | TFD_NONBLOCK);
+    if (timer < 0)
     {
-        int sleepTime = 10000000;
-
-        if(infos > 0)
-        {
-            sleepTime = 100000;
+        perror("creating render timer");
+        exit(EXIT_FAILURE);
+    }
+    bool due = true;
+    uint64_t lastPass = 0;
 
-            if (no_joystick) {
-             updateInfo(&infoLayer, INFO_NO_JOYSTICK);
-            } else {
-             updateInfo(&infoLayer, INFO_IMAGE);
-            }
-            updateInfoText(&infoTextLayer, no_joystick);
+    signalReady();
 
-        }
-        else if(infos <= 0)
+    while (run)
+    {
+        if (due)
         {
-              clearLayer(&infoLayer);
-              clearLayer(&infoTextLayer);
-              infos_loaded = 0;
-        }
-
-        if (low_battery == 1) {
-            updateWarning(&warningLayer, LOW_BATTERY_IMAGE);
-        } else if (low_battery >= 2) {
-            clearLayer(&warningLayer);
-            warning_loaded = 0;
-        }
-
-        if (show) {
-
-            float batval = battery/100.f;
+            uint64_t passStart = monotonicNs();
+            if (lastPass != 0 && passStart - lastPass < FRAME_NS)
             {
-                updateBattery(batval, &batteryLayer);
+                // Bursts of updates are folded into one pass per frame
+                armTimer(timer, lastPass + FRAME_NS - passStart);
             }
-            if(charge > 0 && hud)
+            else
             {
-                //TODO preload for efficiency
-                if (loadPng(&(cimageLayer.image), CHARGE_IMAGE) == false)
+                due = false;
+                lastPass = passStart;
+                readShared();
+
+                bool icons = show && hud;
+
+                setIcon(&infoLayer, &infoShown, infos > 0 ? infoIcon : NULL);
+                int text[4] = { audio, wifi > 0, joystick > 0, bluetooth > 0 };
+                if (infos > 0 && (!infoTextShown || memcmp(text, infoText, sizeof(text)) != 0))
                 {
-                    fprintf(stderr, "unable to charge load %s\n", argv[optind]);
-                }
-                changeSourceAndUpdateImageLayer(&cimageLayer);
-                charge = -1;
-            }
-            else if(!charge && hud)
-            {
-                clearLayer(&cimageLayer);
-                charge = -1;
-            }
-            if(wifi > 0 && hud)
-            {
-                if (wifi_loaded == 0) {
-                    //TODO preload for efficienty
-                    if (loadPng(&(wimageLayer.image), WIFI_IMAGES[wifi-1]) == false)
-                    {
-                        fprintf(stderr, "unable to wifi load %s\n", argv[optind]);
-                    }
-                    changeSourceAndUpdateImageLayer(&wimageLayer);
-                    wifi_loaded = 1;
+                    updateInfoText(&infoTextLayer, no_joystick);
+                    memcpy(infoText, text, sizeof(text));
+                    infoTextShown = true;
+                    submissions++;
                 }
-            }
-            else if (!wifi)
-            {
-                clearLayer(&wimageLayer);
-                wifi_loaded = 0;
-            }
-            if(audio >= 0)
-                    {
-                        vol_image = getImageIconFromVolume(audio);
-                        //TODO preload for efficienty
-                        if (loadPng(&(aimageLayer.image), AUDIO_IMAGES[vol_image-1]) == false)
-                        {
-                            fprintf(stderr, "unable to audio load %s\n", argv[optind]);
-                        }
-                        changeSourceAndUpdateImageLayer(&aimageLayer);
-                        //audio = -1;
-                    }
-                    else if (!audio)
-                    {
-                        clearLayer(&aimageLayer);
-                    }
-            if (!hud) {
-                clearLayer(&batteryLayer);
-                clearLayer(&wimageLayer);
-                    clearLayer(&aimageLayer);
-                    clearLayer(&bimageLayer);
-                    clearLayer(&cimageLayer);
-            }
-            if(joystick > 0) {
-                if (loadPng(&(joystickImageLayer.image), JOYSTICK_IMAGE) == false) {
-                    fprintf(stderr, "unable to joystick load %s\n", argv[optind]);
+                else if (infos <= 0 && infoTextShown)
+                {
+                    clearLayer(&infoTextLayer);
+                    infoTextShown = false;
+                    submissions++;
                 }
-                changeSourceAndUpdateImageLayer(&joystickImageLayer);
-            }
-            else if(joystick <= 0) {
-                clearLayer(&joystickImageLayer);
-            }
-            if(bluetooth > 0) {
-                if (loadPng(&(bluetoothImageLayer.image), BLUETOOTH_IMAGE) == false) {
-                    fprintf(stderr, "unable to baluetooth load %s\n", argv[optind]);
+
+                if (low_battery == 1)
+                    setIcon(&warningLayer, &warningShown, warningIcon);
+                else if (low_battery >= 2)
+                    setIcon(&warningLayer, &warningShown, NULL);
+
+                int level = icons ? battery : -1;
+                if (level != batteryShown)
+                {
+                    if (level >= 0)
+                        updateBattery(level / 100.f, &batteryLayer);
+                    else
+                        clearLayer(&batteryLayer);
+                    batteryShown = level;
+                    submissions++;
                 }
-                changeSourceAndUpdateImageLayer(&bluetoothImageLayer);
-            }
-            else if(bluetooth <= 0) {
-                clearLayer(&bluetoothImageLayer);
+                setIcon(&bimageLayer, &frameShown, icons ? batteryIcon : NULL);
+                setIcon(&cimageLayer, &chargeShown, icons && charge > 0 ? chargeIcon : NULL);
+                setIcon(&wimageLayer, &wifiShown, icons && wifi > 0 && wifi <= 5 ? wifiIcons[wifi-1] : NULL);
+                setIcon(&aimageLayer, &audioShown,
+                        icons && audio >= 0 ? audioIcons[getImageIconFromVolume(audio)-1] : NULL);
+                setIcon(&joystickImageLayer, &joystickShown, show && joystick > 0 ? joystickIcon : NULL);
+                setIcon(&bluetoothImageLayer, &bluetoothShown, show && bluetooth > 0 ? bluetoothIcon : NULL);
+
+                uint64_t passNs = monotonicNs() - passStart;
+                renderPasses++;
+                renderNs += passNs;
+                if (passNs > renderMaxNs)
+                    renderMaxNs = passNs;
             }
-        } else {
-            clearLayer(&batteryLayer);
-            clearLayer(&wimageLayer);
-            clearLayer(&aimageLayer);
-            clearLayer(&bimageLayer);
-            clearLayer(&cimageLayer);
-            clearLayer(&bluetoothImageLayer);
         }
-        usleep(sleepTime);
+        if (reportStats)
+        {
+            reportStats = false;
+            printStats();
+        }
+
+        if (waitInput(timer))
+            due = true;
     }
+    close(timer);
     //---------------------------------------------------------------------
 
     destroyImageLayer(&infoLayer);
@@ -585,6 +866,9 @@ int main(int argc, char *argv[])
         destroyImageLayer(&bimageLayer);
         destroyImageLayer(&cimageLayer);
 
+    printStats();
+    destroyIconCache(&iconCache);
+
     result = vc_dispmanx_display_close(display);
     assert(result == 0);
 
@@ -593,26 +877,6 @@ int main(int argc, char *argv[])
     return 0;
 }
 
-void updateInfo(IMAGE_LAYER_T *infoLayer, char imageType[])
-{
-    if (infos_loaded == 0) {
-    //clearImageRGB(image, &backgroundColour);
-    loadPng(&(infoLayer->image), imageType);
-    changeSourceAndUpdateImageLayer(infoLayer);
-    infos_loaded = 1;
-    }
-}
-
-void updateWarning(IMAGE_LAYER_T *infoLayer, char imageType[])
-{
-    if (warning_loaded == 0) {
-    //clearImageRGB(image, &backgroundColour);
-    loadPng(&(infoLayer->image), imageType);
-    changeSourceAndUpdateImageLayer(infoLayer);
-    warning_loaded = 1;
-    }
-}
-
 void updateInfoText(IMAGE_LAYER_T *infoLayer, bool no_joystick)
 {
     clearImageRGB(&(infoLayer->image), &clearColor);
@@ -0,0 +1,72 @@
+//-------------------------------------------------------------------------
+//
+// Binary monitor -> OSD frame, see oneforall/osdproto.py for the sender.
+//
+// Frames arrive on stdin, one per write(). Fields are only ever appended;
+// readers go by the length in the header, so a frame from a newer monitor
+// decodes with the fields this OSD knows and the rest is skipped.
+//
+//-------------------------------------------------------------------------
+
+#ifndef OSD_FRAME_H
+#define OSD_FRAME_H
+
+#include <stdint.h>
+
+#define OSD_FRAME_MAGIC 0x44534fa5u   // "\xa5OSD" in memory, little endian
+#define OSD_FRAME_MAGIC0 0xa5
+#define OSD_FRAME_VERSION 1
+#define OSD_FRAME_HEADER_SIZE 16
+#define OSD_FRAME_MAX_SIZE 256
+
+// Field mask
+#define OSD_F_SHOW (1u << 0)
+#define OSD_F_VOLTAGE (1u << 1)
+#define OSD_F_BATTERY (1u << 2)
+#define OSD_F_TEMP (1u << 3)
+#define OSD_F_WIFI (1u << 4)
+#define OSD_F_AUDIO (1u << 5)
+#define OSD_F_JOYSTICK (1u << 6)
+#define OSD_F_BLUETOOTH (1u << 7)
+#define OSD_F_LOW_BATTERY (1u << 8)
+#define OSD_F_INFO (1u << 9)
+#define OSD_F_CHARGE (1u << 10)
+#define OSD_F_HUD (1u << 11)
+
+// Bits of osd_frame.flags
+#define OSD_FLAG_SHOW (1u << 0)
+#define OSD_FLAG_JOYSTICK (1u << 1)
+#define OSD_FLAG_BLUETOOTH (1u << 2)
+#define OSD_FLAG_INFO (1u << 3)
+#define OSD_FLAG_CHARGE (1u << 4)
+#define OSD_FLAG_HUD (1u << 5)
+
+struct osd_frame
+{
+    uint32_t magic;
+    uint16_t version;
+    uint16_t length;        // whole frame, header included
+    uint32_t seq;
+    uint32_t mask;          // OSD_F_* fields carried by this frame
+    uint16_t voltage;       // hundredths of a volt
+    int16_t temp;           // tenths of a degree C
+    uint8_t battery;
+    uint8_t wifi;
+    uint8_t audio;
+    uint8_t low_battery;
+    uint8_t flags;          // OSD_FLAG_*
+    uint8_t reserved[3];
+};
+
+_Static_assert(sizeof(struct osd_frame) == 28, "osd_frame layout must match osdproto.py");
+
+// Shared memory block published by the monitor (oneforall/osdshm.py). seq is
+// a seqlock, odd while the monitor rewrites state.
+struct osd_shm
+{
+    uint32_t seq;
+    uint32_t reserved;
+    struct osd_frame state;
+};
+
+#endif
@@ -0,0 +1,110 @@
+#
+# Background action queue: merging by key, dropping what already runs, the
+# size limit and per key ordering, on real worker threads.
+#
+import threading
+import time
+import unittest
+
+from oneforall.actions import ActionQueue
+from oneforall.reactor import Reactor
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.005)
+
+
+class ActionQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = Reactor()
+        self.runs = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def tearDown(self):
+        self.gate.set()
+
+    def queue(self, **kwargs):
+        return ActionQueue(self.loop, **kwargs)
+
+    # Records arg; 'hold' blocks its worker until the gate opens
+    def run_action(self, arg):
+        self.runs.append(arg)
+        if arg == 'hold':
+            self.started.set()
+            self.gate.wait(5)
+        return arg
+
+    def test_queued_action_is_replaced_by_the_newest(self):
+        actions = self.queue(workers=1)
+        actions.submit('other', self.run_action, ('hold',))
+        self.started.wait(5)
+        actions.submit('wifi', self.run_action, ('block',))
+        actions.submit('wifi', self.run_action, ('unblock',))
+        self.assertEqual((actions.depth(), actions.merged), (1, 1))
+        self.gate.set()
+        wait_for(lambda: actions.completed == 2)
+        self.assertEqual(self.runs, ['hold', 'unblock'])
+
+    def test_action_identical_to_the_running_one_is_dropped(self):
+        actions = self.queue(workers=2)
+        actions.submit('wifi', self.run_action, ('hold',))
+        self.started.wait(5)
+        actions.submit('wifi', self.run_action, ('unblock',))
+        actions.submit('wifi', self.run_action, ('hold',))
+        self.assertFalse(actions.depth())
+        self.assertTrue(actions.busy('wifi'))
+        self.gate.set()
+        wait_for(lambda: not actions.busy('wifi'))
+        self.assertEqual(self.runs, ['hold'])
+        self.assertEqual(actions.merged, 1)
+
+    def test_same_key_waits_for_the_running_action(self):
+        actions = self.queue(workers=2)
+        actions.submit('wifi', self.run_action, ('hold',))
+        self.started.wait(5)
+        actions.submit('wifi', self.run_action, ('unblock',))
+        time.sleep(0.05)
+        self.assertEqual(self.runs, ['hold'])
+        self.gate.set()
+        wait_for(lambda: actions.completed == 2)
+        self.assertEqual(self.runs, ['hold', 'unblock'])
+
+    def test_full_queue_refuses_unless_forced(self):
+        actions = self.queue(size=2, workers=1)
+        actions.submit('run', self.run_action, ('hold',))
+        self.started.wait(5)
+        self.assertTrue(actions.submit('a', self.run_action, ('a',)))
+        self.assertTrue(actions.submit('b', self.run_action, ('b',)))
+        self.assertFalse(actions.submit('c', self.run_action, ('c',)))
+        self.assertTrue(actions.submit('off', self.run_action, ('off',), force=True))
+        self.assertEqual((actions.dropped, actions.max_depth), (1, 3))
+        self.gate.set()
+        wait_for(lambda: actions.completed == 4)
+        self.assertEqual(self.runs, ['hold', 'a', 'b', 'off'])
+
+    def test_result_delivered_on_the_loop(self):
+        actions = self.queue(workers=1)
+        results = []
+        actions.submit('volume', self.run_action, (40,), on_done=results.append)
+        actions.submit('broken', lambda: 1 / 0, on_done=results.append)
+        wait_for(lambda: actions.completed + actions.failed == 2)
+
+        # One loop pass, waking up at most 10 ms later
+        def delivered():
+            self.loop.call_later(0.01, lambda: None)
+            self.loop.run_once()
+            return results
+
+        wait_for(delivered)
+        self.assertEqual(results, [40])
+        self.assertEqual(actions.failed, 1)
+        self.assertIn('volume 1x', actions.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
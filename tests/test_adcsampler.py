@@ -0,0 +1,59 @@
+#
+# ADS1015 sampler against a fake ADC that records the calls made to it.
+#
+import unittest
+
+from oneforall.adcsampler import ADCSampler
+
+
+class FakeADC(object):
+    def __init__(self):
+        self.calls = []
+
+    def start_adc(self, channel, gain=1, data_rate=None):
+        self.calls.append(('start', channel, data_rate))
+        return channel * 100
+
+    def read_adc(self, channel, gain=1):
+        self.calls.append(('read', channel))
+        return 7
+
+    def stop_adc(self):
+        self.calls.append(('stop',))
+
+
+class ADCSamplerTest(unittest.TestCase):
+    def setUp(self):
+        self.adc = FakeADC()
+        self.samples = []
+        self.sampler = ADCSampler(self.adc, [2, 3], on_sample=lambda ts, values: self.samples.append(values))
+
+    def test_pass_reads_channels_in_order(self):
+        self.assertEqual(self.sampler.sample(), [200, 300])
+        self.assertEqual(self.samples, [[200, 300]])
+        self.assertEqual(self.adc.calls, [('start', 2, 3300), ('start', 3, 3300)])
+        self.assertTrue(self.sampler.continuous)
+
+    def test_single_shot_read_and_stop_end_the_scan(self):
+        self.sampler.sample()
+        self.assertEqual(self.sampler.read_adc(0), 7)
+        self.assertFalse(self.sampler.continuous)
+        self.sampler.stop()
+        self.assertNotIn(('stop',), self.adc.calls)
+        self.sampler.sample()
+        self.sampler.stop()
+        self.assertEqual(self.adc.calls[-1], ('stop',))
+
+    def test_achieved_rate_counts_passes_since_the_last_call(self):
+        for _ in range(5):
+            self.sampler.sample()
+        self.assertGreater(self.sampler.achieved_rate(), 0)
+        self.assertEqual(self.sampler.achieved_rate(), 0.0)
+        self.assertEqual(self.sampler.passes, 5)
+
+    def test_unsupported_data_rate(self):
+        self.assertRaises(ValueError, ADCSampler, self.adc, [0], data_rate=1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
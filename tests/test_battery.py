@@ -0,0 +1,59 @@
+#
+# Battery voltage estimator: median and EMA smoothing, floor and outliers.
+#
+import unittest
+
+from oneforall.battery import VoltageEstimator
+
+
+class VoltageEstimatorTest(unittest.TestCase):
+    def setUp(self):
+        self.estimator = VoltageEstimator(size=5, alpha=0.5, max_jump=10, floor=300)
+
+    def test_nothing_until_a_reading_passes_the_floor(self):
+        self.assertIsNone(self.estimator.value())
+        self.assertIsNone(self.estimator.add(0))
+        self.assertIsNone(self.estimator.add(299))
+        self.assertEqual(self.estimator.rejected, 2)
+        self.assertEqual(self.estimator.confidence(), 0.0)
+        self.assertEqual(self.estimator.add(380), 380)
+
+    def test_glitch_under_the_floor_leaves_the_estimate(self):
+        for _ in range(5):
+            self.estimator.add(380)
+        self.assertEqual(self.estimator.add(12), 380)
+        self.assertEqual(self.estimator.count, 5)
+
+    def test_short_dip_is_kept_out_by_the_median(self):
+        for volt in (380, 380, 380, 360, 380):
+            value = self.estimator.add(volt)
+        self.assertEqual(value, 380)
+        self.assertEqual(self.estimator.outliers, 1)
+
+    def test_ema_follows_the_median(self):
+        for volt in (380, 378, 376, 374, 372, 370, 368):
+            self.estimator.add(volt)
+        self.assertEqual(self.estimator.median, 372)
+        self.assertTrue(372 < self.estimator.value() < 378)
+
+    def test_real_step_wins_within_half_a_ring(self):
+        for _ in range(5):
+            self.estimator.add(400)
+        for _ in range(3):
+            self.estimator.add(360)
+        self.assertEqual(self.estimator.median, 360)
+
+    def test_confidence_grows_with_agreeing_readings(self):
+        self.estimator.add(380)
+        first = self.estimator.confidence()
+        for _ in range(4):
+            self.estimator.add(380)
+        self.assertLess(first, self.estimator.confidence())
+        self.assertEqual(self.estimator.confidence(), 1.0)
+        for volt in (340, 420, 340):
+            self.estimator.add(volt)
+        self.assertLess(self.estimator.confidence(), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
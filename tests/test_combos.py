@@ -0,0 +1,142 @@
+#
+# Chord engine driven by simulated pins (oneforall.sim) on the event loop.
+#
+import unittest
+
+from oneforall import evcodes as ev
+from oneforall.combos import HOLD, PRESS, RELEASE, ChordEngine, parse_combo
+from oneforall.monoclock import monotonic_ns
+from oneforall.reactor import Reactor
+from oneforall.sim import SimInputDevice, SimPins
+
+PINS = {'HOTKEY': 7, 'UP': 23, 'START': 13, 'QUICKSAVE': 9, 'UNUSED': -1}
+
+
+class ParseTest(unittest.TestCase):
+    def test_defaults(self):
+        combo = parse_combo('VOLUME_UP', 'hotkey+up -> volume_up', PINS)
+        self.assertEqual(combo.pins, (7, 23))
+        self.assertEqual((combo.trigger, combo.action, combo.args), (PRESS, 'volume_up', ()))
+
+    def test_options(self):
+        combo = parse_combo('X', 'HOTKEY+START hold 1.5 within 0.2 repeat 0.25 -> key KEY_ESC 0.5', PINS)
+        self.assertEqual((combo.trigger, combo.hold_ns, combo.within_ns, combo.repeat_ns),
+                         (HOLD, 1500000000, 200000000, 250000000))
+        self.assertEqual(combo.args, ('KEY_ESC', '0.5'))
+        combo = parse_combo('Y', 'START release max 0.3 -> wifi', PINS)
+        self.assertEqual((combo.trigger, combo.max_ns), (RELEASE, 300000000))
+
+    def test_errors(self):
+        for text in ('HOTKEY+UP volume_up', 'HOTKEY+LEFT -> wifi', 'UNUSED -> wifi', 'UP -> ',
+                     'UP hold -> wifi', 'UP sometimes -> wifi'):
+            self.assertRaises(ValueError, parse_combo, 'BAD', text, PINS)
+
+
+class EngineTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = Reactor()
+        self.pins = SimPins(PINS.values())
+        self.device = SimInputDevice([ev.KEY_ESC, ev.BTN_DPAD_UP])
+        self.fired = []
+        self.passed = []
+        self.pins.attach(self.loop, self.edges)
+        self.start = monotonic_ns()
+
+    def engine(self, *lines):
+        combos = [parse_combo('C{}'.format(i), line, PINS) for i, line in enumerate(lines)]
+        self.chords = ChordEngine(self.loop, combos, {'log': self.log, 'key': self.key})
+
+    def log(self, args):
+        return (lambda: self.fired.append(args[0])), (lambda: self.fired.append('end ' + args[0]))
+
+    def key(self, args):
+        event = getattr(ev, args[0])
+        return (lambda: self.device.emit(event, 1)), (lambda: self.device.emit(event, 0))
+
+    def edges(self, events):
+        for event in events:
+            if not self.chords.feed(event.pin, 1 - event.level, event.timestamp_ns):
+                self.passed.append((event.pin, 1 - event.level))
+
+    def press(self, name, ms):
+        self.pins.press(PINS[name], self.start + ms * 1000000)
+        self.loop.run_once()
+
+    def release(self, name, ms):
+        self.pins.release(PINS[name], self.start + ms * 1000000)
+        self.loop.run_once()
+
+    # A no-op timer at the target keeps run_once() from sleeping past it
+    def run_until(self, ms):
+        self.loop.call_at(self.start + ms * 1000000, lambda: None)
+        while monotonic_ns() < self.start + ms * 1000000:
+            self.loop.run_once()
+
+    def test_press_combo_swallows_its_trigger(self):
+        self.engine('HOTKEY+UP -> log up')
+        self.press('HOTKEY', 0)
+        self.press('UP', 10)
+        self.release('UP', 20)
+        self.release('HOTKEY', 30)
+        self.assertEqual(self.fired, ['up', 'end up'])
+        self.assertEqual(self.passed, [(7, 1), (7, 0)])
+        self.assertEqual(self.chords.consumed, 0)
+
+    def test_biggest_chord_wins(self):
+        self.engine('QUICKSAVE -> log save', 'HOTKEY+QUICKSAVE -> log load')
+        self.press('HOTKEY', 0)
+        self.press('QUICKSAVE', 10)
+        self.release('QUICKSAVE', 20)
+        self.press('QUICKSAVE', 30)
+        self.assertEqual(self.fired, ['load', 'end load', 'load'])
+        self.release('HOTKEY', 40)
+        self.release('QUICKSAVE', 50)
+        self.press('QUICKSAVE', 60)
+        self.assertEqual(self.fired, ['load', 'end load', 'load', 'end load', 'save'])
+
+    def test_within(self):
+        self.engine('HOTKEY+UP within 0.05 -> log up')
+        self.press('HOTKEY', 0)
+        self.press('UP', 100)
+        self.assertEqual(self.fired, [])
+        self.assertIn((23, 1), self.passed)
+
+    def test_release_tap(self):
+        self.engine('START release max 0.1 -> log tap')
+        self.press('START', 0)
+        self.release('START', 50)
+        self.press('START', 100)
+        self.release('START', 300)
+        self.assertEqual(self.fired, ['tap'])
+
+    def test_hold_and_repeat(self):
+        self.engine('HOTKEY hold 0.03 repeat 0.02 -> log held')
+        now = (monotonic_ns() - self.start) // 1000000
+        self.press('HOTKEY', now)
+        self.run_until(now + 25)
+        self.assertEqual(self.fired, [])
+        self.run_until(now + 75)
+        self.assertGreaterEqual(self.fired.count('held'), 2)
+        self.release('HOTKEY', now + 75)
+        count = len(self.fired)
+        self.run_until(now + 120)
+        self.assertEqual(len(self.fired), count)
+        self.assertEqual(self.fired[-1], 'end held')
+
+    def test_key_action_on_the_device(self):
+        self.engine('HOTKEY+START -> key KEY_ESC')
+        self.press('HOTKEY', 0)
+        self.press('START', 10)
+        self.release('START', 20)
+        self.assertEqual([frame.events for frame in self.device.frames],
+                         [[(ev.KEY_ESC[0], ev.KEY_ESC[1], 1)], [(ev.KEY_ESC[0], ev.KEY_ESC[1], 0)]])
+
+    def test_unknown_action_is_left_out(self):
+        self.engine('HOTKEY+UP -> nothing')
+        self.assertEqual(self.chords.combos, [])
+        self.press('UP', 0)
+        self.assertEqual(self.passed, [(23, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#
+# Debouncer fed edge timestamps directly, the way the monitor's loop does.
+#
+import unittest
+
+from oneforall.debounce import Debouncer
+
+PIN = 5
+WINDOW_US = 10000
+US = 1000
+
+
+class DebouncerTest(unittest.TestCase):
+    def setUp(self):
+        self.debouncer = Debouncer()
+        self.debouncer.add_pin(PIN, WINDOW_US, level=1)
+
+    def feed(self, us, level):
+        return self.debouncer.feed(PIN, level, us * US)
+
+    def settle(self, us):
+        return self.debouncer.poll(us * US)
+
+    def test_press_reported_on_the_leading_edge(self):
+        self.assertEqual(self.feed(0, 0), 1)
+        self.assertEqual(self.debouncer.pressed(PIN), 1)
+
+    def test_bounces_inside_the_window_are_swallowed(self):
+        self.assertEqual(self.feed(0, 0), 1)
+        for i in range(1, 7):
+            self.assertIsNone(self.feed(i * 200, i % 2))
+        self.assertEqual(self.debouncer.next_deadline(), WINDOW_US * US)
+        self.assertEqual(self.settle(WINDOW_US), [])
+        self.assertIsNone(self.debouncer.next_deadline())
+
+    def test_release_inside_the_window_is_reported_when_it_ends(self):
+        self.feed(0, 0)
+        self.feed(3000, 1)
+        self.assertEqual(self.settle(WINDOW_US - 1), [])
+        self.assertEqual(self.settle(WINDOW_US), [(PIN, 0, 3000 * US)])
+        self.assertEqual(self.debouncer.pressed(PIN), 0)
+
+    def test_settled_level_read_back(self):
+        self.feed(0, 0)
+        self.feed(3000, 1)
+        self.assertEqual(self.debouncer.poll(WINDOW_US * US, lambda pin: 0), [])
+        self.assertEqual(self.debouncer.pressed(PIN), 1)
+
+    def test_active_high_pin(self):
+        self.debouncer.add_pin(PIN, WINDOW_US, active_low=False, level=0)
+        self.assertEqual(self.feed(0, 1), 1)
+
+    def test_edge_after_the_window_is_reported_at_once(self):
+        self.feed(0, 0)
+        self.assertEqual(self.feed(WINDOW_US + 1, 1), 0)
+
+
+
+class StableDebouncerTest(unittest.TestCase):
+    def setUp(self):
+        self.debouncer = Debouncer()
+        self.debouncer.add_pin(PIN, WINDOW_US, level=1, stable=True)
+
+    def feed(self, us, level):
+        return self.debouncer.feed(PIN, level, us * US)
+
+    def settle(self, us, read=None):
+        return self.debouncer.poll(us * US, read)
+
+    def test_glitch_is_rejected(self):
+        self.assertIsNone(self.feed(0, 0))
+        self.assertIsNone(self.feed(200, 1))
+        self.assertIsNone(self.debouncer.next_deadline())
+        self.assertEqual(self.settle(WINDOW_US), [])
+        self.assertEqual(self.debouncer.pressed(PIN), 0)
+
+    def test_level_reported_once_it_has_held_for_the_window(self):
+        self.assertIsNone(self.feed(0, 0))
+        self.assertIsNone(self.feed(200, 1))
+        self.assertIsNone(self.feed(400, 0))
+        self.assertEqual(self.debouncer.next_deadline(), (400 + WINDOW_US) * US)
+        self.assertEqual(self.settle(400 + WINDOW_US - 1), [])
+        self.assertEqual(self.settle(400 + WINDOW_US), [(PIN, 1, 400 * US)])
+        self.assertEqual(self.debouncer.pressed(PIN), 1)
+
+    def test_missed_edge_read_back_restarts_the_hold(self):
+        self.feed(0, 0)
+        self.assertEqual(self.settle(WINDOW_US, lambda pin: 1), [])
+        self.assertIsNone(self.debouncer.next_deadline())
+        self.feed(WINDOW_US + 1, 0)
+        self.assertEqual(self.settle(2 * WINDOW_US + 1, lambda pin: 0), [(PIN, 1, (WINDOW_US + 1) * US)])
+
+
+if __name__ == '__main__':
+    unittest.main()
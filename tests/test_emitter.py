@@ -0,0 +1,66 @@
+#
+# Frame emitter: one SYN_REPORT per frame, through the device and the fd.
+#
+import os
+import unittest
+
+from oneforall.emitter import EV_ABS, EV_KEY, EV_SYN, INPUT_EVENT, SYN_REPORT, FrameEmitter
+from oneforall.sim import SimInputDevice
+
+BTN_A = (EV_KEY, 0x130)
+BTN_B = (EV_KEY, 0x131)
+ABS_X = (EV_ABS, 0x00)
+
+
+class FrameEmitterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = [0]
+        self.device = SimInputDevice()
+        self.emitter = FrameEmitter(self.device, window_us=2000, clock=lambda: self.now[0])
+
+    def test_changes_share_one_frame(self):
+        self.emitter.emit(BTN_A, 1)
+        self.emitter.emit(BTN_B, 1)
+        self.emitter.emit(ABS_X, 10)
+        self.emitter.emit(ABS_X, 20)
+        self.emitter.flush()
+        self.assertEqual(len(self.device.frames), 1)
+        self.assertEqual(self.device.frames[0].events,
+                         [(EV_KEY, 0x130, 1), (EV_KEY, 0x131, 1), (EV_ABS, 0x00, 20)])
+        self.assertEqual((self.emitter.frames, self.emitter.events), (1, 3))
+
+    def test_key_changing_twice_closes_the_frame(self):
+        self.emitter.emit(BTN_A, 1)
+        self.emitter.emit(BTN_A, 0)
+        self.emitter.flush()
+        self.assertEqual([f.events for f in self.device.frames],
+                         [[(EV_KEY, 0x130, 1)], [(EV_KEY, 0x130, 0)]])
+
+    def test_frame_due_after_its_window(self):
+        self.assertIsNone(self.emitter.deadline())
+        self.now[0] = 1000
+        self.emitter.emit(BTN_A, 1)
+        self.assertFalse(self.emitter.due(2000999))
+        self.assertTrue(self.emitter.due(2001000))
+        self.emitter.flush()
+        self.emitter.flush()
+        self.assertEqual(len(self.device.frames), 1)
+
+    def test_fd_gets_one_write_ending_in_one_syn(self):
+        r, w = os.pipe()
+        try:
+            emitter = FrameEmitter(None, fd=w)
+            emitter.emit(BTN_A, 1)
+            emitter.emit(ABS_X, 7)
+            emitter.flush()
+            data = os.read(r, 4096)
+        finally:
+            os.close(r)
+            os.close(w)
+        size = INPUT_EVENT.size
+        events = [INPUT_EVENT.unpack(data[i:i + size])[2:] for i in range(0, len(data), size)]
+        self.assertEqual(events, [(EV_KEY, 0x130, 1), (EV_ABS, 0x00, 7), (EV_SYN, SYN_REPORT, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+#
+# Key names for combo key actions.
+#
+import unittest
+
+from oneforall import evcodes as ev
+
+
+class KeyEventTest(unittest.TestCase):
+    def test_constants_match_the_table(self):
+        for name in dir(ev):
+            if name.startswith(('KEY_', 'BTN_')) and name != 'KEY_CODES':
+                self.assertEqual(ev.key_event(name), getattr(ev, name), name)
+
+    def test_any_key_by_name(self):
+        self.assertEqual(ev.key_event('KEY_F1'), (ev.EV_KEY, 59))
+        self.assertEqual(ev.key_event('KEY_VOLUMEUP'), (ev.EV_KEY, 115))
+        self.assertEqual(ev.key_event('BTN_TRIGGER_HAPPY1'), (ev.EV_KEY, 0x2c0))
+
+    def test_aliases(self):
+        self.assertEqual(ev.key_event('BTN_A'), ev.key_event('BTN_SOUTH'))
+        self.assertEqual(ev.key_event('KEY_SCREENLOCK'), ev.key_event('KEY_COFFEE'))
+
+    def test_unknown_names(self):
+        for name in ('KEY_NOPE', 'KEY_MAX', 'KEY_CNT', 'ABS_X', 'key_f1'):
+            self.assertIsNone(ev.key_event(name))
+
+
+if __name__ == '__main__':
+    unittest.main()
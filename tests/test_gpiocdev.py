@@ -0,0 +1,76 @@
+#
+# GPIO character device backend: event decoding from packed records, and a
+# real line request when a gpio-sim bank or gpio-mockup is there, e.g.
+#
+#   modprobe gpio-mockup gpio_mockup_ranges=-1,8
+#
+# Edges are only driven through gpio-mockup's debugfs files.
+#
+import os
+import struct
+import unittest
+
+from oneforall.gpiocdev import (EVENT_SIZE, GPIO_V2_LINE_EVENT_FALLING_EDGE, GPIO_V2_LINE_EVENT_RISING_EDGE,
+                                LineRequest, find_chip)
+
+SIM_CHIPS = ('gpio-sim.0-node0', 'gpio-mockup-A')
+MOCKUP_EVENTS = '/sys/kernel/debug/gpio-mockup-event/gpio-mockup-A'
+
+
+# struct gpio_v2_line_event
+def event(timestamp_ns, event_id, pin, seqno, line_seqno):
+    return struct.pack('=QIIII6I', timestamp_ns, event_id, pin, seqno, line_seqno, *([0] * 6))
+
+
+def sim_chip():
+    for label in SIM_CHIPS:
+        try:
+            find_chip(label)
+            return label
+        except (IOError, OSError):
+            continue
+    return None
+
+
+class DecodeEventsTest(unittest.TestCase):
+    def setUp(self):
+        # Decoding needs no chip, only the sequence bookkeeping
+        self.request = LineRequest.__new__(LineRequest)
+        self.request.dropped = 0
+        self.request._last_seqno = 0
+
+    def test_edges(self):
+        data = (event(1000, GPIO_V2_LINE_EVENT_FALLING_EDGE, 17, 1, 1) +
+                event(2500, GPIO_V2_LINE_EVENT_RISING_EDGE, 17, 2, 2))
+        events = self.request.decode_events(data)
+        self.assertEqual([(e.pin, e.level, e.timestamp_ns, e.seqno, e.line_seqno) for e in events],
+                         [(17, 0, 1000, 1, 1), (17, 1, 2500, 2, 2)])
+
+    def test_sequence_gaps_count_as_dropped(self):
+        self.request.decode_events(event(1, GPIO_V2_LINE_EVENT_FALLING_EDGE, 4, 1, 1))
+        self.request.decode_events(event(2, GPIO_V2_LINE_EVENT_RISING_EDGE, 4, 5, 2))
+        self.assertEqual(self.request.dropped, 3)
+
+    def test_partial_record_is_ignored(self):
+        data = event(1, GPIO_V2_LINE_EVENT_FALLING_EDGE, 4, 1, 1)
+        self.assertEqual(len(self.request.decode_events(data + data[:EVENT_SIZE - 1])), 1)
+
+
+@unittest.skipIf(sim_chip() is None, 'no gpio-sim or gpio-mockup chip')
+class LineRequestTest(unittest.TestCase):
+    def test_levels_and_edges(self):
+        chip = sim_chip()
+        with LineRequest(chip, [0, 1], consumer='oneforall-test') as request:
+            # Pulled up, like the buttons
+            self.assertEqual(request.get_values(), {0: 1, 1: 1})
+            if chip != 'gpio-mockup-A' or not os.path.exists(MOCKUP_EVENTS):
+                return
+            with open(os.path.join(MOCKUP_EVENTS, '1'), 'w') as f:
+                f.write('0')
+            events = request.read_events(timeout=1)
+            self.assertEqual([(e.pin, e.level) for e in events], [(1, 0)])
+            self.assertEqual(request.get_value(1), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#
+# Idle mode entry and exit on a clock the test steps by hand.
+#
+import unittest
+
+from oneforall.idle import IdleMode
+from oneforall.reactor import Reactor
+
+S = 1000000000
+
+
+class IdleModeTest(unittest.TestCase):
+    def setUp(self):
+        self.now = [0]
+        self.loop = Reactor(clock=lambda: self.now[0])
+        self.calls = []
+        self.wakeups = [0]
+        self.idle = IdleMode(self.loop, 2, on_idle=lambda: self.calls.append('idle'),
+                             on_wake=lambda: self.calls.append('wake'),
+                             counters=[('loop', lambda: self.wakeups[0])])
+
+    def advance(self, seconds):
+        self.now[0] += int(seconds * S)
+        self.loop.run_timers(self.now[0])
+
+    def test_enters_after_idle_after_without_activity(self):
+        self.advance(1.9)
+        self.assertFalse(self.idle.idle)
+        self.advance(0.1)
+        self.assertTrue(self.idle.idle)
+        self.assertEqual(self.calls, ['idle'])
+
+    def test_activity_pushes_entry_back(self):
+        self.advance(1.5)
+        self.idle.activity()
+        self.advance(1)
+        self.assertFalse(self.idle.idle)
+        self.advance(1)
+        self.assertTrue(self.idle.idle)
+
+    def test_activity_wakes_at_once_and_rearms(self):
+        self.advance(2)
+        self.idle.activity()
+        self.assertEqual(self.calls, ['idle', 'wake'])
+        self.assertFalse(self.idle.idle)
+        self.advance(2)
+        self.assertEqual(self.calls, ['idle', 'wake', 'idle'])
+        self.assertEqual(self.idle.transitions, 3)
+
+    def test_wakeup_rates_per_state(self):
+        self.wakeups[0] = 200
+        self.advance(2)
+        self.wakeups[0] = 210
+        self.advance(5)
+        rates = self.idle.rates()
+        self.assertEqual(rates['active'], (2.0, {'loop': 100.0}))
+        self.assertEqual(rates['idle'], (5.0, {'loop': 2.0}))
+
+    def test_failing_callback_does_not_stop_the_switch(self):
+        self.idle.on_idle = lambda: 1 / 0
+        self.advance(2)
+        self.assertTrue(self.idle.idle)
+
+
+if __name__ == '__main__':
+    unittest.main()
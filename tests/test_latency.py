@@ -0,0 +1,55 @@
+#
+# Latency histograms: bucket bounds and percentiles.
+#
+import unittest
+
+from oneforall.latency import Histogram, LatencyStats, bucket_index, bucket_upper
+
+
+class HistogramTest(unittest.TestCase):
+    def test_buckets_keep_values_within_their_precision(self):
+        for value in (0, 5, 15, 16, 17, 100, 1000, 123456, 10 ** 9):
+            upper = bucket_upper(bucket_index(value))
+            self.assertGreaterEqual(upper, value)
+            self.assertLessEqual(upper - value, value / 16.0)
+
+    def test_percentiles(self):
+        hist = Histogram()
+        for value in range(1, 101):
+            hist.record(value)
+        # Reported as the top of its bucket
+        self.assertEqual(hist.percentile(50), 51)
+        self.assertTrue(99 <= hist.percentile(99) <= 100)
+        self.assertEqual(hist.percentile(100), 100)
+        self.assertEqual(hist.mean(), 50.5)
+
+    def test_outlier_only_moves_the_tail(self):
+        hist = Histogram()
+        for _ in range(99):
+            hist.record(200)
+        hist.record(50000)
+        self.assertTrue(200 <= hist.percentile(50) <= 207)
+        self.assertEqual(hist.percentile(100), 50000)
+        self.assertEqual(hist.max, 50000)
+
+    def test_empty_and_negative(self):
+        hist = Histogram()
+        self.assertEqual(hist.percentile(99), 0)
+        hist.record(-5)
+        self.assertEqual(hist.percentile(99), 0)
+        hist.reset()
+        self.assertEqual(hist.count, 0)
+
+
+class LatencyStatsTest(unittest.TestCase):
+    def test_records_microseconds_per_name(self):
+        stats = LatencyStats()
+        stats.record('pin5', 1000000, 1250000)
+        stats.record('pin5', 2000000, 2250000)
+        self.assertEqual(stats.histogram('pin5').count, 2)
+        self.assertEqual(stats.histogram('pin5').max, 250)
+        self.assertIn('pin5', stats.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#
+# Volume control on a FakeMixer: clamping, coalesced writes, outside changes.
+#
+import unittest
+
+from oneforall.mixer import FakeMixer, VolumeControl
+from oneforall.reactor import Reactor
+
+MS = 1000000
+
+
+class VolumeControlTest(unittest.TestCase):
+    def setUp(self):
+        self.now = [0]
+        self.loop = Reactor(clock=lambda: self.now[0])
+        self.mixer = FakeMixer(level=50)
+        self.changes = []
+        self.volume = VolumeControl(self.mixer, self.loop, on_change=self.changes.append, coalesce_ms=50)
+
+    # One loop pass without waiting, at time ms
+    def pump(self, ms):
+        self.now[0] = ms * MS
+        self.loop.call_soon_threadsafe(lambda: None)
+        self.loop.run_once()
+
+    def test_levels_are_clamped(self):
+        self.assertEqual(self.volume.set(150), 100)
+        self.assertEqual(self.volume.step(5), 100)
+        self.assertEqual(self.volume.set(-3), 0)
+        self.assertEqual(self.volume.get(), 0)
+
+    def test_burst_of_steps_is_one_write(self):
+        for _ in range(5):
+            self.volume.step(2)
+        self.assertEqual(self.mixer.writes, [])
+        self.pump(49)
+        self.assertEqual(self.mixer.writes, [])
+        self.pump(50)
+        self.assertEqual(self.mixer.writes, [60])
+        self.assertEqual(self.volume.writes, 1)
+
+    def test_burst_back_to_the_start_writes_nothing(self):
+        self.volume.step(5)
+        self.volume.step(-5)
+        self.pump(50)
+        self.assertEqual(self.mixer.writes, [])
+
+    def test_own_write_is_not_reported_as_a_change(self):
+        self.volume.set(70)
+        self.pump(50)
+        self.pump(51)
+        self.assertEqual(self.changes, [])
+
+    def test_outside_change_is_reported(self):
+        self.mixer.external_set(30)
+        self.pump(1)
+        self.assertEqual(self.changes, [30])
+        self.assertEqual(self.volume.get(), 30)
+
+    def test_outside_change_during_a_burst_loses_to_the_burst(self):
+        self.volume.set(80)
+        self.mixer.external_set(30)
+        self.pump(1)
+        self.assertEqual(self.changes, [])
+        self.pump(50)
+        self.assertEqual(self.mixer.level, 80)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#
+# OSD frames from FrameEncoder as the OSD decodes them, and the change tracker.
+#
+import struct
+import unittest
+
+from oneforall.osdproto import (F_ALL, F_AUDIO, F_RENDERED, F_TEMP, F_VOLTAGE, F_WIFI, HEADER_SIZE, MAGIC, OSD_FRAME,
+                                FrameEncoder, StateTracker, decode)
+
+STATE = dict(show=True, voltage=371, battery=87, temp=42.5, wifi=3, audio=60, joystick=False,
+             bluetooth=True, low_battery=0, info=False, charge=True, hud=True)
+
+
+class FrameTest(unittest.TestCase):
+    def setUp(self):
+        self.encoder = FrameEncoder()
+
+    def test_round_trip(self):
+        seq, values = decode(bytes(self.encoder.encode(**STATE)))
+        self.assertEqual(values, STATE)
+
+    def test_only_masked_fields_are_decoded(self):
+        seq, values = decode(bytes(self.encoder.encode(mask=F_WIFI | F_AUDIO, **STATE)))
+        self.assertEqual(values, {'wifi': 3, 'audio': 60})
+
+    def test_sequence_numbers(self):
+        first = decode(bytes(self.encoder.encode(**STATE)))
+        second = decode(bytes(self.encoder.encode(**STATE)))
+        self.assertEqual(second[0], first[0] + 1)
+
+    def test_values_are_clamped(self):
+        seq, values = decode(bytes(self.encoder.encode(voltage=-5, battery=300, temp=5000, audio=-1)))
+        self.assertEqual((values['voltage'], values['battery'], values['audio']), (0, 255, 0))
+        self.assertEqual(values['temp'], 0x7fff / 10.0)
+
+    def test_incomplete_or_foreign_data(self):
+        frame = bytes(self.encoder.encode(**STATE))
+        self.assertIsNone(decode(frame[:HEADER_SIZE - 1]))
+        self.assertIsNone(decode(frame[:-1]))
+        self.assertIsNone(decode(b'x' + frame[1:]))
+
+    def test_older_shorter_frame(self):
+        # A sender from before the later fields existed: header and voltage only
+        data = struct.pack('<IHHIIH', MAGIC, 1, HEADER_SIZE + 2, 7, F_VOLTAGE | F_TEMP, 355)
+        seq, values = decode(data)
+        self.assertEqual((seq, values), (7, {'voltage': 355, 'temp': 0.0}))
+        self.assertLess(len(data), OSD_FRAME.size)
+
+
+class StateTrackerTest(unittest.TestCase):
+    def test_only_changes_are_sent(self):
+        tracker = StateTracker()
+        self.assertEqual(tracker.changes(STATE), F_ALL)
+        self.assertEqual(tracker.changes(STATE), 0)
+        self.assertEqual(tracker.changes(dict(STATE, wifi=0)), F_WIFI)
+        self.assertEqual((tracker.sent, tracker.skipped), (2, 1))
+
+    def test_held_fields_wait_for_a_rendered_change(self):
+        tracker = StateTracker()
+        tracker.changes(STATE)
+        hold = F_ALL & ~F_RENDERED
+        self.assertEqual(tracker.changes(dict(STATE, voltage=360), hold), 0)
+        self.assertEqual(tracker.changes(dict(STATE, voltage=360, audio=10), hold), F_VOLTAGE | F_AUDIO)
+
+    def test_reset_sends_everything_again(self):
+        tracker = StateTracker()
+        tracker.changes(STATE)
+        tracker.reset()
+        self.assertEqual(tracker.changes(STATE), F_ALL)
+
+
+if __name__ == '__main__':
+    unittest.main()
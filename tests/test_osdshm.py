@@ -0,0 +1,69 @@
+#
+# Shared memory OSD state: publish and snapshot through the seqlock, and a
+# second mapping of the file as the OSD has it.
+#
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from oneforall.osdproto import FrameEncoder, decode
+from oneforall.osdshm import SEQ, SHM_SIZE, STATE_OFFSET, SharedState
+
+
+class SharedStateTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'osd')
+        self.shared = SharedState(self.path)
+        self.encoder = FrameEncoder()
+
+    def tearDown(self):
+        self.shared.close()
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        self.shared.publish(self.encoder.encode(voltage=371, wifi=2))
+        seq, values = decode(self.shared.snapshot())
+        self.assertEqual((values['voltage'], values['wifi']), (371, 2))
+        self.assertEqual((self.shared.seq, self.shared.publishes), (2, 1))
+
+    def test_reader_mapping_sees_the_latest_frame(self):
+        with open(self.path, 'rb') as f:
+            view = mmap.mmap(f.fileno(), SHM_SIZE, access=mmap.ACCESS_READ)
+        try:
+            for audio in (10, 20, 30):
+                self.shared.publish(self.encoder.encode(audio=audio))
+            self.assertEqual(SEQ.unpack(view[0:SEQ.size])[0], 6)
+            self.assertEqual(decode(view[STATE_OFFSET:SHM_SIZE])[1]['audio'], 30)
+        finally:
+            view.close()
+
+    def test_snapshots_are_never_torn(self):
+        frames = [bytes(self.encoder.encode(voltage=v, battery=v % 100, audio=v % 100)) for v in (300, 399)]
+        self.shared.publish(frames[0])
+        done = threading.Event()
+
+        def writer():
+            for i in range(2000):
+                self.shared.publish(frames[i % 2])
+            done.set()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            while not done.is_set():
+                self.assertIn(self.shared.snapshot(), frames)
+        finally:
+            thread.join()
+
+    def test_close_unlinks(self):
+        self.shared.close()
+        self.assertFalse(os.path.exists(self.path))
+        self.shared = SharedState(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
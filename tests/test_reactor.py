@@ -0,0 +1,50 @@
+#
+# Reactor timers on a clock the test steps by hand.
+#
+import unittest
+
+from oneforall.reactor import Reactor
+
+MS = 1000000
+
+
+class TimerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = [0]
+        self.loop = Reactor(clock=lambda: self.now[0])
+        self.ran = []
+
+    def test_timers_run_in_deadline_order_on_the_clock(self):
+        self.loop.call_later(0.002, self.ran.append, 'b')
+        self.loop.call_at(1 * MS, self.ran.append, 'a')
+        self.loop.call_every(0.003, self.ran.append, 'tick')
+        self.assertEqual(self.loop.next_deadline(), 1 * MS)
+        self.loop.run_timers(2 * MS)
+        self.assertEqual(self.ran, ['a', 'b'])
+        self.loop.run_timers(3 * MS)
+        self.loop.run_timers(6 * MS)
+        self.assertEqual(self.ran, ['a', 'b', 'tick', 'tick'])
+        # A stall skips the runs it missed
+        self.loop.run_timers(20 * MS)
+        self.assertEqual(self.ran.count('tick'), 3)
+        self.assertEqual(self.loop.next_deadline(), 23 * MS)
+
+    def test_taken_timers_wait_and_keep_their_delay(self):
+        self.loop.call_at(5 * MS, self.ran.append, 'live')
+        live = self.loop.take_timers()
+        self.loop.call_at(3 * MS, self.ran.append, 'replay')
+        self.loop.run_timers(20 * MS)
+        self.assertEqual(self.ran, ['replay'])
+        self.loop.add_timers(live, 100 * MS)
+        self.assertEqual(self.loop.next_deadline(), 105 * MS)
+        self.loop.run_timers(105 * MS)
+        self.assertEqual(self.ran, ['replay', 'live'])
+
+    def test_cancelled_timers_are_skipped(self):
+        self.loop.call_at(1 * MS, self.ran.append, 'no').cancel()
+        self.assertIsNone(self.loop.next_deadline())
+        self.assertEqual(self.loop.take_timers(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
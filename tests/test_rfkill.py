@@ -0,0 +1,77 @@
+#
+# rfkill control over a socketpair that stands in for /dev/rfkill: packed
+# records in, decoded switch state out, and the block requests written back.
+#
+import fcntl
+import os
+import socket
+import unittest
+
+from oneforall.reactor import Reactor
+from oneforall.rfkill import (RFKILL_EVENT, RFKILL_OP_ADD, RFKILL_OP_CHANGE, RFKILL_OP_CHANGE_ALL,
+                              RFKILL_OP_DEL, RFKILL_TYPE_BLUETOOTH, RFKILL_TYPE_WLAN, RfkillControl)
+
+
+class RfkillControlTest(unittest.TestCase):
+    def setUp(self):
+        pair = socket.socketpair()
+        self.fd, self.kernel = [os.dup(s.fileno()) for s in pair]
+        for s in pair:
+            s.close()
+        self.loop = Reactor(clock=lambda: 0)
+        self.changes = []
+        # Queued before open, like the kernel's ADD records
+        self.send(0, RFKILL_TYPE_WLAN, RFKILL_OP_ADD, 0, 0)
+        self.send(1, RFKILL_TYPE_BLUETOOTH, RFKILL_OP_ADD, 1, 0)
+        flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.rfkill = RfkillControl(self.loop, fd=self.fd, on_change=lambda *change: self.changes.append(change))
+
+    def tearDown(self):
+        os.close(self.fd)
+        os.close(self.kernel)
+
+    def send(self, idx, radio, op, soft, hard):
+        os.write(self.kernel, RFKILL_EVENT.pack(idx, radio, op, soft, hard))
+
+    def pump(self):
+        self.loop.call_soon_threadsafe(lambda: None)
+        self.loop.run_once()
+
+    def test_initial_state_is_decoded_on_open(self):
+        self.assertEqual(self.rfkill.devices, {0: (RFKILL_TYPE_WLAN, False, False),
+                                               1: (RFKILL_TYPE_BLUETOOTH, True, False)})
+        self.assertFalse(self.rfkill.blocked(RFKILL_TYPE_WLAN))
+        self.assertTrue(self.rfkill.blocked(RFKILL_TYPE_BLUETOOTH))
+        self.assertIsNone(self.rfkill.blocked(7))
+        self.assertEqual(self.changes, [(RFKILL_TYPE_WLAN, False), (RFKILL_TYPE_BLUETOOTH, True)])
+
+    def test_block_request_is_written_and_confirmed(self):
+        self.rfkill.set_blocked(RFKILL_TYPE_WLAN, True)
+        self.assertEqual(RFKILL_EVENT.unpack(os.read(self.kernel, 64)),
+                         (0, RFKILL_TYPE_WLAN, RFKILL_OP_CHANGE_ALL, 1, 0))
+        self.assertTrue(self.rfkill.pending(RFKILL_TYPE_WLAN))
+        self.assertTrue(self.rfkill.blocked(RFKILL_TYPE_WLAN))
+        self.send(0, RFKILL_TYPE_WLAN, RFKILL_OP_CHANGE, 1, 0)
+        del self.changes[:]
+        self.pump()
+        self.assertFalse(self.rfkill.pending(RFKILL_TYPE_WLAN))
+        self.assertEqual(self.changes, [(RFKILL_TYPE_WLAN, True)])
+
+    def test_request_for_the_current_state_does_not_wait(self):
+        self.rfkill.set_blocked(RFKILL_TYPE_BLUETOOTH, True)
+        self.assertEqual(RFKILL_EVENT.unpack(os.read(self.kernel, 64))[2:4], (RFKILL_OP_CHANGE_ALL, 1))
+        self.assertFalse(self.rfkill.pending(RFKILL_TYPE_BLUETOOTH))
+
+    def test_hard_block_and_removal(self):
+        self.send(0, RFKILL_TYPE_WLAN, RFKILL_OP_CHANGE, 0, 1)
+        self.send(1, RFKILL_TYPE_BLUETOOTH, RFKILL_OP_DEL, 1, 0)
+        del self.changes[:]
+        self.pump()
+        self.assertTrue(self.rfkill.blocked(RFKILL_TYPE_WLAN))
+        self.assertIsNone(self.rfkill.blocked(RFKILL_TYPE_BLUETOOTH))
+        self.assertEqual(self.changes, [(RFKILL_TYPE_WLAN, True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
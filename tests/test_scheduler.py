@@ -0,0 +1,89 @@
+#
+# Poll policies and the scheduler on a clock the test steps by hand.
+#
+import unittest
+
+from oneforall.reactor import Reactor
+from oneforall.scheduler import Approach, Backoff, PollScheduler, Sensor
+
+S = 1000000000
+
+
+class BackoffTest(unittest.TestCase):
+    def setUp(self):
+        self.now = [0]
+        self.sensor = Sensor('stick', None, 0.004, max_interval=0.032)
+        self.policy = Backoff(1, clock=lambda: self.now[0])
+
+    def step(self, seconds, value):
+        self.now[0] += int(seconds * S)
+        self.sensor.set_interval(self.policy(self.sensor, value))
+        return self.sensor.interval
+
+    def test_interval_doubles_per_quiet_period_up_to_the_max(self):
+        self.assertEqual(self.step(0, 5), 0.004)
+        self.assertEqual(self.step(0.5, 5), 0.004)
+        self.assertEqual(self.step(0.5, 5), 0.008)
+        self.assertEqual(self.step(1, 5), 0.016)
+        self.assertEqual(self.step(1, 5), 0.032)
+        self.assertEqual(self.step(1, 5), 0.032)
+
+    def test_change_returns_to_the_fastest_rate(self):
+        self.step(0, 5)
+        self.step(1, 5)
+        self.step(1, 5)
+        self.assertEqual(self.step(0.1, 6), 0.004)
+        self.assertEqual(self.step(0.5, 6), 0.004)
+
+
+class ApproachTest(unittest.TestCase):
+    def setUp(self):
+        self.trusted = [True]
+        self.sensor = Sensor('battery', None, 60, min_interval=5, max_interval=60)
+        self.policy = Approach(340, 40, jitter=10, trusted=lambda: self.trusted[0])
+
+    def test_interval_shrinks_towards_the_threshold(self):
+        self.assertEqual(self.policy(self.sensor, 400), 60)
+        self.assertEqual(self.policy(self.sensor, 395), 60)
+        self.assertEqual(self.policy(self.sensor, 390), 60)
+        self.assertEqual(self.policy(self.sensor, 385), 60)
+        self.assertEqual(self.policy(self.sensor, 380), 60)
+        self.assertEqual(self.policy(self.sensor, 375), 5 + 55 * 35 / 40.0)
+        self.assertEqual(self.policy(self.sensor, 340), 5)
+
+    def test_jumps_and_untrusted_readings_poll_fast(self):
+        self.policy(self.sensor, 400)
+        self.assertEqual(self.policy(self.sensor, 380), 5)
+        self.trusted[0] = False
+        self.assertEqual(self.policy(self.sensor, 380), 5)
+        self.assertEqual(self.policy(self.sensor, None), 5)
+
+
+class PollSchedulerTest(unittest.TestCase):
+    def test_policy_interval_drives_the_timer(self):
+        now = [0]
+        loop = Reactor(clock=lambda: now[0])
+        readings = []
+        scheduler = PollScheduler(loop)
+        sensor = scheduler.add(Sensor('stick', lambda: readings.append(now[0]) or 5, 0.004, max_interval=0.032,
+                                      policy=Backoff(0.01, clock=lambda: now[0])))
+        for ms in range(0, 200, 2):
+            now[0] = ms * 1000000
+            loop.run_timers(now[0])
+        self.assertEqual(sensor.interval, 0.032)
+        self.assertEqual(sensor.timer.interval, 32000000)
+        self.assertLess(len(readings), 200 // 4)
+
+    def test_idle_slows_down_and_waking_polls_at_once(self):
+        loop = Reactor(clock=lambda: 0)
+        scheduler = PollScheduler(loop)
+        sensor = scheduler.add(Sensor('wifi', lambda: 1, 5, max_interval=30, idle_interval=60))
+        scheduler.set_idle(True)
+        self.assertEqual(sensor.interval, 60)
+        scheduler.set_idle(False)
+        self.assertEqual(sensor.interval, 5)
+        self.assertEqual(loop.next_deadline(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#
+# The simulated hardware (oneforall.sim) the monitor runs on with --simulate.
+#
+import unittest
+
+from oneforall import evcodes as ev
+from oneforall.osdproto import F_WIFI, FrameEncoder
+from oneforall.reactor import Reactor
+from oneforall.sim import SimADC, SimInputDevice, SimOSD, SimPins, SimShell
+
+
+class SimPinsTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = Reactor()
+        self.pins = SimPins([5, 6])
+        self.batches = []
+        self.pins.attach(self.loop, self.batches.append)
+
+    def test_edges_arrive_in_one_batch_on_the_loop(self):
+        self.pins.press(5, 1000)
+        self.pins.release(5, 2000)
+        self.pins.press(6, 3000)
+        self.assertEqual(self.batches, [])
+        self.loop.run_once()
+        self.assertEqual([(e.pin, e.level, e.timestamp_ns) for e in self.batches[0]],
+                         [(5, 0, 1000), (5, 1, 2000), (6, 0, 3000)])
+        self.assertEqual((self.pins.read(5), self.pins.read(6), self.pins.edges), (1, 0, 3))
+
+    def test_bounce_settles_on_the_level(self):
+        self.pins.bounce(5, 0, count=2)
+        self.loop.run_once()
+        self.assertEqual([e.level for e in self.batches[0]], [0, 1, 0, 1, 0])
+        self.assertEqual(self.pins.read(5), 0)
+
+    def test_unknown_pin(self):
+        self.assertRaises(KeyError, self.pins.press, 7)
+
+
+class SimDevicesTest(unittest.TestCase):
+    def test_input_device_frame_per_syn(self):
+        device = SimInputDevice([ev.BTN_A, ev.BTN_B])
+        device.emit(ev.BTN_A, 1, syn=False)
+        device.emit(ev.BTN_B, 1)
+        device.emit(ev.BTN_A, 0)
+        self.assertEqual([frame.events for frame in device.frames],
+                         [[(1, 0x130, 1), (1, 0x131, 1)], [(1, 0x130, 0)]])
+        self.assertEqual(device.state[ev.BTN_A], 0)
+
+    def test_osd_decodes_frames_and_wakes(self):
+        osd = SimOSD()
+        encoder = FrameEncoder()
+        osd.write(bytes(encoder.encode(show=True, wifi=3)) + b'\n' + bytes(encoder.encode(mask=F_WIFI, wifi=1)))
+        self.assertEqual((osd.writes, osd.frames, osd.wakes), (1, 2, 1))
+        self.assertEqual((osd.state['show'], osd.state['wifi']), (True, 1))
+        self.assertRaises(ValueError, osd.write, b'hello')
+
+    def test_adc_returns_fed_readings_first(self):
+        adc = SimADC({1: 100})
+        adc.feed(1, 5)
+        adc.feed(1, 6)
+        self.assertEqual([adc.read_adc(1) for i in range(3)], [5, 6, 6])
+        adc.set_volts(0, 2.048)
+        self.assertEqual(adc.read_adc(0), 1023)
+
+    def test_shell_records_commands(self):
+        shell = SimShell({'hcitool dev': 'hci0'})
+        self.assertEqual(shell.output(['hcitool', 'dev']), 'hci0')
+        shell.call(['sudo', 'rfkill', 'block', 'wifi'])
+        self.assertEqual(shell.commands, ['hcitool dev', 'sudo rfkill block wifi'])
+
+
+if __name__ == '__main__':
+    unittest.main()
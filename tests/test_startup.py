@@ -0,0 +1,79 @@
+#
+# Staged startup: probes land on the loop, a failed probe still ends its
+# step, and when_ready() waits for every step.
+#
+import threading
+import unittest
+
+from oneforall.reactor import Reactor
+from oneforall.startup import Startup
+
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = Reactor()
+        self.startup = Startup(self.loop)
+        self.events = []
+
+    # Run loop passes until the ready callback ran
+    def run_until_ready(self):
+        self.startup.when_ready(self.events.append, 'ready')
+        for _ in range(100):
+            if 'ready' in self.events:
+                return
+            self.loop.call_later(0.05, lambda: None)
+            self.loop.run_once()
+        self.fail('startup never completed: {}'.format(self.events))
+
+    def test_failed_probe_ends_its_step_without_a_result(self):
+        release = threading.Event()
+
+        def slow():
+            release.wait(5)
+            return 3
+
+        def broken():
+            release.set()
+            raise IOError('no adapter')
+
+        self.startup.probe('wifi', slow, lambda value: self.events.append(('wifi', value)))
+        self.startup.probe('bluetooth', broken, lambda value: self.events.append(('bluetooth', value)))
+        self.assertTrue(self.startup.pending('wifi'))
+        self.run_until_ready()
+        self.assertEqual(self.events, [('wifi', 3), 'ready'])
+        self.assertFalse(self.startup.pending('bluetooth'))
+        self.assertEqual(sorted(name for name, ns in self.startup.steps), ['bluetooth', 'wifi'])
+
+    def test_failing_result_handler_still_ends_the_step(self):
+        def on_result(value):
+            self.events.append(value)
+            raise ValueError(value)
+
+        self.startup.probe('wifi', lambda: 1, on_result)
+        self.run_until_ready()
+        self.assertEqual(self.events, [1, 'ready'])
+
+    def test_ready_waits_for_every_step(self):
+        self.startup.begin('osd')
+        self.startup.probe('wifi', lambda: 2, lambda value: self.events.append(value))
+        self.startup.when_ready(self.events.append, 'ready')
+        for _ in range(100):
+            if self.events:
+                break
+            self.loop.call_later(0.05, lambda: None)
+            self.loop.run_once()
+        self.loop.run_once()
+        self.assertEqual(self.events, [2])
+        self.startup.end('osd')
+        self.loop.run_once()
+        self.assertEqual(self.events, [2, 'ready'])
+        self.assertIsNotNone(self.startup.ready_ns)
+
+    def test_ready_right_away_without_steps(self):
+        self.startup.phase('gpio')
+        self.run_until_ready()
+        self.assertEqual(self.startup.steps[0][0], 'gpio')
+
+
+if __name__ == '__main__':
+    unittest.main()
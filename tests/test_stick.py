@@ -0,0 +1,74 @@
+#
+# Joystick processing: One-Euro filter response and axis output bounds.
+#
+import unittest
+
+from oneforall.stick import LUT_STEPS, AxisProcessor, OneEuroFilter, build_lut
+
+VCC = 1650
+DZONE = 100
+MS = 1000000
+
+
+class OneEuroFilterTest(unittest.TestCase):
+    def test_first_sample_passes_through(self):
+        self.assertEqual(OneEuroFilter()(5.0, 0.0), 5.0)
+
+    def test_jitter_at_rest_is_smoothed(self):
+        f = OneEuroFilter(min_cutoff=1.0, beta=0.0)
+        f(100.0, 0.0)
+        out = [f(100.0 + (5 if i % 2 else -5), i * 0.004) for i in range(1, 50)]
+        self.assertTrue(all(abs(x - 100.0) < 1.0 for x in out))
+
+    def test_fast_movement_follows_with_little_lag(self):
+        slow = OneEuroFilter(min_cutoff=1.0, beta=0.0)
+        fast = OneEuroFilter(min_cutoff=1.0, beta=0.05)
+        for f in (slow, fast):
+            f(0.0, 0.0)
+        for i in range(1, 6):
+            a, b = slow(1000.0, i * 0.004), fast(1000.0, i * 0.004)
+        self.assertLess(a, 200)
+        self.assertGreater(b, 900)
+
+    def test_time_going_backwards_is_ignored(self):
+        f = OneEuroFilter()
+        f(1.0, 1.0)
+        self.assertEqual(f(50.0, 0.5), 1.0)
+
+
+class AxisProcessorTest(unittest.TestCase):
+    def test_lut_shape(self):
+        lut = build_lut(0.1, 1.0, 0, VCC)
+        self.assertEqual(len(lut), LUT_STEPS + 1)
+        self.assertEqual(lut[int(0.1 * LUT_STEPS)], 0)
+        self.assertEqual(lut[-1], VCC // 2)
+        self.assertEqual(lut, sorted(lut))
+
+    def test_rest_reads_center(self):
+        axis = AxisProcessor(VCC, DZONE)
+        for i in range(20):
+            self.assertEqual(axis.process(820 + (i % 3), i * 4 * MS), VCC // 2)
+
+    def test_output_stays_in_range(self):
+        axis = AxisProcessor(VCC, DZONE, beta=1.0)
+        axis.process(VCC / 2, 0)
+        seen = set()
+        t = 0
+        for raw in [0, VCC, -500, 3 * VCC, VCC / 2] * 10:
+            t += 4 * MS
+            out = axis.process(raw, t)
+            self.assertTrue(0 <= out <= VCC, out)
+            seen.add(out)
+        self.assertIn(0, seen)
+        self.assertIn(VCC, seen)
+
+    def test_invert(self):
+        axis = AxisProcessor(VCC, DZONE, beta=1.0, invert=True)
+        axis.process(VCC / 2, 0)
+        for i in range(1, 30):
+            out = axis.process(VCC, i * 4 * MS)
+        self.assertEqual(out, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
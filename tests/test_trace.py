@@ -0,0 +1,78 @@
+#
+# Binary traces: what the recording wrappers write is what read_trace gives
+# back, and recorded pin reads answer a replay's settle reads.
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+from oneforall.sim import SimADC, SimPins
+from oneforall.trace import (KIND_ADC, KIND_EDGE, KIND_READ, Record, RecordedReads, RecordingADC, RecordingPins,
+                             TraceRecorder, read_trace)
+
+
+class InexactPins(SimPins):
+    exact = False
+
+
+class TraceTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'trace.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        recorder = TraceRecorder(self.path)
+        recorder.edge(5, 0, 1000)
+        recorder.adc(1, -20, 900)
+        recorder.read(5, 1, 5 * 10 ** 9)
+        recorder.edge(6, 1, 5 * 10 ** 9 + 7)
+        recorder.close()
+        self.assertEqual(read_trace(self.path), [
+            Record(KIND_EDGE, 1000, 5, 0),
+            Record(KIND_ADC, 900, 1, -20),
+            Record(KIND_READ, 5 * 10 ** 9, 5, 1),
+            Record(KIND_EDGE, 5 * 10 ** 9 + 7, 6, 1)])
+
+    def test_sessions_append_and_a_cut_record_is_dropped(self):
+        for base in (100, 200):
+            recorder = TraceRecorder(self.path)
+            recorder.edge(5, 0, base)
+            recorder.close()
+        with open(self.path, 'ab') as f:
+            f.write(b'\x01\x05')
+        self.assertEqual([r.timestamp_ns for r in read_trace(self.path)], [100, 200])
+
+    def test_recording_wrappers(self):
+        recorder = TraceRecorder(self.path)
+        adc = SimADC()
+        adc.set(0, 1234)
+        RecordingADC(adc, recorder).read_adc(0)
+        pins = RecordingPins(SimPins([5]), recorder)
+        pins.read(5)
+        inexact = RecordingPins(InexactPins([5]), recorder)
+        inexact.read(5)
+        recorder.close()
+        self.assertEqual([(r.kind, r.source, r.value) for r in read_trace(self.path)],
+                         [(KIND_ADC, 0, 1234), (KIND_READ, 5, 1)])
+
+
+class RecordedReadsTest(unittest.TestCase):
+    def test_reads_answered_from_the_first_record_at_or_after_now(self):
+        now = [0]
+        records = [Record(KIND_READ, 10, 5, 0), Record(KIND_EDGE, 15, 5, 1), Record(KIND_READ, 30, 5, 1),
+                   Record(KIND_READ, 40, 5, 0)]
+        reads = RecordedReads(records, lambda: now[0], lambda pin: 'live')
+        self.assertEqual(reads.count, 3)
+        now[0] = 25
+        self.assertEqual(reads.read(5), 1)
+        self.assertEqual(reads.read(5), 0)
+        self.assertEqual(reads.read(5), 'live')
+        self.assertEqual(reads.read(6), 'live')
+
+
+if __name__ == '__main__':
+    unittest.main()
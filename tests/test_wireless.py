@@ -0,0 +1,78 @@
+#
+# /proc/net/wireless parsing against captured files in fixtures/wireless.
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+from oneforall.wireless import WirelessStatus, parse_strength
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'wireless')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name + '.txt'), 'rb') as f:
+        return bytearray(f.read())
+
+
+class ParseStrengthTest(unittest.TestCase):
+    def test_no_interface(self):
+        self.assertIsNone(parse_strength(fixture('no_interface'), 'wlan0'))
+
+    def test_interface_down(self):
+        self.assertEqual(parse_strength(fixture('interface_down'), 'wlan0'), 0)
+
+    def test_link_quality(self):
+        self.assertEqual(parse_strength(fixture('normal'), 'wlan0'), 54)
+
+    def test_name_must_start_the_column(self):
+        data = fixture('normal')
+        self.assertEqual(parse_strength(data, 'p2p-wlan0'), 70)
+        self.assertIsNone(parse_strength(data, 'lan0'))
+
+    def test_level_without_link_quality(self):
+        self.assertEqual(parse_strength(fixture('level_only'), 'wlan0'), 61)
+
+    def test_length_limits_the_search(self):
+        data = fixture('normal')
+        self.assertIsNone(parse_strength(data, 'wlan0', data.find(b' wlan0:')))
+
+
+class WirelessStatusTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'wireless')
+        self.use('normal')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    # Rewrites the file in place, as the kernel does, for the open handle
+    def use(self, name):
+        with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+            f.write(fixture(name))
+            f.truncate()
+
+    def test_best_interface_wins(self):
+        status = WirelessStatus(['wlan0', 'p2p-wlan0'], path=self.path)
+        self.assertEqual(status.strength(), 70)
+
+    def test_cached_until_invalidated(self):
+        status = WirelessStatus(['wlan0'], ttl=60, path=self.path)
+        self.assertEqual(status.strength(), 54)
+        self.use('level_only')
+        self.assertEqual(status.strength(), 54)
+        self.assertEqual(status.reads, 1)
+        status.invalidate()
+        self.assertEqual(status.strength(), 61)
+        self.assertEqual(status.reads, 2)
+        status.close()
+
+    def test_missing_file(self):
+        status = WirelessStatus(['wlan0'], path=os.path.join(self.dir, 'missing'))
+        self.assertIsNone(status.strength())
+
+
+if __name__ == '__main__':
+    unittest.main()